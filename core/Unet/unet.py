@@ -1,66 +1,71 @@
+import os
+
 import cv2
 import numpy as np
 import pytorch_lightning as pl
 import torch
-import configparser
 from PIL import Image
 
 from monai.networks.nets import UNet
 import monai.transforms as mt
 from monai.networks.layers import Norm, Act
 
+from core.usefull.model_cache import cache_key, artifact_path, load_or_build, warm_up
+from core.usefull.quantization import check_quantize_mode, bf16_supported, bf16_autocast
+
+
+def build_unet():
+    """
+    Builds the MONAI UNet used for the lesion segmentation, without weights.
+    """
+    return UNet(
+        spatial_dims=2,
+        in_channels=1,
+        out_channels=2,
+        channels=(32, 64, 128, 256, 512, 1024, 1024),
+        strides=(2, 2, 2, 2, 2, 2),
+        num_res_units=3,
+        norm=Norm.INSTANCE_NVFUSER,
+        act=Act.SOFTMAX
+    )
+
+
+def static_int8_path(cache_dir, imgsz):
+    """
+    Path of the static int8 Unet built by the calibration script (core/benchmark/quantization.py)
+    for the current weights and input size.
+    """
+    key = cache_key(cache_dir, ["model/Unet.pt"], ["torch", "monai"], extra=("int8", list(imgsz)))
+    return artifact_path(cache_dir, "unet-int8", key, ".pt")
+
+
 class Unet(pl.LightningModule):
     """
     Implementation of the Unet model for object detection.
     """
 
-    def __init__(self, logger):
+    def __init__(self, logger, cache_dir=None, imgsz=(512, 1024), warmup=True, quantize=None):
         """
         Initializes the Unet model.
 
         Args:
             logger (logging.Logger): Logger object.
+            cache_dir (str, optional): If set, the model is traced once to a frozen, inference-optimized
+                TorchScript module in this directory.
+            imgsz (tuple): The (height, width) of the images given to the model.
+            warmup (bool): If True, a dummy inference is run once the model is loaded.
+            quantize (str, optional): "int8" to load the static int8 model produced by the calibration script,
+                "bf16" to run the convolutions in bfloat16. Defaults to float32.
         """
         super().__init__()
-        self.model = UNet(
-            spatial_dims=2,
-            in_channels=1,
-            out_channels=2,
-            channels=(32, 64, 128, 256, 512, 1024, 1024),
-            strides=(2, 2, 2, 2, 2, 2),
-            num_res_units=3,
-            norm=Norm.INSTANCE_NVFUSER,
-            act=Act.SOFTMAX
-        )
-        self.model.load_state_dict(torch.load("model/Unet.pt"), strict=False)
-        logger.info("Loaded Unet model")
-
-    def process_image(self, img_pil, model=None):
-        """
-        Perform image segmentation prediction using a given model.
-
-        Args:
-            img_pil (PIL.Image.Image): The input image in PIL format.
-            seg_pil (PIL.Image.Image, optional): The ground truth segmentation mask in PIL format. Defaults to None.
-            model (torch.nn.Module, optional): The segmentation model. Defaults to the global model.
-            img_id (str, optional): The ID of the image. Defaults to "0".
-
-        Returns:
-            None
-        """
-        global overlay
-        
-        config = configparser.ConfigParser()
-        config.read('config.ini')
-
-        transforms = mt.compose.Compose(
+        self.transforms = mt.compose.Compose(
             [
                 mt.NormalizeIntensity(
                     nonzero=True,
                     channel_wise=True
                 ),
                 mt.Resize(
-                    spatial_size=(int(config["DEFAULT"]["image_height"]), int(config["DEFAULT"]["image_width"])),
+                    spatial_size=tuple(imgsz),
                     mode="bilinear"
                 ),
                 mt.ToTensor(
@@ -68,36 +73,90 @@ class Unet(pl.LightningModule):
                 )
             ]
         )
+        self.quantize = check_quantize_mode(quantize)
+        if self.quantize == "bf16" and not bf16_supported():
+            logger.warning("The CPU does not support bfloat16, Unet runs in float32")
+            self.quantize = None
+
+        self.model = None
+        if self.quantize == "int8":
+            int8_path = static_int8_path(cache_dir or "model/cache", imgsz)
+            if os.path.exists(int8_path):
+                self.model = torch.jit.load(int8_path, map_location="cpu")
+            else:
+                logger.warning(f"No calibrated int8 Unet ({int8_path}), run python -m core.benchmark.quantization --model unet --samples <folder>. Unet runs in float32")
+                self.quantize = None
+
+        if self.model is None and cache_dir is None:
+            self.model = self._load_uncached()
+        elif self.model is None:
+            key = cache_key(cache_dir, ["model/Unet.pt"], ["torch", "monai"], extra=("torchscript", list(imgsz), self.quantize))
+            self.model = load_or_build(
+                artifact_path(cache_dir, "unet", key, ".pt"),
+                lambda path: self._trace(path, imgsz, logger),
+                lambda path: torch.jit.load(path, map_location="cpu"),
+                logger,
+                fallback=self._load_uncached,
+            )
+        logger.info(f"Loaded Unet model ({self.quantize or 'float32'})")
+        if warmup:
+            warm_up(lambda: self._dummy_forward(imgsz), logger, "Unet")
+
+    def _dummy_forward(self, imgsz):
+        with torch.no_grad(), bf16_autocast(self.quantize == "bf16"):
+            self.model(torch.zeros((1, 1, *imgsz)))
+
+    def _load_uncached(self):
+        model = build_unet()
+        model.load_state_dict(torch.load("model/Unet.pt"), strict=False)
+        model.eval()
+        return model
+
+    def _trace(self, path, imgsz, logger):
+        model = self._load_uncached()
+        with torch.no_grad(), bf16_autocast(self.quantize == "bf16"):
+            traced = torch.jit.trace(model, torch.zeros((1, 1, *imgsz)))
+            traced = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+        torch.jit.save(traced, path)
+
+    def preprocess(self, img_pil):
+        """
+        Normalizes and resizes an image to the input tensor of the model.
+
+        Args:
+            img_pil (PIL.Image.Image): The input image in PIL format.
 
+        Returns:
+            torch.Tensor: The (1, 1, height, width) input tensor.
+        """
         img = np.asarray(img_pil, dtype=np.float32)
         img = np.expand_dims(img, axis=0)
-        img_preproc = transforms(img)
-        pred = model(img_preproc.unsqueeze(0))
-        # Create a binary mask from the predicted segmentation
-        pred = pred.argmax(dim=1).float()
-        pred = pred.squeeze(0)
-        pred = pred.squeeze(0)
-        pred = pred.cpu().detach().numpy()
-        pred = (pred * 255).astype(np.uint8)
-
-        return pred
+        return self.transforms(img).unsqueeze(0)
 
-    def predict(self, image_path, logger=None, conf=0.5, imgsz=800):
+    def process_image(self, img_pil, model=None):
         """
-        Process the image and find bounding boxes.
+        Perform image segmentation prediction using a given model.
 
         Args:
-            image_path (str): Path to the image.
+            img_pil (PIL.Image.Image): The input image in PIL format.
+            model (torch.nn.Module, optional): The segmentation model. Defaults to the loaded model.
 
         Returns:
-            list: List of bounding boxes.
+            numpy.ndarray: The binary mask, 255 on the lesions.
         """
-        logger.info("Processing image with Unet: %s", image_path)
+        model = self.model if model is None else model
+        with torch.no_grad(), bf16_autocast(self.quantize == "bf16"):
+            pred = model(self.preprocess(img_pil))
+        # Create a binary mask from the predicted segmentation
+        pred = pred.float().argmax(dim=1).float()
+        pred = pred.squeeze(0)
+        pred = pred.squeeze(0)
+        pred = pred.cpu().detach().numpy()
+        pred = (pred * 255).astype(np.uint8)
 
-        # Get the image and the ground truth
-        img = Image.open(image_path).convert("L")
-        prediction_image = self.process_image(img, self.model)
-        logger.info("Predicted mask for %s", image_path)
+        return pred
+
+    def _mask_to_boxes(self, prediction_image, logger):
         _, binary_image = cv2.threshold(prediction_image, 127, 255, cv2.THRESH_BINARY)
 
         # Find contours
@@ -118,3 +177,37 @@ class Unet(pl.LightningModule):
 
         return bounding_boxes
 
+    def predict(self, image_path, logger=None, conf=0.5, imgsz=800):
+        """
+        Process the image and find bounding boxes.
+
+        Args:
+            image_path (str): Path to the image.
+
+        Returns:
+            list: List of bounding boxes.
+        """
+        logger.info("Processing image with Unet: %s", image_path)
+
+        # Get the image and the ground truth
+        img = Image.open(image_path).convert("L")
+        prediction_image = self.process_image(img, self.model)
+        logger.info("Predicted mask for %s", image_path)
+        return self._mask_to_boxes(prediction_image, logger)
+
+    def predict_batch(self, images, conf=0.5, logger=None):
+        """
+        Segments several in-memory images in one forward pass and finds their bounding boxes.
+
+        Args:
+            images (list): The grayscale images returned by Dicom_to_array.
+
+        Returns:
+            list: The list of bounding boxes of each image.
+        """
+        batch = torch.cat([self.preprocess(image) for image in images])
+        with torch.no_grad(), bf16_autocast(self.quantize == "bf16"):
+            pred = self.model(batch)
+        masks = (pred.float().argmax(dim=1).cpu().numpy() * 255).astype(np.uint8)
+        logger.info("Predicted masks for a batch of %d images", len(images))
+        return [self._mask_to_boxes(mask, logger) for mask in masks]
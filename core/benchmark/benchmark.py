@@ -1,33 +1,36 @@
-import logging
 import configparser
 import os
 import time
 
+import cv2
+
 from core.yolo.yolo import yolo_model
 
-from core.usefull.script import clear_tmp_files, check_directory, show_results_popup
+from core.usefull.debug import DebugWriter
+from core.usefull.script import clear_tmp_files, check_directory
 from core.convertion.convert import Dicom_to_png
 from core.dicom.bbox_to_gsps import create_gsps
 from core.dicom.push_dicom import send_dicom_to_pacs
+from core.usefull.logs import setup_logging
 
 
-logging.basicConfig(filename='log/logfile_'+ str(len(os.listdir("log"))+1) + '.log', level=logging.INFO, format='%(asctime)s %(message)s')
-logger = logging.getLogger(__name__)
-
 if __name__ == '__main__':
-    check_directory("input",logger,create=False)
-    check_directory("tmp",logger)
-    
     #read config file
     config = configparser.ConfigParser()
     config.read('config.ini')
     
-    # add console handler if debug mode is enabled
-    if config["DEFAULT"]["debug_mode"] == "True":
+    debug_mode = config["DEFAULT"].getboolean("debug_mode")
+    logger, log_listener = setup_logging(config, name="benchmark", console=debug_mode)
+    debug_writer = None
+    if debug_mode:
         logger.info("Debug mode enabled")
-        console = logging.StreamHandler()
-        console.setLevel(logging.INFO)
-        logger.addHandler(console)
+        # the overlays are written in the background, a popup would stop the timings
+        debug_writer = DebugWriter(config.get("DEBUG", "directory", fallback="output/debug"), logger,
+                                   queue_size=config.getint("DEBUG", "queue_size", fallback=8))
+        debug_writer.start()
+    
+    check_directory("input",logger,create=False)
+    check_directory("tmp",logger)
         
     if config["DEFAULT"]["model"] == "yolo":
         model = yolo_model(logger)
@@ -68,31 +71,27 @@ if __name__ == '__main__':
                 list_rectangle.append([x,y,w,h])
             
             start_time = time.time()
-            gsps_dataset_confidence = create_gsps("tmp/"+file,"output/"+file.replace(".dcm","_confidence.dcm"),list_rectangle,[box["conf"] for box in bboxes],logger)
-            logger.info(f"Created GSPS with confidence shown for {file}")
+            if config["GSPS"]["mode"] == "split":
+                gsps_dataset_confidence = create_gsps("tmp/"+file,"output/"+file.replace(".dcm","_confidence.dcm"),list_rectangle,[box["conf"] for box in bboxes],logger)
+                logger.info(f"Created GSPS with confidence shown for {file}")
+                gsps_dataset_no_confidence = create_gsps("tmp/"+file,"output/"+file.replace(".dcm","_no_confidence.dcm"),list_rectangle,[box["conf"] for box in bboxes],logger,show_confidence=False)
+                logger.info(f"Created GSPS without confidence shown for {file}")
+                gsps_datasets = [gsps_dataset_confidence, gsps_dataset_no_confidence]
+            else:
+                gsps_dataset = create_gsps("tmp/"+file,"output/"+file.replace(".dcm","_gsps.dcm"),list_rectangle,[box["conf"] for box in bboxes],logger,separate_layers=True)
+                logger.info(f"Created GSPS with the confidence on a separate layer for {file}")
+                gsps_datasets = [gsps_dataset]
             gsps_creation_time = time.time() - start_time
             
-            start_time = time.time()
-            gsps_dataset_no_confidence = create_gsps("tmp/"+file,"output/"+file.replace(".dcm","_no_confidence.dcm"),list_rectangle,[box["conf"] for box in bboxes],logger,show_confidence=False)
-            logger.info(f"Created GSPS without confidence shown for {file}")
-            gsps_creation_time += time.time() - start_time
-            
-            if config["DEFAULT"]["debug_mode"] == "True":
-                start_time = time.time()
-                show_results_popup(bboxes)
-                logger.info(f"Displayed results for {file}")
-                popup_display_time = time.time() - start_time
+            if debug_writer is not None:
+                debug_writer.submit(cv2.imread("tmp/tmp.png", cv2.IMREAD_GRAYSCALE), bboxes, file)
             
             start_time = time.time()
-            status = send_dicom_to_pacs(gsps_dataset_confidence,config["DEFAULT"]["pacs_ip"],int(config["DEFAULT"]["pacs_port"]),config["DEFAULT"]["aetitle"],config["DEFAULT"]["pacs_aetitle"],logger)
-            logger.info(f"Done sending GSPS with confidence shown for {file}") if status else None
+            for gsps_dataset in gsps_datasets:
+                status = send_dicom_to_pacs(gsps_dataset,config["DEFAULT"]["pacs_ip"],int(config["DEFAULT"]["pacs_port"]),config["DEFAULT"]["aetitle"],config["DEFAULT"]["pacs_aetitle"],logger)
+                logger.info(f"Done sending GSPS {gsps_dataset.SOPInstanceUID} for {file}") if status else None
             gsps_sending_time = time.time() - start_time
             
-            start_time = time.time()
-            status = send_dicom_to_pacs(gsps_dataset_no_confidence,config["DEFAULT"]["pacs_ip"],int(config["DEFAULT"]["pacs_port"]),config["DEFAULT"]["aetitle"],config["DEFAULT"]["pacs_aetitle"],logger)
-            logger.info(f"Done sending GSPS without confidence shown for {file}") if status else None
-            gsps_sending_time += time.time() - start_time
-            
             counter += 1
             stats[file] = {"nb_bboxes":len(bboxes),"size":os.path.getsize("tmp/"+file),"position":counter}
             
@@ -112,16 +111,14 @@ if __name__ == '__main__':
             gsps_creation_time_dict[file] = gsps_creation_time
             gsps_sending_time_dict[file] = gsps_sending_time
             tmp_files_clearing_time_dict[file] = tmp_files_clearing_time
-            
-            #clear the log file to not influence the next benchmark by removing all the lines 
-            with open('log/logfile_'+ str(len(os.listdir("log"))) + '.log', 'w') as f:
-                f.write("")
                 
             
         except Exception as e:
             clear_tmp_files(logger)
             logger.warning("Failed to process file {}: {}".format(file, str(e)))
     
+    if debug_writer is not None:
+        debug_writer.stop()
     logger.info("Benchmark completed")
     # save the data in a csv file
     with open('benchmark.csv', 'w') as f:
@@ -0,0 +1,60 @@
+import argparse
+import configparser
+import logging
+import os
+import tempfile
+import time
+
+from core.usefull.logs import setup_logging, set_log_context, stop_logging
+
+
+def time_calls(logger, n):
+    """
+    Measures the average cost of a logger call as seen by the calling thread.
+
+    Args:
+        logger (logging.Logger): The logger to measure.
+        n (int): The number of calls.
+
+    Returns:
+        tuple: The average time per call in microseconds for an info and a per-box debug call.
+    """
+    start_time = time.perf_counter()
+    for i in range(n):
+        logger.info(f"Converted DICOM file {i}.dcm to PNG")
+    info_time = (time.perf_counter() - start_time) / n * 1e6
+
+    start_time = time.perf_counter()
+    for i in range(n):
+        logger.debug(f"Bounding box: conf={0.5}, x={i}, y={i}, w={10}, h={10}")
+    debug_time = (time.perf_counter() - start_time) / n * 1e6
+    return info_time, debug_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the hot-path cost of the synchronous and the queue-based logger")
+    parser.add_argument("-n", type=int, default=20000, help="number of calls per measure")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # before: synchronous file handler as configured by logging.basicConfig
+        sync_logger = logging.getLogger("sync")
+        sync_handler = logging.FileHandler(os.path.join(directory, "sync.log"))
+        sync_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        sync_logger.addHandler(sync_handler)
+        sync_logger.setLevel(logging.INFO)
+        sync_logger.propagate = False
+        info_time, debug_time = time_calls(sync_logger, args.n)
+        sync_handler.close()
+        print(f"synchronous file handler: info {info_time:.2f} us/call, per-box {debug_time:.2f} us/call")
+
+        # after: queue handler, JSON formatting and rotation in the background listener
+        config = configparser.ConfigParser()
+        config.read_dict({"LOG": {"directory": directory, "level": "INFO"}})
+        queue_logger, listener = setup_logging(config, name="queued")
+        set_log_context(file="0.dcm", stage="convert")
+        info_time, debug_time = time_calls(queue_logger, args.n)
+        start_time = time.perf_counter()
+        stop_logging(listener)
+        drain_time = time.perf_counter() - start_time
+        print(f"queue handler: info {info_time:.2f} us/call, per-box {debug_time:.2f} us/call (background drain {drain_time:.3f} s)")
@@ -0,0 +1,242 @@
+import argparse
+import csv
+import datetime
+import logging
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import generate_uid, ExplicitVRLittleEndian
+from pynetdicom import AE, evt, AllStoragePresentationContexts
+
+from core.convertion.convert import Dicom_to_Image, Dicom_to_Image_banded, Dicom_frames_to_arrays, resize_image, bilinear_resize_vectorized
+from core.dicom.bbox_to_gsps import create_gsps
+from core.dicom.push_dicom import send_dicom_to_pacs
+
+HISTORY_FILE = "core/benchmark/micro_history.csv"
+HISTORY_FIELDS = ["commit", "date", "function", "case", "repeat", "median_s", "min_s", "peak_kb"]
+
+
+def make_dicom(path, rows, cols, bits, seed=0, frames=1):
+    """
+    Writes a synthetic panoramic DICOM with a fixed random content.
+
+    Args:
+        path (str): Where to write the file.
+        rows (int): The number of rows.
+        cols (int): The number of columns.
+        bits (int): 8 or 16 bits per pixel.
+        seed (int): The seed of the pixel values.
+        frames (int): The number of frames.
+
+    Returns:
+        str: The path of the file.
+    """
+    dataset = Dataset()
+    dataset.file_meta = FileMetaDataset()
+    dataset.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    dataset.SOPClassUID = "1.2.840.10008.5.1.4.1.1.1.1"  # Digital X-Ray Image Storage - For Presentation
+    dataset.SOPInstanceUID = generate_uid()
+    dataset.file_meta.MediaStorageSOPClassUID = dataset.SOPClassUID
+    dataset.file_meta.MediaStorageSOPInstanceUID = dataset.SOPInstanceUID
+    dataset.Modality = "PX"
+    dataset.PatientName = "MICRO^BENCHMARK"
+    dataset.PatientID = "0"
+    dataset.PatientAge = "040Y"
+    dataset.PatientSex = "O"
+    dataset.StudyDate = "20240101"
+    dataset.StudyTime = "120000"
+    dataset.AccessionNumber = "0"
+    dataset.StudyDescription = "micro benchmark"
+    dataset.StudyInstanceUID = generate_uid()
+    dataset.StudyID = "0"
+    dataset.SeriesInstanceUID = generate_uid()
+    dataset.SeriesNumber = 1
+    dataset.InstanceNumber = 1
+    dataset.Rows = rows
+    dataset.Columns = cols
+    dataset.SamplesPerPixel = 1
+    dataset.PhotometricInterpretation = "MONOCHROME2"
+    dataset.BitsAllocated = bits
+    dataset.BitsStored = bits if bits == 8 else 12
+    dataset.HighBit = dataset.BitsStored - 1
+    dataset.PixelRepresentation = 0
+    if frames > 1:
+        dataset.NumberOfFrames = frames
+    dataset.WindowCenter = 128 if bits == 8 else 2048
+    dataset.WindowWidth = 200 if bits == 8 else 3000
+
+    rng = np.random.default_rng(seed)
+    high = 256 if bits == 8 else 4096
+    pixels = rng.integers(0, high, (frames, rows, cols) if frames > 1 else (rows, cols)).astype(np.uint8 if bits == 8 else np.uint16)
+    dataset.PixelData = pixels.tobytes()
+    dataset.is_little_endian = True
+    dataset.is_implicit_VR = False
+    dataset.save_as(path, write_like_original=False)
+    return path
+
+
+def measure(function, repeat):
+    """
+    Runs a function `repeat` times, then once more under tracemalloc for its peak allocation.
+
+    Args:
+        function (callable): The function to measure, without arguments.
+        repeat (int): The number of timed runs.
+
+    Returns:
+        dict: median_s, min_s and peak_kb.
+    """
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"median_s": statistics.median(times), "min_s": min(times), "peak_kb": peak / 1024}
+
+
+def start_loopback_scp(port):
+    """
+    Starts a Storage SCP on localhost accepting everything, standing in for the PACS.
+    """
+    ae = AE(ae_title="MICRO")
+    ae.supported_contexts = AllStoragePresentationContexts
+    return ae.start_server(("127.0.0.1", port), block=False, evt_handlers=[(evt.EVT_C_STORE, lambda event: 0x0000)])
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def run(sizes, bits_list, box_counts, budgets, repeat, slow_repeat, port, logger, frames=8):
+    """
+    Runs all the micro-benchmarks.
+
+    Returns:
+        list: One result dict per function and case.
+    """
+    results = []
+
+    def record(function_name, case, function, n):
+        result = measure(function, n)
+        result.update({"function": function_name, "case": case, "repeat": n})
+        results.append(result)
+        print(f"{function_name:28} {case:22} median {result['median_s']*1000:10.2f} ms  min {result['min_s']*1000:10.2f} ms  peak {result['peak_kb']:10.0f} KiB")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rows, cols in sizes:
+            for bits in bits_list:
+                case = f"{rows}x{cols}/{bits}bit"
+                path = make_dicom(os.path.join(directory, f"{rows}x{cols}_{bits}.dcm"), rows, cols, bits)
+
+                record("Dicom_to_Image", case, lambda: Dicom_to_Image(path, bits, logger), slow_repeat)
+
+                image, _ = Dicom_to_Image(path, bits, logger)
+                record("resize_image", case, lambda: resize_image(image, bits), slow_repeat)
+
+                cropped = resize_image(image, bits)
+                record("bilinear_resize_vectorized", case, lambda: bilinear_resize_vectorized(cropped, height=512, width=1024, uint=bits), repeat)
+
+                for budget in budgets:
+                    record("Dicom_to_Image_banded", f"{case}/{budget}MB", lambda: Dicom_to_Image_banded(path, logger, width=1024, height=512, uint=bits, memory_budget=budget * 1024 * 1024), repeat)
+
+        rows, cols = sizes[0]
+        if frames > 1:
+            # whole multi-frame file, divide by the number of frames for the cost per frame
+            path = make_dicom(os.path.join(directory, "multiframe.dcm"), rows, cols, 16, frames=frames)
+            record("Dicom_frames_to_arrays", f"{rows}x{cols}/{frames} frames", lambda: list(Dicom_frames_to_arrays(path, logger, width=1024, height=512, uint=8)), slow_repeat)
+
+        path = make_dicom(os.path.join(directory, "gsps_source.dcm"), rows, cols, 16)
+        rng = np.random.default_rng(0)
+        for count in box_counts:
+            rectangles = [[float(x), float(y), 80.0, 60.0] for x, y in zip(rng.uniform(0, cols - 80, count), rng.uniform(0, rows - 60, count))]
+            confidences = list(rng.uniform(0.5, 1.0, count))
+            record("create_gsps", f"{count} boxes", lambda: create_gsps(path, None, rectangles, confidences, logger, separate_layers=True), repeat)
+
+        server = start_loopback_scp(port)
+        try:
+            for count in box_counts:
+                rectangles = [[10.0 * i, 10.0 * i, 80.0, 60.0] for i in range(count)]
+                gsps_dataset = create_gsps(path, None, rectangles, [0.9] * count, logger, separate_layers=True)
+                record("send_dicom_to_pacs", f"{count} boxes", lambda: send_dicom_to_pacs(gsps_dataset, "127.0.0.1", port, "MICRO", "MICRO", logger), repeat)
+        finally:
+            server.shutdown()
+
+    return results
+
+
+def save_history(results, history_file):
+    """
+    Appends the results to the history and prints the change against the previous run of the same case.
+    """
+    previous = {}
+    if os.path.exists(history_file):
+        with open(history_file, newline="") as f:
+            for row in csv.DictReader(f):
+                previous[(row["function"], row["case"])] = row
+
+    commit = git_commit()
+    date = datetime.datetime.now().isoformat(timespec="seconds")
+    new_file = not os.path.exists(history_file)
+    with open(history_file, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=HISTORY_FIELDS)
+        if new_file:
+            writer.writeheader()
+        for result in results:
+            writer.writerow({
+                "commit": commit,
+                "date": date,
+                "function": result["function"],
+                "case": result["case"],
+                "repeat": result["repeat"],
+                "median_s": f"{result['median_s']:.6f}",
+                "min_s": f"{result['min_s']:.6f}",
+                "peak_kb": f"{result['peak_kb']:.1f}",
+            })
+            before = previous.get((result["function"], result["case"]))
+            if before is not None and float(before["median_s"]) > 0:
+                change = (result["median_s"] / float(before["median_s"]) - 1) * 100
+                flag = "  <-- slower" if change > 10 else ""
+                print(f"{result['function']:28} {result['case']:22} {change:+7.1f}% vs {before['commit']}{flag}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the conversion and GSPS hot paths on synthetic inputs")
+    parser.add_argument("--sizes", default="1024x2048,1500x3000", help="image sizes as ROWSxCOLS, comma separated (at least 1024x2048)")
+    parser.add_argument("--bits", default="8,16", help="bits per pixel of the synthetic images")
+    parser.add_argument("--boxes", default="0,1,5,10,25,50", help="number of boxes for create_gsps and send_dicom_to_pacs")
+    parser.add_argument("--budgets", default="4,64", help="memory budgets in MB of the banded conversion")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs of the fast functions")
+    parser.add_argument("--slow-repeat", type=int, default=3, help="timed runs of the per-pixel loops (Dicom_to_Image, resize_image)")
+    parser.add_argument("--frames", type=int, default=8, help="frames of the multi-frame image, 1 to skip it")
+    parser.add_argument("--port", type=int, default=11112, help="port of the loopback SCP")
+    parser.add_argument("--history", default=HISTORY_FILE, help="CSV file the results are appended to")
+    parser.add_argument("--no-history", action="store_true", help="do not write the results")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("micro")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    logging.getLogger("pynetdicom").setLevel(logging.ERROR)
+
+    sizes = [tuple(int(value) for value in size.split("x")) for size in args.sizes.split(",")]
+    bits_list = [int(bits) for bits in args.bits.split(",")]
+    box_counts = [int(count) for count in args.boxes.split(",")]
+    budgets = [int(budget) for budget in args.budgets.split(",")]
+
+    results = run(sizes, bits_list, box_counts, budgets, args.repeat, args.slow_repeat, args.port, logger, frames=args.frames)
+    if not args.no_history:
+        save_history(results, args.history)
@@ -0,0 +1,184 @@
+import argparse
+import configparser
+import copy
+import os
+import statistics
+import tempfile
+import time
+
+import cv2
+import torch
+from PIL import Image
+
+from core.convertion.convert import Dicom_to_array
+from core.usefull.logs import setup_logging
+from core.usefull.quantization import prepare_static_int8, convert_static_int8
+
+
+def convert_samples(samples, directory, config, logger, limit=None):
+    """
+    Converts the sample DICOM files to the PNG given to the models.
+
+    Args:
+        samples (str): The folder of sample DICOM files.
+        directory (str): Where the PNG are written.
+        config (configparser.ConfigParser): The configuration.
+        logger: The logger object for logging messages.
+        limit (int, optional): The maximum number of samples.
+
+    Returns:
+        list: The paths of the PNG.
+    """
+    paths = []
+    for file in sorted(os.listdir(samples))[:limit]:
+        image, _, _ = Dicom_to_array(os.path.join(samples, file), logger, width=int(config["DEFAULT"]["image_width"]), height=int(config["DEFAULT"]["image_height"]), uint=int(config["DEFAULT"]["uint"]))
+        if image is None:
+            continue
+        path = os.path.join(directory, os.path.splitext(file)[0] + ".png")
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+def calibrate_unet(images, cache_dir, imgsz, logger):
+    """
+    Builds the static int8 Unet: observers are run on the sample images, then the model is
+    converted, traced and saved where `Unet(quantize="int8")` loads it.
+
+    Args:
+        images (list): The paths of the calibration PNG.
+        cache_dir (str): The model cache directory.
+        imgsz (tuple): The (height, width) of the images given to the model.
+        logger: The logger object for logging messages.
+
+    Returns:
+        str: The path of the int8 model.
+    """
+    from core.Unet.unet import Unet, static_int8_path
+
+    unet = Unet(logger, imgsz=imgsz, warmup=False)
+    example = torch.zeros((1, 1, *imgsz))
+    # the float model is loaded once, the observers are inserted in a copy
+    prepared = prepare_static_int8(copy.deepcopy(unet.model), example)
+    with torch.no_grad():
+        for path in images:
+            prepared(unet.preprocess(Image.open(path).convert("L")))
+    quantized = convert_static_int8(prepared)
+
+    path = static_int8_path(cache_dir, imgsz)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(quantized, example))
+    torch.jit.save(traced, path)
+    logger.info(f"Calibrated int8 Unet on {len(images)} images, saved to {path}")
+    return path
+
+
+def load_model(name, logger, cache_dir, imgsz, quantize):
+    if name == "unet":
+        from core.Unet.unet import Unet
+        return Unet(logger, cache_dir=cache_dir, imgsz=imgsz, quantize=quantize)
+    from core.detr.detr import Detr
+    return Detr(logger, cache_dir=cache_dir, imgsz=imgsz, quantize=quantize)
+
+
+def iou(a, b):
+    x1, y1 = max(a["x"], b["x"]), max(a["y"], b["y"])
+    x2, y2 = min(a["x"] + a["w"], b["x"] + b["w"]), min(a["y"] + a["h"], b["y"] + b["h"])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    union = a["w"] * a["h"] + b["w"] * b["h"] - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def match_boxes(reference, candidate, threshold):
+    """
+    Greedily matches the candidate boxes to the reference boxes by decreasing IoU.
+
+    Returns:
+        list: The matched (reference, candidate) pairs.
+    """
+    pairs = sorted(((iou(r, c), i, j) for i, r in enumerate(reference) for j, c in enumerate(candidate)), reverse=True)
+    used_reference, used_candidate, matches = set(), set(), []
+    for value, i, j in pairs:
+        if value < threshold:
+            break
+        if i in used_reference or j in used_candidate:
+            continue
+        used_reference.add(i)
+        used_candidate.add(j)
+        matches.append((reference[i], candidate[j]))
+    return matches
+
+
+def timed_predict(model, path, conf, imgsz, logger):
+    start_time = time.perf_counter()
+    boxes = model.predict(path, conf=conf, imgsz=imgsz, logger=logger)
+    return boxes, time.perf_counter() - start_time
+
+
+def compare(images, reference_model, quantized_model, conf, imgsz, threshold, logger):
+    """
+    Runs both models on the sample images and compares the quantized boxes to the float32 ones.
+
+    Returns:
+        dict: recall and precision of the quantized boxes against the float32 boxes, mean confidence
+            difference of the matched boxes and median latencies.
+    """
+    reference_count = candidate_count = matched = 0
+    confidence_diffs, reference_times, quantized_times = [], [], []
+    for path in images:
+        reference, reference_time = timed_predict(reference_model, path, conf, imgsz, logger)
+        candidate, quantized_time = timed_predict(quantized_model, path, conf, imgsz, logger)
+        matches = match_boxes(reference, candidate, threshold)
+        reference_count += len(reference)
+        candidate_count += len(candidate)
+        matched += len(matches)
+        confidence_diffs.extend(abs(r["conf"] - c["conf"]) for r, c in matches)
+        reference_times.append(reference_time)
+        quantized_times.append(quantized_time)
+        print(f"{os.path.basename(path):40} float32 {len(reference):3} boxes {reference_time*1000:8.1f} ms  quantized {len(candidate):3} boxes {quantized_time*1000:8.1f} ms  matched {len(matches):3}")
+
+    return {
+        "recall": matched / reference_count if reference_count else 1.0,
+        "precision": matched / candidate_count if candidate_count else 1.0,
+        "confidence_diff": statistics.mean(confidence_diffs) if confidence_diffs else 0.0,
+        "float32_ms": statistics.median(reference_times) * 1000,
+        "quantized_ms": statistics.median(quantized_times) * 1000,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calibrates the quantized models and checks their boxes against the float32 model")
+    parser.add_argument("--model", choices=["unet", "detr"], required=True)
+    parser.add_argument("--mode", choices=["int8", "bf16"], default="int8")
+    parser.add_argument("--samples", required=True, help="folder of sample DICOM files")
+    parser.add_argument("--limit", type=int, default=None, help="maximum number of samples")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU above which a quantized box matches a float32 box")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="the check fails below this recall")
+    parser.add_argument("--no-calibration", action="store_true", help="only run the accuracy check")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    logger, log_listener = setup_logging(config, name="quantization", console=config["DEFAULT"].getboolean("debug_mode"))
+
+    cache_dir = config["MODEL"]["cache_dir"]
+    imgsz = (int(config["DEFAULT"]["image_height"]), int(config["DEFAULT"]["image_width"]))
+    conf = float(config["DEFAULT"]["min_confidence"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        images = convert_samples(args.samples, directory, config, logger, args.limit)
+        print(f"{len(images)} sample images")
+
+        # DETR int8 is dynamic and bf16 needs no calibration, only the static int8 Unet is calibrated
+        if args.model == "unet" and args.mode == "int8" and not args.no_calibration:
+            calibrate_unet(images, cache_dir, imgsz, logger)
+
+        reference_model = load_model(args.model, logger, cache_dir, imgsz, None)
+        quantized_model = load_model(args.model, logger, cache_dir, imgsz, args.mode)
+        result = compare(images, reference_model, quantized_model, conf, imgsz[1], args.iou, logger)
+
+    print(f"recall {result['recall']:.3f}  precision {result['precision']:.3f}  confidence diff {result['confidence_diff']:.4f}")
+    print(f"median latency float32 {result['float32_ms']:.1f} ms, {args.mode} {result['quantized_ms']:.1f} ms ({result['float32_ms'] / max(result['quantized_ms'], 1e-9):.2f}x)")
+    if result["recall"] < args.min_recall:
+        print(f"FAILED: recall below {args.min_recall}")
+        exit(1)
@@ -0,0 +1,81 @@
+import argparse
+import multiprocessing
+import statistics
+import time
+
+import numpy as np
+
+from core.usefull.shm_ring import FrameRing
+
+
+def _queue_producer(frames, shape, dtype, output):
+    image = np.random.default_rng(0).integers(0, 255, shape).astype(dtype)
+    for _ in range(frames):
+        output.put(image)
+    output.put(None)
+
+
+def _ring_producer(frames, ring):
+    image = np.random.default_rng(0).integers(0, 255, ring.shape).astype(ring.dtype)
+    for frame in range(frames):
+        index = ring.acquire()
+        ring.slot(index)[...] = image
+        ring.publish(index, {"frame": frame})
+    ring.publish(None, None)
+
+
+def through_queue(frames, shape, dtype, context):
+    """
+    Passes the frames through a multiprocessing.Queue, each frame being pickled.
+    """
+    output = context.Queue(maxsize=8)
+    process = context.Process(target=_queue_producer, args=(frames, shape, dtype, output))
+    start_time = time.perf_counter()
+    process.start()
+    checksum = 0
+    while (image := output.get()) is not None:
+        checksum += int(image[0, 0])
+    elapsed = time.perf_counter() - start_time
+    process.join()
+    return elapsed, []
+
+
+def through_ring(frames, shape, dtype, context, slots):
+    """
+    Passes the frames through a FrameRing, only the slot indexes being pickled.
+    """
+    ring = FrameRing(slots, shape, dtype, context=context)
+    process = context.Process(target=_ring_producer, args=(frames, ring))
+    depths = []
+    start_time = time.perf_counter()
+    process.start()
+    checksum = 0
+    while True:
+        index, _ = ring.get()
+        if index is None:
+            break
+        depths.append(ring.depth())
+        checksum += int(ring.slot(index)[0, 0])
+        ring.release(index)
+    elapsed = time.perf_counter() - start_time
+    process.join()
+    ring.close()
+    return elapsed, depths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cost of passing frames between processes: pickled through a queue vs shared memory ring")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--shapes", default="512x1024,1024x2048", help="frame shapes as HEIGHTxWIDTH, comma separated")
+    parser.add_argument("--bits", type=int, default=8, help="8 or 16 bits per pixel")
+    parser.add_argument("--slots", type=int, default=8, help="slots of the ring")
+    parser.add_argument("--start-method", default=None, help="fork, spawn or forkserver")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context(args.start_method)
+    dtype = np.uint8 if args.bits == 8 else np.uint16
+    for shape in [tuple(int(value) for value in size.split("x")) for size in args.shapes.split(",")]:
+        queue_time, _ = through_queue(args.frames, shape, dtype, context)
+        ring_time, depths = through_ring(args.frames, shape, dtype, context, args.slots)
+        print(f"{shape[0]}x{shape[1]}/{args.bits}bit  queue {queue_time / args.frames * 1e6:8.1f} us/frame  ring {ring_time / args.frames * 1e6:8.1f} us/frame  "
+              f"({queue_time / ring_time:.1f}x)  ring depth mean {statistics.mean(depths):.1f} max {max(depths)}/{args.slots}")
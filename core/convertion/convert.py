@@ -1,6 +1,9 @@
+import time
+
 import cv2
 import numpy as np
 import pydicom as PDCM
+from pydicom.encaps import generate_pixel_data_frame, encapsulate
 import numpy as np
 
 def bilinear_resize_vectorized(image, height=512, width=1024, uint=8):
@@ -89,6 +92,37 @@ def resize_image(img, uint):
         return res.astype('uint16')
     
     
+def _read_window_parameters(DCM_Img):
+    """
+    Read the size, instance number, window and rescale parameters of a DICOM dataset.
+
+    Returns:
+        tuple: rows, cols, Instance_Number, Window_Min, Window_Max, Rescale_Slope, Rescale_Intercept
+    """
+    rows = DCM_Img.get(0x00280010).value  # Get number of rows from tag (0028, 0010)
+    cols = DCM_Img.get(0x00280011).value  # Get number of cols from tag (0028, 0011)
+
+    Instance_Number = int(DCM_Img.get(0x00200013).value)  # Get actual slice instance number from tag (0020, 0013)
+
+    Window_Center = int(DCM_Img.get(0x00281050).value)  # Get window center from tag (0028, 1050)
+    Window_Width = int(DCM_Img.get(0x00281051).value)  # Get window width from tag (0028, 1051)
+
+    Window_Max = int(Window_Center + Window_Width / 2)
+    Window_Min = int(Window_Center - Window_Width / 2)
+
+    if (DCM_Img.get(0x00281052) is None):
+        Rescale_Intercept = 0
+    else:
+        Rescale_Intercept = int(DCM_Img.get(0x00281052).value)
+
+    if (DCM_Img.get(0x00281053) is None):
+        Rescale_Slope = 1
+    else:
+        Rescale_Slope = int(DCM_Img.get(0x00281053).value)
+
+    return rows, cols, Instance_Number, Window_Min, Window_Max, Rescale_Slope, Rescale_Intercept
+
+
 def Dicom_to_Image(Path, uint, logger):
     """
     Convert a DICOM file to an image array.
@@ -105,26 +139,7 @@ def Dicom_to_Image(Path, uint, logger):
     try:
         DCM_Img = PDCM.read_file(Path)
 
-        rows = DCM_Img.get(0x00280010).value  # Get number of rows from tag (0028, 0010)
-        cols = DCM_Img.get(0x00280011).value  # Get number of cols from tag (0028, 0011)
-
-        Instance_Number = int(DCM_Img.get(0x00200013).value)  # Get actual slice instance number from tag (0020, 0013)
-
-        Window_Center = int(DCM_Img.get(0x00281050).value)  # Get window center from tag (0028, 1050)
-        Window_Width = int(DCM_Img.get(0x00281051).value)  # Get window width from tag (0028, 1051)
-
-        Window_Max = int(Window_Center + Window_Width / 2)
-        Window_Min = int(Window_Center - Window_Width / 2)
-
-        if (DCM_Img.get(0x00281052) is None):
-            Rescale_Intercept = 0
-        else:
-            Rescale_Intercept = int(DCM_Img.get(0x00281052).value)
-
-        if (DCM_Img.get(0x00281053) is None):
-            Rescale_Slope = 1
-        else:
-            Rescale_Slope = int(DCM_Img.get(0x00281053).value)
+        rows, cols, Instance_Number, Window_Min, Window_Max, Rescale_Slope, Rescale_Intercept = _read_window_parameters(DCM_Img)
 
         if uint == 16:
             New_Img = np.zeros((rows, cols), np.uint16)
@@ -153,7 +168,301 @@ def Dicom_to_Image(Path, uint, logger):
         logger.error(f"Error occurred while converting DICOM file {Path}: {str(e)}")
         return None, None
 
-def Dicom_to_png(path, logger, width=1024, height=512, uint=8):
+def _is_native(DCM_Img):
+    """
+    True if the pixel data is uncompressed little endian unsigned 8/16-bit grayscale,
+    that can be read as a view over its bytes.
+    """
+    return (
+        DCM_Img.file_meta.get("TransferSyntaxUID") in (PDCM.uid.ExplicitVRLittleEndian, PDCM.uid.ImplicitVRLittleEndian)
+        and DCM_Img.get("SamplesPerPixel", 1) == 1
+        and DCM_Img.BitsAllocated in (8, 16)
+        and DCM_Img.PixelRepresentation == 0
+    )
+
+
+def _native_frame(DCM_Img, index):
+    dtype = np.dtype(np.uint8) if DCM_Img.BitsAllocated == 8 else np.dtype("<u2")
+    count = DCM_Img.Rows * DCM_Img.Columns
+    return np.frombuffer(DCM_Img.PixelData, dtype=dtype, count=count, offset=index * count * dtype.itemsize).reshape(DCM_Img.Rows, DCM_Img.Columns)
+
+
+def _native_pixels(DCM_Img):
+    """
+    Return the pixel data of an uncompressed little endian DICOM as a read-only view over its bytes,
+    without the copy made by pixel_array. Other encodings fall back to pixel_array.
+    """
+    if not _is_native(DCM_Img) or int(DCM_Img.get("NumberOfFrames", 1)) != 1:
+        return DCM_Img.pixel_array
+    return _native_frame(DCM_Img, 0)
+
+
+# attributes needed to decode the pixel data of a frame on its own
+_PIXEL_MODULE = ("Rows", "Columns", "SamplesPerPixel", "PhotometricInterpretation", "PlanarConfiguration",
+                 "BitsAllocated", "BitsStored", "HighBit", "PixelRepresentation")
+
+
+def iter_frames(DCM_Img):
+    """
+    Iterate over the frames of a DICOM dataset, decoding one frame at a time.
+
+    Uncompressed frames are views over the pixel data bytes, compressed frames are decoded
+    one by one from their fragments. Other encodings are decoded once with pixel_array.
+
+    Args:
+        DCM_Img (pydicom.Dataset): The DICOM dataset, with its pixel data.
+
+    Yields:
+        tuple: The frame number (starting at 1) and the 2-D pixel array of the frame.
+    """
+    number_of_frames = int(DCM_Img.get("NumberOfFrames", 1))
+    if _is_native(DCM_Img):
+        for index in range(number_of_frames):
+            yield index + 1, _native_frame(DCM_Img, index)
+    elif DCM_Img.file_meta.TransferSyntaxUID.is_compressed:
+        for index, fragment in enumerate(generate_pixel_data_frame(DCM_Img.PixelData, number_of_frames)):
+            frame = PDCM.Dataset()
+            frame.file_meta = DCM_Img.file_meta
+            frame.is_little_endian, frame.is_implicit_VR = DCM_Img.is_little_endian, DCM_Img.is_implicit_VR
+            for keyword in _PIXEL_MODULE:
+                if keyword in DCM_Img:
+                    setattr(frame, keyword, DCM_Img[keyword].value)
+            frame.NumberOfFrames = 1
+            frame.PixelData = encapsulate([fragment])
+            yield index + 1, frame.pixel_array
+    else:
+        Pixels = DCM_Img.pixel_array
+        for index in range(number_of_frames):
+            yield index + 1, Pixels[index] if number_of_frames > 1 else Pixels
+
+
+def _window_rows(Pixels, Rescale_Slope, Rescale_Intercept, Window_Min, Window_Max, maxValue, out):
+    """
+    Apply the rescale and the window to a band of rows, vectorized version of the loop of Dicom_to_Image
+    giving the same values.
+    """
+    Rescale_Pix_Val = Pixels.astype(np.int64) * Rescale_Slope + Rescale_Intercept
+    scaled = ((np.clip(Rescale_Pix_Val, Window_Min, Window_Max) - Window_Min) / (Window_Max - Window_Min)) * maxValue
+    out[...] = scaled.astype(out.dtype)
+    out[Rescale_Pix_Val > Window_Max] = maxValue
+    out[Rescale_Pix_Val < Window_Min] = 0
+    return out
+
+
+def band_rows_for_budget(memory_budget, width, y_ratio, uint):
+    """
+    Number of output rows processed at once to stay under the memory budget.
+
+    Args:
+        memory_budget (int): The memory budget of the temporaries in bytes.
+        width (int): The width of the output image.
+        y_ratio (float): The number of source rows per output row.
+        uint (int): 8 or 16 bits output.
+
+    Returns:
+        int: The number of output rows per band, at least 1.
+    """
+    # per source row: int64 rescaled values, float64 windowed values, windowed row
+    source_row_bytes = 2048 * (8 + 8 + uint // 8)
+    # per output row: indexes, weights, the 4 neighbours and the float64 temporaries of the interpolation
+    output_row_bytes = width * 8 * 12
+    row_bytes = (y_ratio + 1) * source_row_bytes + output_row_bytes
+    return max(1, int(memory_budget // row_bytes))
+
+
+def _resize_frame(Pixels, rows, cols, Window_Min, Window_Max, Rescale_Slope, Rescale_Intercept, width, height, uint, memory_budget, out=None):
+    """
+    Window, crop and resize one frame by bands of rows, see Dicom_to_Image_banded.
+    The result is written in `out` if given, e.g. a shared memory slot.
+    """
+    dtype, maxValue = (np.uint16, 2**16 -1) if uint == 16 else (np.uint8, 255)
+
+    # centre crop of resize_image
+    ecartX = int((rows-1024)/2)
+    ecartY = int((cols - 2048) / 2)
+    img_height, img_width = 1024, 2048
+
+    # same coordinates and weights as bilinear_resize_vectorized
+    x_ratio = float(img_width - 1) / (width - 1) if width > 1 else 0
+    y_ratio = float(img_height - 1) / (height - 1) if height > 1 else 0
+    x = np.arange(width)
+    x_l = np.floor(x_ratio * x).astype('int32')
+    x_h = np.ceil(x_ratio * x).astype('int32')
+    x_weight = (x_ratio * x) - x_l
+
+    resized = np.empty((height, width), dtype) if out is None else out
+    band = band_rows_for_budget(memory_budget, width, y_ratio, uint)
+
+    for start in range(0, height, band):
+        stop = min(start + band, height)
+        y = np.arange(start, stop)[:, None]
+        y_l = np.floor(y_ratio * y).astype('int32')
+        y_h = np.ceil(y_ratio * y).astype('int32')
+        y_weight = (y_ratio * y) - y_l
+
+        # window only the source rows used by this band
+        first, last = int(y_l[0, 0]), int(y_h[-1, 0])
+        source = Pixels[ecartX + first:ecartX + last + 1, ecartY:ecartY + img_width]
+        windowed = _window_rows(source, Rescale_Slope, Rescale_Intercept, Window_Min, Window_Max, maxValue, np.empty(source.shape, dtype))
+
+        a = windowed[y_l - first, x_l]
+        b = windowed[y_l - first, x_h]
+        c = windowed[y_h - first, x_l]
+        d = windowed[y_h - first, x_h]
+
+        band_resized = a * (1 - x_weight) * (1 - y_weight) + \
+                b * x_weight * (1 - y_weight) + \
+                c * y_weight * (1 - x_weight) + \
+                d * x_weight * y_weight
+
+        resized[start:stop] = np.rint(band_resized).astype(dtype)
+
+    return resized
+
+
+def Dicom_to_Image_banded(Path, logger, width=1024, height=512, uint=8, memory_budget=64 * 1024 * 1024):
+    """
+    Convert a DICOM file to the resized image by horizontal bands of rows, under a memory budget.
+
+    Gives exactly the same image as Dicom_to_Image, resize_image then bilinear_resize_vectorized,
+    but only the source rows needed by the current band are windowed and the output is preallocated,
+    so the full-size windowed image and the full-size float64 temporaries are never allocated.
+
+    Args:
+        Path (str): The path to the DICOM file.
+        logger: The logger object for logging any errors.
+        width (int): The width of the resized image.
+        height (int): The height of the resized image.
+        uint (int): The data type of the output image array (16 for uint16, 8 for uint8).
+        memory_budget (int): The memory budget of the temporaries in bytes.
+
+    Returns:
+        tuple: The resized image, the instance number, the original width and height.
+               If an error occurs during conversion, None is returned for all values.
+    """
+    try:
+        DCM_Img = PDCM.read_file(Path)
+
+        rows, cols, Instance_Number, Window_Min, Window_Max, Rescale_Slope, Rescale_Intercept = _read_window_parameters(DCM_Img)
+
+        Pixels = _native_pixels(DCM_Img)
+
+        resized = _resize_frame(Pixels, rows, cols, Window_Min, Window_Max, Rescale_Slope, Rescale_Intercept, width, height, uint, memory_budget)
+
+        return resized, Instance_Number, cols, rows
+
+    except Exception as e:
+        logger.error(f"Error occurred while converting DICOM file {Path}: {str(e)}")
+        return None, None, None, None
+
+
+def Dicom_to_array(path, logger, width=1024, height=512, uint=8, memory_budget=None):
+    """
+    Convert a DICOM file to the image given to the models.
+
+    Args:
+        path (str): The path to the DICOM file.
+        logger: The logger object for logging messages.
+        width (int, optional): The width of the resized image. Defaults to 1024.
+        height (int, optional): The height of the resized image. Defaults to 512.
+        uint (int, optional): The number of bits to use for pixel intensity. Defaults to 8.
+        memory_budget (int, optional): If set, the image is processed by bands of rows
+            using at most this many bytes of temporaries. Defaults to None (full image).
+
+    Returns:
+        tuple: The resized image, the original width and height of the image.
+    """
+    if memory_budget:
+        Output_Image, Instance_Number, original_width, original_height = Dicom_to_Image_banded(path, logger, width=width, height=height, uint=uint, memory_budget=memory_budget)
+        if Output_Image is None:
+            logger.warning(f"Failed to convert DICOM file {path}")
+            return None, None, None
+        logger.info(f"Converted DICOM file {path}, instance number {Instance_Number}, by bands of rows with height={height}, width={width}")
+        return Output_Image, original_width, original_height
+
+    Output_Image, Instance_Number = Dicom_to_Image(path, uint, logger)
+
+    if Output_Image is None:
+        logger.warning(f"Failed to convert DICOM file {path}")
+        return None, None, None
+
+    original_height, original_width = Output_Image.shape
+    logger.info(f"Read DICOM file {path}, instance number {Instance_Number}")
+
+    Output_Image = resize_image(Output_Image, uint)
+    logger.info(f"Resized image from DICOM file {path}")
+
+    Output_Image = bilinear_resize_vectorized(Output_Image, height=height, width=width, uint=uint)
+    logger.info(f"Applied bilinear resizing to image from DICOM file {path} with height={height}, width={width}")
+    return Output_Image, original_width, original_height
+
+
+def Dicom_frames_to_arrays(path, logger, width=1024, height=512, uint=8, memory_budget=64 * 1024 * 1024, allocate=None):
+    """
+    Convert the frames of a multi-frame DICOM file to the images given to the models, one frame at a time.
+
+    The frames are decoded lazily: only the frame being converted is held in memory besides the pixel data bytes.
+
+    Args:
+        path (str): The path to the DICOM file.
+        logger: The logger object for logging messages.
+        width (int, optional): The width of the resized images. Defaults to 1024.
+        height (int, optional): The height of the resized images. Defaults to 512.
+        uint (int, optional): The number of bits to use for pixel intensity. Defaults to 8.
+        memory_budget (int, optional): The memory budget of the temporaries of a frame in bytes.
+        allocate (callable, optional): Called with the frame number, returns the (height, width) array
+            the frame is written to. Defaults to a new array per frame.
+
+    Yields:
+        tuple: The frame number (starting at 1), the resized image, the original width and height
+            and the time spent decoding and converting the frame in seconds.
+    """
+    DCM_Img = PDCM.read_file(path)
+    rows, cols, Instance_Number, Window_Min, Window_Max, Rescale_Slope, Rescale_Intercept = _read_window_parameters(DCM_Img)
+    logger.info(f"Converting {int(DCM_Img.get('NumberOfFrames', 1))} frames of DICOM file {path}, instance number {Instance_Number}")
+
+    start_time = time.perf_counter()
+    for frame_number, Pixels in iter_frames(DCM_Img):
+        out = allocate(frame_number) if allocate is not None else None
+        resized = _resize_frame(Pixels, rows, cols, Window_Min, Window_Max, Rescale_Slope, Rescale_Intercept, width, height, uint, memory_budget or 64 * 1024 * 1024, out=out)
+        yield frame_number, resized, cols, rows, time.perf_counter() - start_time
+        start_time = time.perf_counter()
+
+
+def to_uint8(image):
+    """
+    Returns an 8-bit version of an image returned by Dicom_to_array, as OpenCV reads back a 16-bit PNG.
+    """
+    if image.dtype == np.uint16:
+        return (image >> 8).astype(np.uint8)
+    return image
+
+
+def boxes_to_image(bboxes, original_width, original_height, width=1024, height=512):
+    """
+    Maps the boxes found on the resized image back to the coordinates of the DICOM image.
+
+    The conversion crops the centre 2048x1024 of the image and resizes it to width x height.
+
+    Args:
+        bboxes (list): The boxes returned by the model, dicts with x, y, w and h.
+        original_width (int): The width of the DICOM image.
+        original_height (int): The height of the DICOM image.
+        width (int, optional): The width of the resized image. Defaults to 1024.
+        height (int, optional): The height of the resized image. Defaults to 512.
+
+    Returns:
+        list: The [x, y, w, h] rectangles in the DICOM image.
+    """
+    ratio_width, ratio_height = 2048 / width, 1024 / height
+    list_rectangle = []
+    for box in bboxes:
+        x, y, w, h = box["x"], box["y"], box["w"], box["h"]
+        list_rectangle.append([(x*ratio_width)+((original_width - 2048) / 2), (y*ratio_height)+((original_height - 1024)/2), w*ratio_width, h*ratio_height])
+    return list_rectangle
+
+
+def Dicom_to_png(path, logger, width=1024, height=512, uint=8, memory_budget=None):
     """
     Convert a DICOM file to PNG format.
 
@@ -161,6 +470,8 @@ def Dicom_to_png(path, logger, width=1024, height=512, uint=8):
         path (str): The path to the DICOM file.
         logger: The logger object for logging messages.
         uint (int, optional): The number of bits to use for pixel intensity. Defaults to 8.
+        memory_budget (int, optional): If set, the image is processed by bands of rows
+            using at most this many bytes of temporaries. Defaults to None (full image).
 
     Returns:
         tuple: A tuple containing the original width and height of the converted image.
@@ -168,20 +479,11 @@ def Dicom_to_png(path, logger, width=1024, height=512, uint=8):
     try:
         logger.info(f"Converting DICOM file {path} to PNG")
         
-        Output_Image, Instance_Number = Dicom_to_Image(path, uint, logger)
+        Output_Image, original_width, original_height = Dicom_to_array(path, logger, width=width, height=height, uint=uint, memory_budget=memory_budget)
         
         if Output_Image is None:
             logger.warning(f"Failed to convert DICOM file {path} to PNG")
             return None, None
-        
-        original_height, original_width = Output_Image.shape
-        logger.info(f"Read DICOM file {path}, instance number {Instance_Number}")
-
-        Output_Image = resize_image(Output_Image, uint)
-        logger.info(f"Resized image from DICOM file {path}")
-
-        Output_Image = bilinear_resize_vectorized(Output_Image, height=height, width=width, uint=uint)
-        logger.info(f"Applied bilinear resizing to image from DICOM file {path} with height={height}, width={width}")
 
         # write to png in the tmp folder
         cv2.imwrite("tmp/tmp.png", Output_Image)
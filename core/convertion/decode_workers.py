@@ -0,0 +1,76 @@
+import logging
+import multiprocessing
+
+from core.convertion.convert import Dicom_frames_to_arrays
+
+
+def _decode_worker(ring, tasks, options):
+    logger = logging.getLogger("decode")
+    while True:
+        path = tasks.get()
+        if path is None:
+            return
+        slots = []
+
+        def allocate(frame_number):
+            index = ring.acquire()
+            slots.append(index)
+            return ring.slot(index)
+
+        frames = 0
+        try:
+            for frame_number, _, original_width, original_height, convert_time in Dicom_frames_to_arrays(path, logger, allocate=allocate, **options):
+                ring.publish(slots.pop(), {"path": path, "frame": frame_number, "width": original_width, "height": original_height, "convert_s": convert_time})
+                frames += 1
+            ring.publish(None, {"path": path, "frames": frames})
+        except Exception as e:
+            # the slot of the frame that failed is given back
+            for index in slots:
+                ring.release(index)
+            ring.publish(None, {"path": path, "frames": frames, "error": str(e)})
+
+
+class DecodePool:
+    """
+    Worker processes converting DICOM files straight into the slots of a FrameRing.
+
+    For each file, one item per frame is published on the ring, followed by an end item with
+    index None and the number of frames (and the error if the conversion failed).
+    """
+
+    def __init__(self, ring, workers, width=1024, height=512, uint=8, memory_budget=64 * 1024 * 1024, context=None):
+        """
+        Initializes the pool.
+
+        Args:
+            ring (FrameRing): The ring the frames are written to, its slots of shape (height, width).
+            workers (int): The number of worker processes.
+            width (int): The width of the converted images.
+            height (int): The height of the converted images.
+            uint (int): The number of bits to use for pixel intensity.
+            memory_budget (int): The memory budget of the conversion of a frame in bytes.
+            context (multiprocessing.context.BaseContext, optional): The multiprocessing context, the one of the ring.
+        """
+        if ring.shape != (height, width):
+            raise ValueError(f"The ring slots {ring.shape} do not match the converted images ({height}, {width})")
+        context = context or multiprocessing.get_context()
+        self.ring = ring
+        self.tasks = context.Queue()
+        self.options = {"width": width, "height": height, "uint": uint, "memory_budget": memory_budget}
+        self.processes = [context.Process(target=_decode_worker, args=(ring, self.tasks, self.options), name=f"decode-{i}", daemon=True) for i in range(workers)]
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def submit(self, path):
+        self.tasks.put(path)
+
+    def stop(self, timeout=None):
+        """
+        Lets the workers finish the submitted files, then stops them.
+        """
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout)
@@ -4,8 +4,12 @@ import torch
 from transformers import DetrForObjectDetection, DetrFeatureExtractor
 from PIL import Image
 import os
+import types
 
+from core.convertion.convert import to_uint8
 from core.usefull.detr import convert_boxes
+from core.usefull.model_cache import cache_key, artifact_path, load_or_build, warm_up
+from core.usefull.quantization import check_quantize_mode, bf16_supported, bf16_autocast, quantize_dynamic_int8
 
 
 
@@ -14,17 +18,75 @@ class Detr(pl.LightningModule):
     Implementation of the DETR (DEtection TRansformer) model for object detection.
     """
 
-    def __init__(self, logger):
+    def __init__(self, logger, cache_dir=None, imgsz=(512, 1024), warmup=True, quantize=None):
         """
         Initializes the DETR model.
 
         Args:
             logger (logging.Logger): Logger object.
+            cache_dir (str, optional): If set, the model is traced once to a frozen TorchScript module
+                in this directory and the trace is loaded on the next starts.
+            imgsz (tuple): The (height, width) of the images given to the model.
+            warmup (bool): If True, a dummy inference is run once the model is loaded.
+            quantize (str, optional): "int8" for dynamic int8 linear/attention layers,
+                "bf16" to run the backbone convolutions and the matmuls in bfloat16. Defaults to float32.
         """
         super().__init__()
-        self.model = DetrForObjectDetection.from_pretrained("model/detr/",
-                                                            ignore_mismatched_sizes=True)
-        logger.info("Loaded DETR model")
+        self.quantize = check_quantize_mode(quantize)
+        if self.quantize == "bf16" and not bf16_supported():
+            logger.warning("The CPU does not support bfloat16, DETR runs in float32")
+            self.quantize = None
+
+        if cache_dir is None:
+            self.model = self._load_eager()
+            self.feature_extractor = DetrFeatureExtractor.from_pretrained("facebook/detr-resnet-50")
+        else:
+            key = cache_key(cache_dir, ["model/detr/"], ["torch", "transformers", "timm"], extra=("torchscript", list(imgsz), self.quantize))
+            self.feature_extractor = load_or_build(
+                artifact_path(cache_dir, "detr-feature-extractor", key, ""),
+                lambda path: DetrFeatureExtractor.from_pretrained("facebook/detr-resnet-50").save_pretrained(path),
+                DetrFeatureExtractor.from_pretrained,
+                logger,
+            )
+            self.model = load_or_build(
+                artifact_path(cache_dir, "detr", key, ".pt"),
+                lambda path: self._trace(path, imgsz),
+                lambda path: torch.jit.load(path, map_location="cpu"),
+                logger,
+                fallback=self._load_eager,
+            )
+        logger.info(f"Loaded DETR model ({self.quantize or 'float32'})")
+        if warmup:
+            warm_up(lambda: self._forward(self._preprocess(np.zeros((1, *imgsz, 3), np.uint8))), logger, "DETR")
+
+    def _load_eager(self, torchscript=False):
+        model = DetrForObjectDetection.from_pretrained("model/detr/", ignore_mismatched_sizes=True, torchscript=torchscript)
+        model.eval()
+        if self.quantize == "int8":
+            model = quantize_dynamic_int8(model)
+        return model
+
+    def _trace(self, path, imgsz):
+        # torchscript=True makes the model return tuples, the frozen trace folds the weights and the conv-bn
+        model = self._load_eager(torchscript=True)
+        with torch.no_grad(), bf16_autocast(self.quantize == "bf16"):
+            traced = torch.jit.trace(model, self._preprocess(np.zeros((1, *imgsz, 3), np.uint8)), strict=False)
+            traced = torch.jit.freeze(traced)
+        torch.jit.save(traced, path)
+
+    def _preprocess(self, image):
+        # (N, height, width, 3) images to the (N, 3, height, width) normalized batch
+        encoding = self.feature_extractor(images=torch.tensor(image), return_tensors="pt")
+        return encoding["pixel_values"]
+
+    def _forward(self, pixel_values):
+        with torch.inference_mode(), bf16_autocast(self.quantize == "bf16"):
+            if isinstance(self.model, torch.jit.ScriptModule):
+                logits, pred_boxes = self.model(pixel_values)[:2]
+            else:
+                outputs = self.model(pixel_values=pixel_values, pixel_mask=None)
+                logits, pred_boxes = outputs.logits, outputs.pred_boxes
+        return types.SimpleNamespace(logits=logits.float(), pred_boxes=pred_boxes.float())
 
     def predict(self, image_path, conf=0.5, imgsz=800, logger=None):
         """
@@ -39,25 +101,40 @@ class Detr(pl.LightningModule):
             list: List of bounding boxes.
         """
         try:
-            feature_extractor = DetrFeatureExtractor.from_pretrained("facebook/detr-resnet-50")
-            
             image = Image.open(image_path)
             image = image.convert("RGB")  # Convert image to RGB if it's not already
             image = np.array(image)  # Convert image to numpy array
             image = np.expand_dims(image, axis=0)  # Add an extra dimension to the image
             
-            encoding = feature_extractor(images=torch.tensor(image), return_tensors="pt")
-            pixel_values = encoding["pixel_values"].squeeze() 
-            
-            pixel_values = pixel_values.unsqueeze(0) 
+            pixel_values = self._preprocess(image)
             logger.info(f"Preprocessed image {image_path}")
-            outputs = self.model(pixel_values=pixel_values, pixel_mask=None)
+            outputs = self._forward(pixel_values)
             
             bboxes = convert_boxes(image.shape[2],image.shape[1], outputs, threshold=conf, keep_highest_scoring_bbox=False)
             logger.info(f"Predicted {len(bboxes)} bounding boxes for {image_path}")
             for box in bboxes:
-                logger.info(f"Bounding box: conf={box['conf']}, x={box['x']}, y={box['y']}, w={box['w']}, h={box['h']}")
+                logger.debug(f"Bounding box: conf={box['conf']}, x={box['x']}, y={box['y']}, w={box['w']}, h={box['h']}")
             return bboxes
         except Exception as e:
             logger.error(f"An error occurred while predicting bounding boxes for {image_path}: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+    def predict_batch(self, images, conf=0.5, logger=None):
+        """
+        Predicts bounding boxes for several in-memory images in one forward pass.
+
+        Args:
+            images (list): The grayscale images returned by Dicom_to_array, all of the same size.
+            conf (float): Minimum confidence for a bounding box to be considered.
+
+        Returns:
+            list: The list of bounding boxes of each image.
+        """
+        batch = np.stack([np.repeat(to_uint8(image)[..., None], 3, axis=2) for image in images])
+        outputs = self._forward(self._preprocess(batch))
+        boxes = []
+        for i in range(len(images)):
+            image_outputs = types.SimpleNamespace(logits=outputs.logits[i:i + 1], pred_boxes=outputs.pred_boxes[i:i + 1])
+            boxes.append(convert_boxes(batch.shape[2], batch.shape[1], image_outputs, threshold=conf, keep_highest_scoring_bbox=False))
+        logger.info(f"Predicted {sum(len(image_boxes) for image_boxes in boxes)} bounding boxes for a batch of {len(images)} images")
+        return boxes
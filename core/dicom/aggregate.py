@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import time
+
+from pydicom.dataset import Dataset
+
+from core.dicom.bbox_to_gsps import create_study_gsps
+
+
+class StudyAggregator:
+    """
+    Groups the processed images of a study (or series) to emit a single GSPS for all of them.
+
+    An image opens a group, the group is emitted once `window` seconds have passed
+    since it was opened or when the aggregator is flushed at the end of the run.
+
+    With a journal directory, each open group is also written there (headers and boxes) and
+    removed once its GSPS is emitted, so the groups left open by a crash are emitted by the next run.
+    """
+
+    def __init__(self, emit, logger, window=10.0, group_by="study", show_confidence=True, separate_layers=True, suffix="_study", journal=None):
+        """
+        Initializes the aggregator.
+
+        Args:
+            emit (callable): Called with (gsps_dataset, filename) for each GSPS built.
+            logger: The logger object for logging messages.
+            window (float): How long a group stays open, in seconds.
+            group_by (str): "study" to group on StudyInstanceUID, "series" to also split on SeriesInstanceUID.
+            show_confidence (bool): If True, the confidence is displayed on the GSPS.
+            separate_layers (bool): If True, the confidence texts are put on their own graphic layer.
+            suffix (str): Added to the name of the first input file of the group to name the GSPS.
+            journal (str, optional): The directory where the open groups are persisted.
+        """
+        if group_by not in ("study", "series"):
+            raise ValueError(f"Invalid group_by {group_by}, expected study or series")
+        self.emit = emit
+        self.logger = logger
+        self.window = window
+        self.group_by = group_by
+        self.show_confidence = show_confidence
+        self.separate_layers = separate_layers
+        self.suffix = suffix
+        self.journal = journal
+        self.groups = {}
+        if journal is not None:
+            os.makedirs(journal, exist_ok=True)
+            self._load_journal()
+
+    def _key(self, dicom_dataset):
+        if self.group_by == "series":
+            return (dicom_dataset.StudyInstanceUID, dicom_dataset.SeriesInstanceUID)
+        return (dicom_dataset.StudyInstanceUID,)
+
+    def add(self, dicom_dataset, list_rectangle_coordinates, list_indic, filename, frame_number=None):
+        """
+        Adds a processed image, then emits the groups whose window is over.
+
+        Args:
+            dicom_dataset (pydicom.Dataset): The header of the original image.
+            list_rectangle_coordinates (list): The rectangles (x, y, width, height) in image coordinates.
+            list_indic (list): The confidence of each rectangle.
+            filename (str): The input file name, used to name the GSPS.
+            frame_number (int, optional): The frame of a multi-frame image the rectangles were found on.
+        """
+        key = self._key(dicom_dataset)
+        if key not in self.groups:
+            self.groups[key] = {"opened": time.time(), "filename": filename, "images": []}
+        self.groups[key]["images"].append((dicom_dataset, list_rectangle_coordinates, list_indic, frame_number))
+        self._write_journal(key)
+        self.logger.info(f"Image {filename} added to the GSPS of study {dicom_dataset.StudyInstanceUID} ({len(self.groups[key]['images'])} images)")
+        self.flush_expired()
+
+    def flush_expired(self):
+        """
+        Emits the groups opened more than `window` seconds ago.
+        """
+        now = time.time()
+        for key in [key for key, group in self.groups.items() if now - group["opened"] >= self.window]:
+            self._emit(key)
+
+    def flush_all(self):
+        """
+        Emits all the open groups.
+        """
+        for key in list(self.groups):
+            self._emit(key)
+
+    def _emit(self, key):
+        group = self.groups.pop(key)
+        gsps_dataset = create_study_gsps(group["images"], self.logger, show_confidence=self.show_confidence, separate_layers=self.separate_layers)
+        if gsps_dataset is None:
+            # the same images would fail again, the group is set aside rather than retried by every run
+            if self.journal is not None:
+                os.replace(self._journal_path(key), self._journal_path(key) + ".bad")
+            self.logger.error(f"No GSPS created for study {key[0]}, group of {len(group['images'])} images set aside")
+            return
+        self.logger.info(f"Created GSPS for {len(group['images'])} images of study {key[0]}")
+        self.emit(gsps_dataset, group["filename"].replace(".dcm", "") + self.suffix + ".dcm")
+        if self.journal is not None:
+            os.remove(self._journal_path(key))
+
+    def _journal_path(self, key):
+        return os.path.join(self.journal, hashlib.sha1("/".join(key).encode()).hexdigest() + ".json")
+
+    def _write_journal(self, key):
+        if self.journal is None:
+            return
+        group = self.groups[key]
+        content = {
+            "key": list(key),
+            "opened": group["opened"],
+            "filename": group["filename"],
+            "images": [{
+                "header": dicom_dataset.to_json_dict(),
+                "rectangles": [[float(value) for value in rectangle] for rectangle in list_rectangle_coordinates],
+                "confidences": [float(value) for value in list_indic],
+                "frame": frame_number,
+            } for dicom_dataset, list_rectangle_coordinates, list_indic, frame_number in group["images"]],
+        }
+        path = self._journal_path(key)
+        with open(path + ".part", "w") as f:
+            json.dump(content, f)
+        os.replace(path + ".part", path)
+
+    def _load_journal(self):
+        for name in sorted(os.listdir(self.journal)):
+            path = os.path.join(self.journal, name)
+            if name.endswith(".part"):
+                os.remove(path)
+                continue
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(path) as f:
+                    content = json.load(f)
+                images = [(Dataset.from_json(image["header"]), image["rectangles"], image["confidences"], image["frame"]) for image in content["images"]]
+            except Exception as e:
+                self.logger.error(f"Unreadable GSPS group {path} moved out of the journal: {str(e)}")
+                os.replace(path, path + ".bad")
+                continue
+            self.groups[tuple(content["key"])] = {"opened": content["opened"], "filename": content["filename"], "images": images}
+        if self.groups:
+            self.logger.info(f"{len(self.groups)} GSPS groups left open by the previous run restored from {self.journal}")
@@ -1,21 +1,243 @@
 import pydicom
-from pydicom.dataset import Dataset
-from pydicom.uid import generate_uid
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import generate_uid, ImplicitVRLittleEndian
 from pydicom._storage_sopclass_uids import GrayscaleSoftcopyPresentationStateStorage
 import datetime
 
 
-def create_gsps(dicom_file_path, gsps_file_path, list_rectangle_coordinates, list_indic, logger, show_confidence=True):
+ANALYSIS_LAYER = 'ANALYSIS LAYER'
+CONFIDENCE_LAYER = 'CONFIDENCE LAYER'
+
+
+def _referenced_image(dicom_dataset, frame_number=None):
+    """
+    Build the Referenced Image Sequence item pointing to an image, or to one frame of a multi-frame image.
+    """
+    referenced_image = Dataset()
+    referenced_image.ReferencedSOPClassUID = dicom_dataset.SOPClassUID
+    referenced_image.ReferencedSOPInstanceUID = dicom_dataset.SOPInstanceUID
+    if frame_number is not None:
+        referenced_image.ReferencedFrameNumber = frame_number
+    return referenced_image
+
+
+def _graphic_annotations(list_rectangle_coordinates, list_indic, show_confidence, separate_layers):
+    """
+    Build the Graphic Annotation Sequence items of one image.
+
+    Returns:
+        list: 1 item per rectangle, followed by 1 item per confidence text with separate layers.
+    """
+    annotations = []
+    text_annotations = []
+    nb_rectangles = len(list_rectangle_coordinates)
+    for i in range(nb_rectangles):
+        # on traite le i-ème rectangle avec son indicateur
+        rectangle_coordinates = list_rectangle_coordinates[i]
+        indic = list_indic[i]
+
+        annotation = Dataset()
+        annotations.append(annotation)
+        annotation.GraphicLayer = ANALYSIS_LAYER
+        annotation.GraphicObjectSequence = [Dataset()]
+        annotation.GraphicObjectSequence[0].GraphicAnnotationUnits = 'PIXEL'
+        annotation.GraphicObjectSequence[0].GraphicDimensions = 2
+        annotation.GraphicObjectSequence[0].NumberOfGraphicPoints = 4
+        x, y, w, h = rectangle_coordinates
+        x1 = int(x)
+        x2 = int(x + w)
+        x3 = int(x + w)
+        x4 = int(x)
+        y1 = int(y)
+        y2 = int(y)
+        y3 = int(y + h)
+        y4 = int(y + h)
+        annotation.GraphicObjectSequence[0].GraphicData = [x1, y1, x2, y2, x3, y3, x4, y4, x1, y1]
+        annotation.GraphicObjectSequence[0].GraphicType = "POLYLINE"
+        annotation.GraphicObjectSequence[0].GraphicFilled = "N"
+
+        annotation.GraphicObjectSequence[0].LineStyleSequence = [Dataset()]
+        annotation.GraphicObjectSequence[0].LineStyleSequence[0].ShadowStyle = 'OFF'
+        annotation.GraphicObjectSequence[0].LineStyleSequence[0].ShadowOffsetX = 0
+        annotation.GraphicObjectSequence[0].LineStyleSequence[0].ShadowOffsetY = 0
+        annotation.GraphicObjectSequence[0].LineStyleSequence[0].LineThickness = 2
+        annotation.GraphicObjectSequence[0].LineStyleSequence[0].LineDashingStyle = 'SOLID'
+        annotation.GraphicObjectSequence[0].LineStyleSequence[0].ShadowOpacity = 0
+        annotation.GraphicObjectSequence[0].LineStyleSequence[0].PatternOnOpacity = 1
+        # COULEUR
+        if indic > 0.8:
+            # l'annotation est VERTE
+            interpol = int((1-indic)/0.2*0xAAAA)
+            annotation.GraphicObjectSequence[0].LineStyleSequence[0].PatternOnColorCIELabValue = [0xFFFF, interpol, 0xFFFF]
+        elif indic > 0.65:
+            # l'annotation est JAUNE
+            # take a value linearly between 0xAAAA if indic = 0.8 and 0xE000 if indic=0.65
+            interpol1 = int((0.8-indic)/0.15*0x3556+0xAAAA)
+            interpol2 = int((0.8-indic)/0.15*(-4095)+0xFFFF)
+            annotation.GraphicObjectSequence[0].LineStyleSequence[0].PatternOnColorCIELabValue = [0xFFFF, interpol1, interpol2]
+        else :
+            # l'annotation est ROUGE
+            interpol1 = int((0.65-indic)/0.15*(-4095)+0xFFFF)
+            interpol2 = int((0.65-indic)/0.15*(-8191)+0xFFFF)
+            annotation.GraphicObjectSequence[0].LineStyleSequence[0].PatternOnColorCIELabValue = [interpol1, interpol2, 0xF000]
+
+        # [0xFFFF, 0x0000, 0xFFFF] : VERT
+        # [0xF000, 0xFFFF, 0xF000] : ROUGE
+        # [0xFFFF, 0xF000, 0xF000] : ORANGE
+        # [0xFFFF, 0xAAAA, 0xFFFF] : JAUNE
+
+        # On rajoute une annotation texte indiquant le niveau de précision
+        if show_confidence:
+            text_object = Dataset()
+            text_object.AnchorPointAnnotationUnits = 'PIXEL'
+            text_object.UnformattedTextValue = f"Précision: {int(round(indic,2)*100)}%"
+            text_object.AnchorPoint = [x ,y1 - 30]
+            text_object.AnchorPointVisibility = 'N'
+            if separate_layers:
+                # le texte est sur son propre calque, le viewer peut l'afficher ou le masquer
+                text_annotations.append(Dataset())
+                text_annotations[-1].GraphicLayer = CONFIDENCE_LAYER
+                text_annotations[-1].TextObjectSequence = [text_object]
+            else:
+                annotation.TextObjectSequence = [text_object]
+
+    return annotations + text_annotations
+
+
+def _build_gsps(list_images, show_confidence, separate_layers):
+    """
+    Build a GSPS referencing one or several images of the same study.
+
+    Args:
+        list_images (list): (dicom_dataset, list_rectangle_coordinates, list_indic) for each image,
+            dicom_dataset being the header of the original image. A 4th value, the frame number,
+            makes the annotations of the item reference that frame of a multi-frame image.
+        show_confidence (bool): If True, the confidence is displayed on the GSPS
+        separate_layers (bool): If True, the confidence texts are put on their own graphic layer
+
+    Returns:
+        gsps_dataset: The GSPS dataset.
+    """
+    list_images = [tuple(image) + (None,) * (4 - len(image)) for image in list_images]
+    dicom_dataset = list_images[0][0]
+    # the frames of a multi-frame image are several items of the same instance
+    instances = {}
+    for image in list_images:
+        instances.setdefault(image[0].SOPInstanceUID, image[0])
+    several_images = len(instances) > 1
+
+    # Creation du dataset du GSPS
+    gsps_dataset = Dataset()
+    gsps_dataset.is_little_endian = True
+    gsps_dataset.is_implicit_VR = True
+
+    # Patient
+    gsps_dataset.PatientName = dicom_dataset.PatientName
+    gsps_dataset.PatientID = dicom_dataset.PatientID
+    gsps_dataset.PatientAge = dicom_dataset.PatientAge
+    gsps_dataset.PatientSex = dicom_dataset.PatientSex
+
+    # General Study
+    gsps_dataset.StudyDate = dicom_dataset.StudyDate
+    gsps_dataset.StudyTime = dicom_dataset.StudyTime
+    gsps_dataset.AccessionNumber = dicom_dataset.AccessionNumber
+    gsps_dataset.StudyDescription = dicom_dataset.StudyDescription
+    gsps_dataset.StudyInstanceUID = dicom_dataset.StudyInstanceUID
+    gsps_dataset.StudyID = dicom_dataset.StudyID
+
+    # General Series
+    today = pydicom.valuerep.DA(datetime.date.today())
+    now = pydicom.valuerep.TM(datetime.datetime.now().time())
+    gsps_dataset.SeriesDate = today
+    gsps_dataset.SeriesTime = now
+    gsps_dataset.Modality = "PR"
+    gsps_dataset.SeriesInstanceUID = generate_uid()
+    gsps_dataset.SeriesNumber = max(image[0].SeriesNumber for image in list_images) + 1  # Increment the series number
+
+    # Presentation State Identification
+    gsps_dataset.InstanceNumber = max(image[0].InstanceNumber for image in list_images) + 1  # Increment the instance number
+    gsps_dataset.ContentLabel = f"LESION" # {indic}"
+    gsps_dataset.PresentationCreationDate = today
+    gsps_dataset.PresentationCreationTime = now
+    gsps_dataset.ContentCreatorName = 'OPTIMOTO'
+
+    # Presentation State Relationship - 1 item per referenced series
+    gsps_dataset.ReferencedSeriesSequence = []
+    referenced_series = {}
+    for image in instances.values():
+        series_instance_uid = image.SeriesInstanceUID
+        if series_instance_uid not in referenced_series:
+            referenced_series[series_instance_uid] = Dataset()
+            referenced_series[series_instance_uid].ReferencedImageSequence = []
+            referenced_series[series_instance_uid].SeriesInstanceUID = series_instance_uid
+            gsps_dataset.ReferencedSeriesSequence.append(referenced_series[series_instance_uid])
+        referenced_series[series_instance_uid].ReferencedImageSequence.append(_referenced_image(image))
+
+    # Displayed Area - with several images, 1 item per image as they may not have the same size
+    gsps_dataset.DisplayedAreaSelectionSequence = []
+    for image in instances.values():
+        displayed_area = Dataset()
+        if several_images:
+            displayed_area.ReferencedImageSequence = [_referenced_image(image)]
+        displayed_area.DisplayedAreaTopLeftHandCorner = [0, 0]
+        displayed_area.DisplayedAreaBottomRightHandCorner = [image.Columns, image.Rows]
+        displayed_area.PresentationSizeMode = 'SCALE TO FIT'
+        displayed_area.PresentationPixelAspectRatio = [1, 1]
+        gsps_dataset.DisplayedAreaSelectionSequence.append(displayed_area)
+
+    # Graphic Annotations - with several images or frames, each annotation references its image and frame
+    annotations = []
+    for image, list_rectangle_coordinates, list_indic, frame_number in list_images:
+        image_annotations = _graphic_annotations(list_rectangle_coordinates, list_indic, show_confidence, separate_layers)
+        if several_images or frame_number is not None:
+            for annotation in image_annotations:
+                annotation.ReferencedImageSequence = [_referenced_image(image, frame_number)]
+        annotations += image_annotations
+    if annotations:
+        gsps_dataset.GraphicAnnotationSequence = annotations
+
+    # Graphic Layer
+    gsps_dataset.GraphicLayerSequence = [Dataset()]
+    gsps_dataset.GraphicLayerSequence[0].GraphicLayer = ANALYSIS_LAYER
+    gsps_dataset.GraphicLayerSequence[0].GraphicLayerOrder = 0
+    if separate_layers and show_confidence:
+        gsps_dataset.GraphicLayerSequence[0].GraphicLayerDescription = 'Lesions'
+        gsps_dataset.GraphicLayerSequence += [Dataset()]
+        gsps_dataset.GraphicLayerSequence[1].GraphicLayer = CONFIDENCE_LAYER
+        gsps_dataset.GraphicLayerSequence[1].GraphicLayerOrder = 1
+        gsps_dataset.GraphicLayerSequence[1].GraphicLayerDescription = 'Confidence'
+
+    # Softocopy Presentation LUP
+    gsps_dataset.PresentationLUTShape = 'IDENTITY'
+
+    # SOP Common
+    gsps_dataset.InstanceCreationDate = today
+    gsps_dataset.InstanceCreationTime = now
+    gsps_dataset.SOPClassUID = GrayscaleSoftcopyPresentationStateStorage
+    gsps_dataset.SOPInstanceUID = generate_uid()  # unique UID pour le GSPS qu'on cree
+
+    # file meta information, needed to write the GSPS in the outbox
+    gsps_dataset.file_meta = FileMetaDataset()
+    gsps_dataset.file_meta.MediaStorageSOPClassUID = gsps_dataset.SOPClassUID
+    gsps_dataset.file_meta.MediaStorageSOPInstanceUID = gsps_dataset.SOPInstanceUID
+    gsps_dataset.file_meta.TransferSyntaxUID = ImplicitVRLittleEndian
+
+    return gsps_dataset
+
+
+def create_gsps(dicom_file_path, gsps_file_path, list_rectangle_coordinates, list_indic, logger, show_confidence=True, separate_layers=False):
     """
     Create a Grayscale Softcopy Presentation State (GSPS) from a DICOM file.
 
     Args:
         dicom_file_path (str): The path to the original DICOM file.
-        gsps_file_path (str): The path to save the GSPS file.
+        gsps_file_path (str): The path to save the GSPS file (written by the outbox).
         list_rectangle_coordinates (list): A list of rectangle coordinates (x, y, width, height).
         list_indic (list): The list of confidence for each rectangle.
         logger: The logger object for logging any errors.
-        precision (bool): If True, the confidence is displayed on the GSPS
+        show_confidence (bool): If True, the confidence is displayed on the GSPS
+        separate_layers (bool): If True, the confidence texts are put on their own graphic layer
+            so a single GSPS lets the viewer toggle them, otherwise they share the layer of the boxes
 
     Raises:
         Exception: If an error occurs while creating the GSPS.
@@ -23,151 +245,58 @@ def create_gsps(dicom_file_path, gsps_file_path, list_rectangle_coordinates, lis
     Returns:
         gsps_dataset: The GSPS dataset.
     """
-    
+
     try:
-        # Lecture du fichier dicom d'origine
-        dicom_dataset = pydicom.dcmread(dicom_file_path)
-
-        # Creation du dataset du GSPS
-        gsps_dataset = Dataset()
-        gsps_dataset.is_little_endian = True 
-        gsps_dataset.is_implicit_VR = True
-
-        # Patient
-        gsps_dataset.PatientName = dicom_dataset.PatientName
-        gsps_dataset.PatientID = dicom_dataset.PatientID
-        gsps_dataset.PatientAge = dicom_dataset.PatientAge
-        gsps_dataset.PatientSex = dicom_dataset.PatientSex
-
-        # General Study
-        gsps_dataset.StudyDate = dicom_dataset.StudyDate
-        gsps_dataset.StudyTime = dicom_dataset.StudyTime
-        gsps_dataset.AccessionNumber = dicom_dataset.AccessionNumber
-        gsps_dataset.StudyDescription = dicom_dataset.StudyDescription
-        gsps_dataset.StudyInstanceUID = dicom_dataset.StudyInstanceUID
-        gsps_dataset.StudyID = dicom_dataset.StudyID
-
-        # General Series
-        today = pydicom.valuerep.DA(datetime.date.today())
-        now = pydicom.valuerep.TM(datetime.datetime.now().time())
-        gsps_dataset.SeriesDate = today
-        gsps_dataset.SeriesTime = now
-        gsps_dataset.Modality = "PR"
-        gsps_dataset.SeriesInstanceUID = generate_uid()
-        gsps_dataset.SeriesNumber = dicom_dataset.SeriesNumber + 1  # Increment the series number
-
-        # Presentation State Identification 
-        gsps_dataset.InstanceNumber = dicom_dataset.InstanceNumber + 1  # Increment the instance number
-        gsps_dataset.ContentLabel = f"LESION" # {indic}"
-        gsps_dataset.PresentationCreationDate = today
-        gsps_dataset.PresentationCreationTime = now
-        gsps_dataset.ContentCreatorName = 'OPTIMOTO'
-
-        # Presentation State Relationship
-        gsps_dataset.ReferencedSeriesSequence = [Dataset()]
-        gsps_dataset.ReferencedSeriesSequence[0].ReferencedImageSequence = [Dataset()]
-        gsps_dataset.ReferencedSeriesSequence[0].SeriesInstanceUID = dicom_dataset.SeriesInstanceUID
-        gsps_dataset.ReferencedSeriesSequence[0].ReferencedImageSequence[0].ReferencedSOPClassUID = dicom_dataset.SOPClassUID
-        gsps_dataset.ReferencedSeriesSequence[0].ReferencedImageSequence[0].ReferencedSOPInstanceUID = dicom_dataset.SOPInstanceUID
-
-        # Displayed Area
-        gsps_dataset.DisplayedAreaSelectionSequence = [Dataset()]
-        gsps_dataset.DisplayedAreaSelectionSequence[0].DisplayedAreaTopLeftHandCorner = [0, 0]
-        gsps_dataset.DisplayedAreaSelectionSequence[0].DisplayedAreaBottomRightHandCorner = [dicom_dataset.Columns, dicom_dataset.Rows]
-        gsps_dataset.DisplayedAreaSelectionSequence[0].PresentationSizeMode = 'SCALE TO FIT'
-        gsps_dataset.DisplayedAreaSelectionSequence[0].PresentationPixelAspectRatio = [1, 1]
-
-
-        # Graphic Annotations - 1 per rectangle
-        nb_rectangles = len(list_rectangle_coordinates)
-        for i in range(nb_rectangles):
-            # on traite le i-ème rectangle avec son indicateur 
-            rectangle_coordinates = list_rectangle_coordinates[i]
-            indic = list_indic[i]
-
-            if i == 0:
-                gsps_dataset.GraphicAnnotationSequence = [Dataset()]
-            else :
-                gsps_dataset.GraphicAnnotationSequence += [Dataset()]
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicLayer = 'ANALYSIS LAYER'
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence = [Dataset()]
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].GraphicAnnotationUnits = 'PIXEL'
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].GraphicDimensions = 2
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].NumberOfGraphicPoints = 4
-            x, y, w, h = rectangle_coordinates
-            x1 = int(x)
-            x2 = int(x + w)
-            x3 = int(x + w)
-            x4 = int(x)
-            y1 = int(y)
-            y2 = int(y)
-            y3 = int(y + h)
-            y4 = int(y + h)
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].GraphicData = [x1, y1, x2, y2, x3, y3, x4, y4, x1, y1]
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].GraphicType = "POLYLINE"
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].GraphicFilled = "N"
-            
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].LineStyleSequence = [Dataset()]
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].LineStyleSequence[0].ShadowStyle = 'OFF'
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].LineStyleSequence[0].ShadowOffsetX = 0
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].LineStyleSequence[0].ShadowOffsetY = 0
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].LineStyleSequence[0].LineThickness = 2
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].LineStyleSequence[0].LineDashingStyle = 'SOLID'
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].LineStyleSequence[0].ShadowOpacity = 0
-            gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].LineStyleSequence[0].PatternOnOpacity = 1
-            # COULEUR
-            if indic > 0.8:
-                # l'annotation est VERTE
-                interpol = int((1-indic)/0.2*0xAAAA)
-                gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].LineStyleSequence[0].PatternOnColorCIELabValue = [0xFFFF, interpol, 0xFFFF]
-            elif indic > 0.65:
-                # l'annotation est JAUNE
-                # take a value linearly between 0xAAAA if indic = 0.8 and 0xE000 if indic=0.65
-                interpol1 = int((0.8-indic)/0.15*0x3556+0xAAAA)
-                interpol2 = int((0.8-indic)/0.15*(-4095)+0xFFFF)
-                gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].LineStyleSequence[0].PatternOnColorCIELabValue = [0xFFFF, interpol1, interpol2]
-            else : 
-                # l'annotation est ROUGE
-                interpol1 = int((0.65-indic)/0.15*(-4095)+0xFFFF)
-                interpol2 = int((0.65-indic)/0.15*(-8191)+0xFFFF)
-                gsps_dataset.GraphicAnnotationSequence[i].GraphicObjectSequence[0].LineStyleSequence[0].PatternOnColorCIELabValue = [interpol1, interpol2, 0xF000]
-
-            # [0xFFFF, 0x0000, 0xFFFF] : VERT
-            # [0xF000, 0xFFFF, 0xF000] : ROUGE
-            # [0xFFFF, 0xF000, 0xF000] : ORANGE
-            # [0xFFFF, 0xAAAA, 0xFFFF] : JAUNE
-
-            # On rajoute une annotation texte indiquant le niveau de précision
-            if show_confidence:
-                gsps_dataset.GraphicAnnotationSequence[i].TextObjectSequence = [Dataset()]
-                gsps_dataset.GraphicAnnotationSequence[i].TextObjectSequence[0].AnchorPointAnnotationUnits = 'PIXEL'
-                gsps_dataset.GraphicAnnotationSequence[i].TextObjectSequence[0].UnformattedTextValue = f"Précision: {int(round(indic,2)*100)}%"
-                gsps_dataset.GraphicAnnotationSequence[i].TextObjectSequence[0].AnchorPoint = [x ,y1 - 30]
-                gsps_dataset.GraphicAnnotationSequence[i].TextObjectSequence[0].AnchorPointVisibility = 'N'
-
-        # Graphic Layer
-        gsps_dataset.GraphicLayerSequence = [Dataset()]
-        gsps_dataset.GraphicLayerSequence[0].GraphicLayer = 'ANALYSIS LAYER'
-        gsps_dataset.GraphicLayerSequence[0].GraphicLayerOrder = 0
-
-        # Softocopy Presentation LUP 
-        gsps_dataset.PresentationLUTShape = 'IDENTITY'
-        
-        # file meta information
-        gsps_dataset.file_meta = Dataset()
-        
-        
-
-        # SOP Common
-        gsps_dataset.InstanceCreationDate = today
-        gsps_dataset.InstanceCreationTime = now
-        gsps_dataset.SOPClassUID = GrayscaleSoftcopyPresentationStateStorage
-        gsps_dataset.SOPInstanceUID = generate_uid()  # unique UID pour le GSPS qu'on cree
-        
-        return gsps_dataset
+        # Lecture de l'en-tete du fichier dicom d'origine, les pixels ne sont pas utilises
+        dicom_dataset = pydicom.dcmread(dicom_file_path, stop_before_pixels=True)
+
+        return _build_gsps([(dicom_dataset, list_rectangle_coordinates, list_indic)], show_confidence, separate_layers)
     except Exception as e:
         logger.warning(f"An error occurred while creating GSPS: {str(e)}")
 
 
+def create_multiframe_gsps(dicom_file_path, list_frames, logger, show_confidence=True, separate_layers=False):
+    """
+    Create a GSPS for a multi-frame image, each annotation referencing its frame with ReferencedFrameNumber.
 
+    Args:
+        dicom_file_path (str): The path to the original DICOM file.
+        list_frames (list): (frame_number, list_rectangle_coordinates, list_indic) for each frame, frame numbers starting at 1.
+        logger: The logger object for logging any errors.
+        show_confidence (bool): If True, the confidence is displayed on the GSPS
+        separate_layers (bool): If True, the confidence texts are put on their own graphic layer
 
+    Returns:
+        gsps_dataset: The GSPS dataset, None if an error occurred.
+    """
+    try:
+        dicom_dataset = pydicom.dcmread(dicom_file_path, stop_before_pixels=True)
+
+        return _build_gsps([(dicom_dataset, list_rectangle_coordinates, list_indic, frame_number) for frame_number, list_rectangle_coordinates, list_indic in list_frames], show_confidence, separate_layers)
+    except Exception as e:
+        logger.warning(f"An error occurred while creating multi-frame GSPS: {str(e)}")
+
+
+def create_study_gsps(list_images, logger, show_confidence=True, separate_layers=False):
+    """
+    Create a single GSPS covering several images of the same study.
+
+    Args:
+        list_images (list): (dicom_dataset, list_rectangle_coordinates, list_indic) for each image,
+            dicom_dataset being the header of the original image (read with stop_before_pixels),
+            optionally followed by the frame number for the frames of a multi-frame image.
+        logger: The logger object for logging any errors.
+        show_confidence (bool): If True, the confidence is displayed on the GSPS
+        separate_layers (bool): If True, the confidence texts are put on their own graphic layer
+
+    Returns:
+        gsps_dataset: The GSPS dataset, None if an error occurred.
+    """
+    try:
+        study_instance_uids = {image[0].StudyInstanceUID for image in list_images}
+        if len(study_instance_uids) != 1:
+            raise ValueError(f"the images belong to {len(study_instance_uids)} studies")
+
+        return _build_gsps(list_images, show_confidence, separate_layers)
+    except Exception as e:
+        logger.warning(f"An error occurred while creating study GSPS: {str(e)}")
@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+
+import pydicom
+
+from core.dicom.push_dicom import send_batch_to_pacs
+from core.usefull.logs import set_log_context
+
+
+class GspsOutbox:
+    """
+    Durable store-and-forward queue of GSPS objects waiting to be sent to the PACS.
+
+    The GSPS are written as DICOM files in the outbox directory, a background thread
+    sends them in batches (one association per batch) and removes them once the PACS
+    stored them. When the PACS is slow or down the sender retries with an exponential
+    backoff, the files left in the outbox are sent by the next run.
+    """
+
+    def __init__(self, directory, pacs_ip, pacs_port, aetitle, pacs_aetitle, logger,
+                 batch_size=10, min_backoff=1.0, max_backoff=300.0, poll_interval=1.0):
+        """
+        Initializes the outbox.
+
+        Args:
+            directory (str): The directory where the GSPS are written.
+            pacs_ip (str): The IP address of the PACS.
+            pacs_port (int): The port of the PACS.
+            aetitle (str): Our AE title.
+            pacs_aetitle (str): The AE title of the PACS.
+            logger: The logger object for logging messages.
+            batch_size (int): The maximum number of GSPS sent over one association.
+            min_backoff (float): The first retry delay in seconds after a failed batch.
+            max_backoff (float): The maximum retry delay in seconds.
+            poll_interval (float): How often the directory is scanned when idle, in seconds.
+        """
+        self.directory = directory
+        self.pacs = (pacs_ip, pacs_port, aetitle, pacs_aetitle)
+        self.logger = logger
+        self.batch_size = batch_size
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+
+        self.backoff = 0.0
+        self.sent = 0
+        self.failed_attempts = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._drain_deadline = None
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def set_pacs(self, pacs_ip, pacs_port, aetitle, pacs_aetitle):
+        """
+        Changes the PACS the next batches are sent to.
+        """
+        self.pacs = (pacs_ip, pacs_port, aetitle, pacs_aetitle)
+
+    def put(self, gsps_dataset, filename):
+        """
+        Writes a GSPS in the outbox. The write is atomic, the sender never sees a partial file.
+
+        Args:
+            gsps_dataset (pydicom.Dataset): The GSPS to send.
+            filename (str): The name of the file in the outbox.
+
+        Returns:
+            str: The path of the written file.
+        """
+        name = os.path.basename(filename)
+        if not name.endswith(".dcm"):
+            name += ".dcm"
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            # a previous GSPS for the same input is still waiting, keep both
+            path = path[:-len(".dcm")] + "_" + gsps_dataset.SOPInstanceUID + ".dcm"
+
+        part_path = os.path.join(self.directory, "." + os.path.basename(path) + ".part")
+        pydicom.dcmwrite(part_path, gsps_dataset, write_like_original=False)
+        os.replace(part_path, path)
+        self.logger.info(f"GSPS {gsps_dataset.SOPInstanceUID} written to outbox {path}")
+        self._wake.set()
+        return path
+
+    def pending(self):
+        """
+        Lists the GSPS waiting in the outbox, oldest first.
+
+        Returns:
+            list: The paths of the pending files.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".dcm"):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.stat(path).st_mtime, path))
+                except FileNotFoundError:
+                    continue
+        return [path for _, path in sorted(entries)]
+
+    def metrics(self):
+        """
+        Returns the state of the outbox.
+
+        Returns:
+            dict: depth (pending files), oldest_age (seconds), sent, failed_attempts and current backoff.
+        """
+        pending = self.pending()
+        oldest_age = 0.0
+        if pending:
+            try:
+                oldest_age = time.time() - os.stat(pending[0]).st_mtime
+            except FileNotFoundError:
+                pass
+        return {
+            "depth": len(pending),
+            "oldest_age": round(oldest_age, 3),
+            "sent": self.sent,
+            "failed_attempts": self.failed_attempts,
+            "backoff": self.backoff,
+        }
+
+    def start(self):
+        """
+        Starts the background sender, after removing the partial files left by an interrupted write.
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith(".part"):
+                os.remove(os.path.join(self.directory, name))
+                self.logger.warning(f"Partial GSPS {name} left in the outbox removed")
+        self._thread = threading.Thread(target=self._run, name="gsps-outbox", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Outbox sender started, {len(self.pending())} GSPS pending in {self.directory}")
+
+    def stop(self, timeout=30.0):
+        """
+        Tries to drain the outbox for at most `timeout` seconds then stops the sender.
+        The GSPS still pending stay on disk for the next run.
+
+        Args:
+            timeout (float): The maximum time spent draining, in seconds.
+        """
+        if self._thread is None:
+            return
+        self._drain_deadline = time.time() + timeout
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout + 5)
+        self._thread = None
+        self.logger.info(f"Outbox sender stopped, metrics: {self.metrics()}")
+
+    def _send_batch(self, paths):
+        datasets = []
+        batch_paths = []
+        for path in paths:
+            try:
+                datasets.append(pydicom.dcmread(path))
+                batch_paths.append(path)
+            except Exception as e:
+                # an unreadable file would block the queue forever, set it aside
+                self.logger.error(f"Unreadable GSPS {path} moved out of the outbox: {str(e)}")
+                os.replace(path, path + ".bad")
+
+        if not datasets:
+            return True
+
+        statuses = send_batch_to_pacs(datasets, *self.pacs, self.logger)
+        for path, status in zip(batch_paths, statuses):
+            if status:
+                os.remove(path)
+                self.sent += 1
+        return all(statuses)
+
+    def _send_guarded(self, paths):
+        """
+        Sends a batch, an unexpected error does not stop the sender: the files are then sent
+        one by one and the ones still failing are moved out of the outbox.
+        """
+        try:
+            return self._send_batch(paths)
+        except Exception as e:
+            self.logger.error(f"Outbox batch of {len(paths)} GSPS failed: {str(e)}")
+        sent = True
+        for path in paths:
+            try:
+                sent = self._send_batch([path]) and sent
+            except Exception as e:
+                self.logger.error(f"GSPS {path} cannot be sent, moved out of the outbox: {str(e)}")
+                try:
+                    os.replace(path, path + ".bad")
+                except OSError:
+                    pass
+        return sent
+
+    def _run(self):
+        set_log_context(stage="outbox")
+        while True:
+            stopping = self._stop.is_set()
+            if stopping and time.time() >= self._drain_deadline:
+                break
+
+            pending = self.pending()
+            if not pending:
+                if stopping:
+                    break
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+
+            if self._send_guarded(pending[:self.batch_size]):
+                self.backoff = 0.0
+            else:
+                self.failed_attempts += 1
+                self.backoff = min(self.max_backoff, max(self.min_backoff, self.backoff * 2))
+                self.logger.warning(f"Outbox batch failed, retrying in {self.backoff}s, metrics: {self.metrics()}")
+                if stopping:
+                    break
+                # a new GSPS does not cut the backoff short, only stop does
+                self._stop.wait(self.backoff)
+                continue
+            self.logger.info(f"Outbox metrics: {self.metrics()}")
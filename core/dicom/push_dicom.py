@@ -7,7 +7,7 @@ from pydicom.uid import (
     ExplicitVRBigEndian, ImplicitVRLittleEndian, ExplicitVRLittleEndian, JPEGBaseline8Bit
 )
 
-def send_dicom_to_pacs(dicom_dataset, pacs_ip, pacs_port, aetitle, pacs_aetitle, logger):
+def _build_ae(aetitle):
 
     # AE Configuration (Application Entity)
     ae = AE(ae_title=aetitle)
@@ -23,6 +23,13 @@ def send_dicom_to_pacs(dicom_dataset, pacs_ip, pacs_port, aetitle, pacs_aetitle,
     for sop_class in supported_contexts:
         ae.add_requested_context(sop_class, [ImplicitVRLittleEndian,ExplicitVRLittleEndian,JPEGBaseline8Bit,ExplicitVRBigEndian])
 
+    return ae
+
+
+def send_dicom_to_pacs(dicom_dataset, pacs_ip, pacs_port, aetitle, pacs_aetitle, logger):
+
+    ae = _build_ae(aetitle)
+
     dicom_dataset.file_meta.TransferSyntaxUID = ImplicitVRLittleEndian
 
     # Connection to PACS
@@ -45,4 +52,50 @@ def send_dicom_to_pacs(dicom_dataset, pacs_ip, pacs_port, aetitle, pacs_aetitle,
             return False
     else:
         logger.error(f"Failed to connect to PACS: {pacs_ip}:{pacs_port}")
-        return False
\ No newline at end of file
+        return False
+
+
+def send_batch_to_pacs(dicom_datasets, pacs_ip, pacs_port, aetitle, pacs_aetitle, logger):
+    """
+    Send several DICOM datasets to the PACS over a single association.
+
+    Args:
+        dicom_datasets (list): The datasets to send.
+        pacs_ip (str): The IP address of the PACS.
+        pacs_port (int): The port of the PACS.
+        aetitle (str): Our AE title.
+        pacs_aetitle (str): The AE title of the PACS.
+        logger: The logger object for logging messages.
+
+    Returns:
+        list: One boolean per dataset, True if it was stored by the PACS.
+    """
+    ae = _build_ae(aetitle)
+
+    assoc = ae.associate(pacs_ip, pacs_port, StoragePresentationContexts, ae_title=pacs_aetitle)
+    logger.info(f"Trying to connect to PACS: {pacs_ip}:{pacs_port}")
+
+    if not assoc.is_established:
+        logger.error(f"Failed to connect to PACS: {pacs_ip}:{pacs_port}")
+        return [False] * len(dicom_datasets)
+
+    logger.info(f"Connected to PACS: {pacs_ip}:{pacs_port}")
+    results = []
+    for dicom_dataset in dicom_datasets:
+        dicom_dataset.file_meta.TransferSyntaxUID = ImplicitVRLittleEndian
+        try:
+            status = assoc.send_c_store(dicom_dataset)
+            # success (0x0000) or warning (0xB...), the instance is stored in both cases
+            results.append(bool(status) and (status.Status == 0x0000 or status.Status & 0xF000 == 0xB000))
+        except Exception as e:
+            logger.error(f"Failed to send {dicom_dataset.SOPInstanceUID} to PACS: {pacs_ip}:{pacs_port}: {str(e)}")
+            results.append(False)
+        if not assoc.is_established:
+            # the PACS aborted the association, the remaining datasets are retried later
+            results += [False] * (len(dicom_datasets) - len(results))
+            break
+
+    if assoc.is_established:
+        assoc.release()
+    logger.info(f"Sent {sum(results)}/{len(dicom_datasets)} GSPS to PACS: {pacs_ip}:{pacs_port}")
+    return results
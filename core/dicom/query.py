@@ -0,0 +1,164 @@
+import json
+import os
+import time
+
+from pydicom.dataset import Dataset
+from pynetdicom import AE
+from pynetdicom.sop_class import StudyRootQueryRetrieveInformationModelFind
+from pydicom._storage_sopclass_uids import GrayscaleSoftcopyPresentationStateStorage
+
+
+def find_annotated(study_instance_uids, pacs_ip, pacs_port, aetitle, pacs_aetitle, logger, creator="OPTIMOTO", chunk_size=50, timeout=30.0):
+    """
+    Asks the PACS for the GSPS we already created in some studies, over a single association.
+
+    The studies are queried by chunks with a list of UIDs, at IMAGE level without SeriesInstanceUID
+    (relational query, supported by Orthanc).
+
+    Args:
+        study_instance_uids (list): The studies to check.
+        pacs_ip (str): The IP address of the PACS.
+        pacs_port (int): The port of the PACS.
+        aetitle (str): Our AE title.
+        pacs_aetitle (str): The AE title of the PACS.
+        logger: The logger object for logging messages.
+        creator (str): The ContentCreatorName of our GSPS.
+        chunk_size (int): The number of studies per C-FIND.
+        timeout (float): The connection, association and per-message timeout in seconds,
+            a slow PACS makes the query fail rather than block the run.
+
+    Returns:
+        dict: For each study with GSPS, "instances" the SOPInstanceUID of the annotated images and
+            "unreferenced" the number of GSPS returned without their references. None if the query failed.
+    """
+    ae = AE(ae_title=aetitle)
+    ae.connection_timeout = timeout
+    ae.acse_timeout = timeout
+    ae.dimse_timeout = timeout
+    ae.network_timeout = timeout
+    ae.add_requested_context(StudyRootQueryRetrieveInformationModelFind)
+    assoc = ae.associate(pacs_ip, pacs_port, ae_title=pacs_aetitle)
+    if not assoc.is_established:
+        logger.warning(f"Failed to connect to PACS {pacs_ip}:{pacs_port} to look for existing GSPS")
+        return None
+
+    study_instance_uids = list(study_instance_uids)
+    results = {}
+    try:
+        for start in range(0, len(study_instance_uids), chunk_size):
+            query = Dataset()
+            query.QueryRetrieveLevel = "IMAGE"
+            query.StudyInstanceUID = study_instance_uids[start:start + chunk_size]
+            query.SeriesInstanceUID = ""
+            query.SOPInstanceUID = ""
+            query.SOPClassUID = GrayscaleSoftcopyPresentationStateStorage
+            query.ContentCreatorName = creator
+            query.ReferencedSeriesSequence = []
+
+            for status, identifier in assoc.send_c_find(query, StudyRootQueryRetrieveInformationModelFind):
+                if not status:
+                    logger.warning("C-FIND to look for existing GSPS timed out or was aborted")
+                    return None
+                if status.Status in (0xFF00, 0xFF01):
+                    if identifier is None or "StudyInstanceUID" not in identifier:
+                        continue
+                    study = results.setdefault(identifier.StudyInstanceUID, {"instances": set(), "unreferenced": 0})
+                    referenced = [image.ReferencedSOPInstanceUID
+                                  for series in identifier.get("ReferencedSeriesSequence", [])
+                                  for image in series.get("ReferencedImageSequence", [])]
+                    if referenced:
+                        study["instances"].update(referenced)
+                    else:
+                        study["unreferenced"] += 1
+                elif status.Status != 0x0000:
+                    logger.warning(f"C-FIND to look for existing GSPS failed with status 0x{status.Status:04X}")
+                    return None
+        logger.info(f"Queried {len(study_instance_uids)} studies for existing GSPS, {len(results)} already annotated")
+        return results
+    finally:
+        assoc.release()
+
+
+class AnnotationIndex:
+    """
+    Local cache of the images already annotated on the PACS, kept in a JSON file.
+
+    A study is queried again once its answer is older than `ttl` seconds, the expired answers
+    are dropped when the file is loaded. The GSPS we queue are added at once, before the PACS
+    has them, and written with `save` at the end of the run.
+
+    An image is considered annotated only if one of our GSPS references its SOPInstanceUID:
+    the GSPS returned without their references do not skip any image.
+    """
+
+    def __init__(self, path, ttl=86400.0):
+        """
+        Initializes the index.
+
+        Args:
+            path (str): The JSON file of the cache.
+            ttl (float): How long the answer of the PACS for a study is reused, in seconds.
+        """
+        self.path = path
+        self.ttl = ttl
+        try:
+            with open(path) as f:
+                studies = json.load(f)
+        except (FileNotFoundError, ValueError):
+            studies = {}
+        now = time.time()
+        # the studies we added GSPS to without querying them ("checked" 0) are kept for a TTL too
+        self.studies = {uid: study for uid, study in studies.items() if now - max(study["checked"], study.get("added", 0)) <= ttl}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".part", "w") as f:
+            json.dump(self.studies, f)
+        os.replace(self.path + ".part", self.path)
+
+    def stale(self, study_instance_uids):
+        """
+        Returns:
+            list: The studies never queried or whose answer is older than the TTL.
+        """
+        now = time.time()
+        return [uid for uid in set(study_instance_uids) if uid not in self.studies or now - self.studies[uid]["checked"] > self.ttl]
+
+    def update(self, study_instance_uids, results, logger=None):
+        """
+        Stores the answer of `find_annotated` for the queried studies, the studies without answer having no GSPS.
+        """
+        now = time.time()
+        for uid in study_instance_uids:
+            result = results.get(uid, {"instances": (), "unreferenced": 0})
+            if result["unreferenced"] and logger is not None:
+                logger.warning(f"Study {uid} has {result['unreferenced']} GSPS returned without their referenced images, its images are processed")
+            instances = set(result["instances"]) | set(self.studies.get(uid, {}).get("instances", ()))
+            self.studies[uid] = {"checked": now, "instances": sorted(instances), "unreferenced": result["unreferenced"]}
+        self.save()
+
+    def add(self, study_instance_uid, sop_instance_uids):
+        """
+        Records the images of a GSPS we just queued, written to the file by `save`.
+        """
+        study = self.studies.setdefault(study_instance_uid, {"checked": 0, "instances": [], "unreferenced": 0})
+        study["instances"] = sorted(set(study["instances"]) | set(sop_instance_uids))
+        study["added"] = time.time()
+
+    def add_gsps(self, gsps_dataset):
+        """
+        Records the images referenced by a GSPS we just queued.
+        """
+        self.add(gsps_dataset.StudyInstanceUID, [image.ReferencedSOPInstanceUID
+                                                 for series in gsps_dataset.ReferencedSeriesSequence
+                                                 for image in series.ReferencedImageSequence])
+
+    def is_annotated(self, dicom_dataset):
+        """
+        Checks if an image already has one of our GSPS.
+
+        Args:
+            dicom_dataset (pydicom.Dataset): The header of the image.
+        """
+        study = self.studies.get(dicom_dataset.StudyInstanceUID)
+        return study is not None and dicom_dataset.SOPInstanceUID in study["instances"]
@@ -0,0 +1,115 @@
+import collections
+import os
+
+import pydicom
+
+
+# the attributes the GSPS creation reads from the header of the image, an input without one of them
+# would only fail at the GSPS stage; the UIDs must also have a value
+GSPS_TAGS = ("PatientName", "PatientID", "PatientAge", "PatientSex", "StudyDate", "StudyTime", "AccessionNumber",
+             "StudyDescription", "StudyID", "SeriesNumber", "InstanceNumber", "Rows", "Columns")
+GSPS_UIDS = ("SOPClassUID", "SOPInstanceUID", "StudyInstanceUID", "SeriesInstanceUID")
+
+
+class TriageRules:
+    """
+    Routing rules applied on the DICOM header before the pixels are decoded.
+    """
+
+    def __init__(self, sop_classes=(), modalities=(), excluded_modalities=(), min_rows=0, min_cols=0,
+                 required_tags=(), action="skip", quarantine_directory="quarantine"):
+        """
+        Initializes the rules.
+
+        Args:
+            sop_classes (list): The accepted SOPClassUID, any if empty.
+            modalities (list): The accepted Modality, any if empty.
+            excluded_modalities (list): The rejected Modality (PR, SR...).
+            min_rows (int): The minimum number of rows.
+            min_cols (int): The minimum number of columns.
+            required_tags (list): The keywords of the tags that must be present with a value,
+                in addition to the tags needed by the GSPS (GSPS_TAGS and GSPS_UIDS).
+            action (str): "skip" to delete the rejected inputs, "quarantine" to move them aside.
+            quarantine_directory (str): Where the rejected inputs are moved with the quarantine action.
+        """
+        if action not in ("skip", "quarantine"):
+            raise ValueError(f"Invalid triage action {action}, expected skip or quarantine")
+        self.sop_classes = set(sop_classes)
+        self.modalities = set(modalities)
+        self.excluded_modalities = set(excluded_modalities)
+        self.min_rows = min_rows
+        self.min_cols = min_cols
+        self.required_tags = list(dict.fromkeys(list(GSPS_UIDS) + list(required_tags)))
+        self.action = action
+        self.quarantine_directory = quarantine_directory
+
+
+def triage_dicom(path, rules):
+    """
+    Checks if a DICOM file is an eligible input by reading only its header.
+
+    Args:
+        path (str): The path to the DICOM file.
+        rules (TriageRules): The routing rules.
+
+    Returns:
+        tuple: The header (None if it could not be read) and the rejection reason (None if accepted).
+    """
+    try:
+        header = pydicom.dcmread(path, stop_before_pixels=True)
+    except Exception:
+        return None, "unreadable"
+
+    if rules.sop_classes and header.get("SOPClassUID") not in rules.sop_classes:
+        return header, "sop_class"
+    modality = header.get("Modality")
+    if modality in rules.excluded_modalities or (rules.modalities and modality not in rules.modalities):
+        return header, "modality"
+    for keyword in rules.required_tags:
+        if header.get(keyword) in (None, ""):
+            return header, f"missing_{keyword}"
+    for keyword in GSPS_TAGS:
+        if keyword not in header:
+            return header, f"missing_{keyword}"
+    if int(header.get("Rows", 0)) < rules.min_rows or int(header.get("Columns", 0)) < rules.min_cols:
+        return header, "size"
+    return header, None
+
+
+def reject_file(path, reason, rules, logger):
+    """
+    Deletes or quarantines a rejected input.
+
+    Args:
+        path (str): The path to the rejected file.
+        reason (str): The rejection reason.
+        rules (TriageRules): The routing rules.
+        logger: The logger object for logging messages.
+    """
+    try:
+        if rules.action == "quarantine":
+            os.makedirs(rules.quarantine_directory, exist_ok=True)
+            destination = os.path.join(rules.quarantine_directory, os.path.basename(path))
+            # a file rejected earlier with the same name is kept
+            stem, extension = os.path.splitext(destination)
+            counter = 1
+            while os.path.exists(destination):
+                destination = f"{stem}_{counter}{extension}"
+                counter += 1
+            os.replace(path, destination)
+            logger.info(f"File {path} rejected ({reason}), moved to {destination}")
+        else:
+            os.remove(path)
+            logger.info(f"File {path} rejected ({reason}), skipped")
+    except Exception as e:
+        logger.warning(f"Failed to reject file {path}: {str(e)}")
+
+
+class TriageCounters(collections.Counter):
+    """
+    Counts the accepted inputs and the rejected ones per reason.
+    """
+
+    def summary(self):
+        rejected = {reason: count for reason, count in self.items() if reason != "accepted"}
+        return f"{self['accepted']} accepted, {sum(rejected.values())} rejected {rejected}"
@@ -0,0 +1,183 @@
+import collections
+import concurrent.futures
+import queue
+import threading
+import time
+
+
+def _percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+class LatencyMetrics:
+    """
+    Latencies of the last requests per stage, with the share of requests over the SLO.
+    """
+
+    def __init__(self, slo_ms=1000.0, window=1000):
+        """
+        Initializes the metrics.
+
+        Args:
+            slo_ms (float): The target end-to-end latency of a request, in milliseconds.
+            window (int): How many of the last values are kept per stage for the percentiles.
+        """
+        self.slo_ms = slo_ms
+        self.window = window
+        self.lock = threading.Lock()
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=window))
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.counters = collections.Counter()
+        self.in_flight = 0
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.latencies[stage].append(seconds * 1000)
+            if stage == "total":
+                self.counters["requests"] += 1
+                if seconds * 1000 > self.slo_ms:
+                    self.counters["slo_violations"] += 1
+
+    def record_batch(self, size):
+        with self.lock:
+            self.batch_sizes.append(size)
+            self.counters["batches"] += 1
+
+    def increment(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def add_in_flight(self, value):
+        with self.lock:
+            self.in_flight += value
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: p50/p95/p99/max per stage in milliseconds over the window, the SLO compliance
+                over the window and since the start, the mean batch size and the counters.
+        """
+        with self.lock:
+            stages = {}
+            for stage, values in self.latencies.items():
+                ordered = sorted(values)
+                stages[stage] = {
+                    "count": len(ordered),
+                    "p50_ms": _percentile(ordered, 0.50),
+                    "p95_ms": _percentile(ordered, 0.95),
+                    "p99_ms": _percentile(ordered, 0.99),
+                    "max_ms": ordered[-1],
+                }
+            totals = self.latencies.get("total", ())
+            within = sum(1 for value in totals if value <= self.slo_ms)
+            return {
+                "slo": {
+                    "target_ms": self.slo_ms,
+                    "window_compliance": within / len(totals) if totals else 1.0,
+                    "violations": self.counters["slo_violations"],
+                },
+                "stages": stages,
+                "batch_size_mean": sum(self.batch_sizes) / len(self.batch_sizes) if self.batch_sizes else 0.0,
+                "in_flight": self.in_flight,
+                "counters": dict(self.counters),
+            }
+
+
+class MicroBatcher:
+    """
+    Merges the images of concurrent requests into batches for the model.
+
+    A batch is run as soon as it holds `max_batch_size` images or when its oldest image
+    has waited `max_wait` seconds.
+    """
+
+    def __init__(self, predict_batch, logger, max_batch_size=8, max_wait=0.02, metrics=None):
+        """
+        Initializes the batcher.
+
+        Args:
+            predict_batch (callable): Called with a list of images, returns the list of boxes of each image.
+            logger: The logger object for logging messages.
+            max_batch_size (int): The maximum number of images per batch.
+            max_wait (float): The maximum time in seconds an image waits for the batch to fill.
+            metrics (LatencyMetrics, optional): Where the batch sizes and the queue/predict times are recorded.
+        """
+        self.predict_batch = predict_batch
+        self.logger = logger
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.metrics = metrics
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def submit(self, image):
+        """
+        Queues an image for the next batch.
+
+        Returns:
+            concurrent.futures.Future: Resolved with the boxes of the image.
+        """
+        future = concurrent.futures.Future()
+        self.queue.put((time.perf_counter(), image, future))
+        return future
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Runs the images already queued, then stops the batching thread.
+        """
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def _collect(self):
+        first = self.queue.get()
+        if first is None:
+            return None, True
+        batch = [first]
+        deadline = first[0] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if not batch:
+                continue
+            start_time = time.perf_counter()
+            # the images of a batch must have the same size
+            groups = collections.defaultdict(list)
+            for item in batch:
+                groups[(item[1].shape, item[1].dtype.str)].append(item)
+            for items in groups.values():
+                try:
+                    results = self.predict_batch([image for _, image, _ in items])
+                except Exception as e:
+                    self.logger.error(f"Batch of {len(items)} images failed: {str(e)}")
+                    for _, _, future in items:
+                        future.set_exception(e)
+                    continue
+                for (_, _, future), boxes in zip(items, results):
+                    future.set_result(boxes)
+            if self.metrics is not None:
+                self.metrics.record_batch(len(batch))
+                self.metrics.record("predict", time.perf_counter() - start_time)
+                for queued, _, _ in batch:
+                    self.metrics.record("queue", start_time - queued)
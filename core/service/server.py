@@ -0,0 +1,345 @@
+import base64
+import configparser
+import http.server
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import pydicom
+
+from core.convertion.convert import Dicom_to_array, boxes_to_image
+from core.dicom.bbox_to_gsps import create_gsps
+from core.dicom.outbox import GspsOutbox
+from core.dicom.triage import triage_dicom
+from core.service.batcher import LatencyMetrics, MicroBatcher
+from core.usefull.logs import setup_logging, set_log_context, clear_log_context
+from core.usefull.models import create_model
+from core.usefull.reload import ModelHolder, HotReloader
+from core.usefull.settings import Settings
+
+
+class RequestError(Exception):
+    """
+    A request that cannot be processed, answered with its HTTP status.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class DetectionService:
+    """
+    Runs the conversion, the model and the GSPS creation of main.py for one DICOM file at a time,
+    the model calls of concurrent requests being merged by a MicroBatcher.
+    """
+
+    def __init__(self, holder, logger, outbox=None):
+        """
+        Initializes the service.
+
+        The [SERVICE] settings are read once, the others are taken from the holder for each
+        request, and the model for each batch, so that a hot reload applies to the next ones.
+
+        Args:
+            holder (ModelHolder): The settings and the model, with a predict_batch method.
+            logger: The logger object for logging messages.
+            outbox (GspsOutbox, optional): Where the GSPS are queued when a request asks to push them to the PACS.
+        """
+        self.holder = holder
+        self.logger = logger
+        self.outbox = outbox
+        settings, _ = holder.snapshot()
+        self.request_timeout = settings.service.request_timeout
+        self.metrics = LatencyMetrics(settings.service.slo_ms, settings.service.metrics_window)
+        self.batcher = MicroBatcher(
+            self._predict_batch,
+            logger,
+            max_batch_size=settings.service.max_batch_size,
+            max_wait=settings.service.max_wait_ms / 1000,
+            metrics=self.metrics,
+        )
+
+    def _predict_batch(self, images):
+        # the whole batch runs on the model current when it starts
+        settings, model = self.holder.snapshot()
+        return model.predict_batch(images, conf=settings.default.min_confidence, logger=self.logger)
+
+    def start(self):
+        self.batcher.start()
+
+    def stop(self):
+        self.batcher.stop(timeout=self.request_timeout)
+
+    def detect(self, path, gsps=False, push=False, filename=None):
+        """
+        Finds the lesions of a DICOM file.
+
+        Args:
+            path (str): The path to the DICOM file.
+            gsps (bool): If True, the GSPS is built and returned.
+            push (bool): If True, the GSPS is built and queued in the outbox for the PACS.
+            filename (str, optional): The name used for the GSPS in the outbox. Defaults to the file name.
+
+        Returns:
+            tuple: The JSON answer and the GSPS dataset (None if not built).
+
+        Raises:
+            RequestError: If the file is not an eligible DICOM.
+        """
+        filename = filename or os.path.basename(path)
+        set_log_context(file=filename, stage="triage")
+        settings, _ = self.holder.snapshot()
+        width, height = settings.default.image_width, settings.default.image_height
+        try:
+            timings = {}
+            start_time = time.perf_counter()
+            header, reason = triage_dicom(path, settings.triage)
+            if reason is not None:
+                raise RequestError(422, f"Input rejected by the triage: {reason}")
+
+            set_log_context(stage="convert")
+            image, original_width, original_height = Dicom_to_array(path, self.logger, width=width, height=height, uint=settings.default.uint, memory_budget=settings.conversion.memory_budget * 1024 * 1024)
+            if image is None:
+                raise RequestError(422, "The DICOM file could not be converted")
+            timings["convert"] = time.perf_counter() - start_time
+
+            set_log_context(stage="predict")
+            predict_start = time.perf_counter()
+            bboxes = self.batcher.submit(image).result(timeout=self.request_timeout)
+            timings["model"] = time.perf_counter() - predict_start
+            list_rectangle = boxes_to_image(bboxes, original_width, original_height, width=width, height=height)
+
+            gsps_dataset = None
+            if gsps or push:
+                set_log_context(stage="gsps")
+                gsps_start = time.perf_counter()
+                gsps_dataset = create_gsps(path, None, list_rectangle, [box["conf"] for box in bboxes], self.logger, separate_layers=True)
+                if gsps_dataset is None:
+                    raise RequestError(422, "The GSPS could not be created for this file")
+                timings["gsps"] = time.perf_counter() - gsps_start
+            if push:
+                set_log_context(stage="send")
+                self.outbox.put(gsps_dataset, os.path.splitext(filename)[0] + "_gsps.dcm")
+
+            for stage, seconds in timings.items():
+                self.metrics.record(stage, seconds)
+            answer = {
+                "file": filename,
+                "SOPInstanceUID": header.SOPInstanceUID,
+                "boxes": [{"x": x, "y": y, "w": w, "h": h, "conf": box["conf"]} for (x, y, w, h), box in zip(list_rectangle, bboxes)],
+                "queued": push,
+                "timings_ms": {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()},
+            }
+            self.logger.info(f"Found {len(bboxes)} bounding boxes for {filename}")
+            return answer, gsps_dataset
+        finally:
+            clear_log_context()
+
+
+def gsps_bytes(gsps_dataset):
+    buffer = io.BytesIO()
+    pydicom.dcmwrite(buffer, gsps_dataset, write_like_original=False)
+    return buffer.getvalue()
+
+
+class DetectionRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    POST /predict with a DICOM body (Content-Type: application/dicom) or a JSON body {"path": ...},
+    options gsps, push and format=dicom in the query string or the JSON body.
+    GET /metrics and GET /health.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        self.server.logger.debug("HTTP %s - %s", self.address_string(), format % args)
+
+    def _send(self, status, body, content_type="application/json", headers=()):
+        if content_type == "application/json":
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/health":
+            self._send(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            metrics = service.metrics.snapshot()
+            metrics["batch_queue_depth"] = service.batcher.depth()
+            if service.outbox is not None:
+                metrics["outbox"] = service.outbox.metrics()
+            self._send(200, metrics)
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != "/predict":
+            self._send(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        if length > self.server.max_upload:
+            self.close_connection = True
+            self._send(413, {"error": f"body larger than {self.server.max_upload} bytes"})
+            return
+        # above the limit the request is refused at once rather than queued, without reading the body
+        if not self.server.slots.acquire(blocking=False):
+            self.close_connection = True
+            self.server.service.metrics.increment("rejected")
+            self._send(503, {"error": "too many concurrent requests"}, headers=[("Retry-After", "1")])
+            return
+
+        service = self.server.service
+        service.metrics.add_in_flight(1)
+        start_time = time.perf_counter()
+        upload_path = None
+        try:
+            body = self.rfile.read(length)
+            options = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                request = json.loads(body)
+                options.update(request)
+                path = request.get("path")
+                if not self.server.is_allowed(path):
+                    raise RequestError(403, f"File {path} is not in the allowed directories")
+                if not os.path.isfile(path):
+                    raise RequestError(404, f"File {path} not found")
+                filename = os.path.basename(path)
+            else:
+                file_descriptor, upload_path = tempfile.mkstemp(suffix=".dcm", dir=self.server.upload_directory)
+                with os.fdopen(file_descriptor, "wb") as f:
+                    f.write(body)
+                path = upload_path
+                filename = options.get("filename") or os.path.basename(upload_path)
+
+            flag = lambda name: str(options.get(name, "false")).lower() in ("1", "true", "yes")
+            as_dicom = options.get("format") == "dicom"
+            if flag("push") and service.outbox is None:
+                raise RequestError(400, "push to the PACS is disabled")
+            answer, gsps_dataset = service.detect(path, gsps=flag("gsps") or as_dicom, push=flag("push"), filename=filename)
+
+            if as_dicom:
+                self._send(200, gsps_bytes(gsps_dataset), content_type="application/dicom")
+            else:
+                if gsps_dataset is not None:
+                    answer["gsps"] = base64.b64encode(gsps_bytes(gsps_dataset)).decode()
+                self._send(200, answer)
+        except RequestError as e:
+            service.metrics.increment(f"status_{e.status}")
+            self._send(e.status, {"error": str(e)})
+        except Exception as e:
+            service.metrics.increment("status_500")
+            self.server.logger.error(f"Request failed: {str(e)}")
+            self._send(500, {"error": str(e)})
+        finally:
+            # the failed requests count in the latencies too
+            service.metrics.record("total", time.perf_counter() - start_time)
+            if upload_path is not None:
+                os.remove(upload_path)
+            service.metrics.add_in_flight(-1)
+            self.server.slots.release()
+
+
+class DetectionServer(http.server.ThreadingHTTPServer):
+    """
+    HTTP server with one thread per connection and at most `max_concurrent` requests being processed.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, service, logger, max_concurrent=16, max_upload=200 * 1024 * 1024, upload_directory="tmp_service", allowed_directories=()):
+        super().__init__(address, DetectionRequestHandler)
+        self.service = service
+        self.logger = logger
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.max_upload = max_upload
+        self.upload_directory = upload_directory
+        # the directories the JSON requests can read files from, none by default
+        self.allowed_directories = [os.path.realpath(directory) for directory in allowed_directories]
+        os.makedirs(upload_directory, exist_ok=True)
+
+    def is_allowed(self, path):
+        """
+        Checks that a path given in a request is inside one of the allowed directories, after resolving the links.
+        """
+        if not isinstance(path, str) or not path:
+            return False
+        path = os.path.realpath(path)
+        return any(os.path.commonpath([path, directory]) == directory for directory in self.allowed_directories)
+
+
+if __name__ == '__main__':
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    try:
+        settings = Settings(config)
+    except ValueError as e:
+        logger, log_listener = setup_logging(config, name="service", console=True)
+        logger.error(f"Invalid config.ini: {str(e)}")
+        exit()
+    logger, log_listener = setup_logging(config, name="service", console=settings.default.debug_mode)
+
+    set_log_context(stage="load")
+    model_holder = ModelHolder(settings, create_model(settings, logger))
+    clear_log_context()
+
+    outbox = None
+    if settings.service.push:
+        outbox = GspsOutbox(
+            settings.outbox.directory,
+            settings.default.pacs_ip,
+            settings.default.pacs_port,
+            settings.default.aetitle,
+            settings.default.pacs_aetitle,
+            logger,
+            batch_size=settings.outbox.batch_size,
+            min_backoff=settings.outbox.min_backoff,
+            max_backoff=settings.outbox.max_backoff,
+        )
+        outbox.start()
+
+    def on_swap(new_settings):
+        if outbox is not None:
+            outbox.set_pacs(new_settings.default.pacs_ip, new_settings.default.pacs_port, new_settings.default.aetitle, new_settings.default.pacs_aetitle)
+        if "SERVICE" in new_settings.changed_sections(settings):
+            logger.warning("The [SERVICE] settings changed, they are applied after a restart of the service")
+
+    reloader = None
+    if settings.reload.enabled:
+        reloader = HotReloader(model_holder, logger, interval=settings.reload.interval, on_swap=on_swap)
+        reloader.start()
+
+    service = DetectionService(model_holder, logger, outbox=outbox)
+    service.start()
+    server = DetectionServer(
+        (settings.service.host, settings.service.port),
+        service,
+        logger,
+        max_concurrent=settings.service.max_concurrent,
+        max_upload=settings.service.max_upload_mb * 1024 * 1024,
+        allowed_directories=settings.service.allowed_directories,
+    )
+    logger.info(f"Detection service listening on {settings.service.host}:{settings.service.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if reloader is not None:
+            reloader.stop()
+        service.stop()
+        if outbox is not None:
+            outbox.stop(timeout=settings.outbox.drain_timeout)
+        logger.info("Detection service stopped")
@@ -0,0 +1,104 @@
+import os
+import queue
+import threading
+
+import cv2
+
+from core.convertion.convert import to_uint8
+
+
+def draw_boxes(image, bboxes):
+    """
+    Draws the bounding boxes and their confidence on a copy of the image given to the model.
+
+    Args:
+        image (numpy.ndarray): The grayscale image returned by Dicom_to_array.
+        bboxes (list): The boxes returned by the model.
+
+    Returns:
+        numpy.ndarray: The BGR overlay.
+    """
+    overlay = cv2.cvtColor(to_uint8(image), cv2.COLOR_GRAY2BGR)
+    for box in bboxes:
+        x1, y1 = int(box["x"]), int(box["y"])
+        x2, y2 = int(box["x"] + box["w"]), int(box["y"] + box["h"])
+        cv2.rectangle(overlay, (x1, y1), (x2, y2), (0, 0, 255), 1)
+        cv2.putText(overlay, str(round(box["conf"], 2)), (x1, max(y1 - 3, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1, cv2.LINE_AA)
+    return overlay
+
+
+class DebugWriter:
+    """
+    Writes the debug overlays in a background thread so that debug mode does not slow the pipeline.
+
+    The queue is bounded: when the writer falls behind, the new overlays are dropped.
+    """
+
+    def __init__(self, directory, logger, queue_size=8):
+        """
+        Initializes the writer.
+
+        Args:
+            directory (str): Where the overlays are written.
+            logger: The logger object for logging messages.
+            queue_size (int): The number of overlays waiting to be written before the next ones are dropped.
+        """
+        self.directory = directory
+        self.logger = logger
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, image, bboxes, filename):
+        """
+        Queues the overlay of an image, without waiting.
+
+        Args:
+            image (numpy.ndarray): The image given to the model. It must not be modified afterwards.
+            bboxes (list): The boxes returned by the model.
+            filename (str): The input file name, the overlay is written as <name>.png.
+
+        Returns:
+            bool: False if the overlay was dropped.
+        """
+        try:
+            self.queue.put_nowait((image, list(bboxes), filename))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            self.logger.debug(f"Debug overlay of {filename} dropped, {self.dropped} dropped so far")
+            return False
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="debug-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=10.0):
+        """
+        Writes the queued overlays, then stops the thread.
+        """
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+        self.logger.info(f"Debug overlays: {self.written} written, {self.dropped} dropped, {self.failed} failed")
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            image, bboxes, filename = item
+            path = os.path.join(self.directory, os.path.splitext(filename)[0] + ".png")
+            try:
+                # imwrite returns False instead of raising when the file cannot be written
+                if not cv2.imwrite(path, draw_boxes(image, bboxes)):
+                    raise OSError("cv2.imwrite returned False")
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                self.logger.warning(f"Failed to write debug overlay {path}: {str(e)}")
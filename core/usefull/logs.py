@@ -0,0 +1,185 @@
+import atexit
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+_current_file = contextvars.ContextVar("log_file", default=None)
+_current_stage = contextvars.ContextVar("log_stage", default=None)
+# the listeners started by setup_logging and not stopped yet
+_running_listeners = set()
+
+
+def set_log_context(file=None, stage=None):
+    """
+    Sets the file and stage attached to every record emitted from the current context.
+
+    Args:
+        file (str, optional): The input file being processed. Left unchanged if None.
+        stage (str, optional): The pipeline stage (triage, convert, predict, gsps, send...). Left unchanged if None.
+    """
+    if file is not None:
+        _current_file.set(file)
+    if stage is not None:
+        _current_stage.set(stage)
+
+
+def clear_log_context():
+    """
+    Removes the file and stage from the current context.
+    """
+    _current_file.set(None)
+    _current_stage.set(None)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Adds the `file` and `stage` fields to the records.
+
+    The filter is attached to the queue handler so the fields are read in the
+    thread that logs, not in the background writer.
+    """
+
+    def filter(self, record):
+        if not hasattr(record, "file"):
+            record.file = _current_file.get()
+        if not hasattr(record, "stage"):
+            record.stage = _current_stage.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats the records as one JSON object per line.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": getattr(record, "file", None),
+            "stage": getattr(record, "stage", None),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SizedTimedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Rotating file handler that rolls over when the file reaches `maxBytes`
+    or when a new period of `interval` seconds starts.
+
+    Periods are aligned on the epoch so that the short-lived processes started
+    by `run.sh` agree on when a file is too old, using the file modification time.
+    """
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, interval=0, encoding=None):
+        super().__init__(filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding, delay=True)
+        self.interval = interval
+        if interval > 0 and os.path.exists(self.baseFilename):
+            self.period = int(os.stat(self.baseFilename).st_mtime // interval)
+        else:
+            self.period = self._current_period()
+
+    def _current_period(self):
+        return int(time.time() // self.interval) if self.interval > 0 else 0
+
+    def shouldRollover(self, record):
+        if self.interval > 0 and self._current_period() != self.period:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.period = self._current_period()
+
+
+class FastQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves the formatting to the background listener.
+
+    The default handler formats and copies each record in the calling thread,
+    here only the message arguments are merged so the record can be queued as is.
+    """
+
+    def prepare(self, record):
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def stop_logging(listener):
+    """
+    Flushes the pending records and stops the background writer. Safe to call twice.
+
+    Args:
+        listener (logging.handlers.QueueListener): The listener returned by `setup_logging`.
+    """
+    if listener in _running_listeners:
+        _running_listeners.discard(listener)
+        listener.stop()
+
+
+def setup_logging(config, name="main", console=False):
+    """
+    Configures a non-blocking logger writing JSON records to a rotating file.
+
+    The calling threads only push the records on a queue, a background listener
+    formats them and writes them to `log/<name>.log`, one file per process so that
+    two processes never rotate the same file.
+
+    Args:
+        config (configparser.ConfigParser): The parsed config.ini, [LOG] section.
+        name (str): The name of the logger and of its file.
+        console (bool): If True, the records are also shown in the terminal (debug mode).
+
+    Returns:
+        tuple: The logger and the queue listener (already started, stopped at exit).
+    """
+    section = config["LOG"] if config.has_section("LOG") else config["DEFAULT"]
+
+    directory = section.get("directory", "log")
+    os.makedirs(directory, exist_ok=True)
+
+    file_handler = SizedTimedRotatingFileHandler(
+        os.path.join(directory, f"{name}.log"),
+        maxBytes=section.getint("max_bytes", 10 * 1024 * 1024),
+        backupCount=section.getint("backup_count", 10),
+        interval=section.getint("rotate_seconds", 86400),
+        encoding="utf-8",
+    )
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = FastQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    logger = logging.getLogger(name)
+    logger.setLevel(section.get("level", "INFO").upper())
+    logger.handlers = [queue_handler]
+    logger.propagate = False
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    _running_listeners.add(listener)
+    atexit.register(stop_logging, listener)
+    return logger, listener
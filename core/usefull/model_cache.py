@@ -0,0 +1,141 @@
+import hashlib
+import importlib.metadata
+import json
+import os
+import platform
+import time
+
+
+def _file_digest(path, index):
+    """
+    Returns the sha256 of a file, reusing the digest stored in the index while its size and mtime are unchanged.
+    """
+    stat = os.stat(path)
+    entry = index.get(path)
+    if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        return entry["sha256"]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    index[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": digest.hexdigest()}
+    return index[path]["sha256"]
+
+
+def _weight_files(path):
+    if os.path.isdir(path):
+        return sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    return [path]
+
+
+def library_versions(libraries):
+    """
+    Returns the installed version of each library, "none" if it is not installed.
+    """
+    versions = {}
+    for library in libraries:
+        try:
+            versions[library] = importlib.metadata.version(library)
+        except importlib.metadata.PackageNotFoundError:
+            versions[library] = "none"
+    return versions
+
+
+def cache_key(cache_dir, weight_paths, libraries, extra=()):
+    """
+    Computes the key of a cached artifact from the weights, the library versions and the build options.
+
+    The digests of the weight files are kept in `cache_dir/digests.json` so that they are only
+    recomputed when a file changes.
+
+    Args:
+        cache_dir (str): The cache directory.
+        weight_paths (list): The weight files or directories the artifact is built from.
+        libraries (list): The libraries the artifact depends on (torch, ultralytics...).
+        extra (tuple): The build options (input size, quantization...).
+
+    Returns:
+        str: The key of the artifact.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, "digests.json")
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        index = {}
+
+    key = hashlib.sha256()
+    for weight_path in weight_paths:
+        for path in _weight_files(weight_path):
+            key.update(path.encode())
+            key.update(_file_digest(path, index).encode())
+    key.update(json.dumps(library_versions(libraries), sort_keys=True).encode())
+    key.update(platform.machine().encode())
+    key.update(json.dumps([str(value) for value in extra]).encode())
+
+    with open(index_path + ".part", "w") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".part", index_path)
+    return key.hexdigest()[:16]
+
+
+def artifact_path(cache_dir, name, key, suffix):
+    """
+    Returns the path of a cached artifact, e.g. model/cache/yolo-<key>.torchscript
+    """
+    return os.path.join(cache_dir, f"{name}-{key}{suffix}")
+
+
+def load_or_build(path, build, load, logger, fallback=None):
+    """
+    Loads a cached artifact, building it first if it is missing or cannot be loaded.
+
+    Args:
+        path (str): The path of the artifact.
+        build (callable): Called with the path, writes the artifact.
+        load (callable): Called with the path, returns the loaded artifact.
+        logger: The logger object for logging messages.
+        fallback (callable, optional): Called without arguments when the artifact cannot be built,
+            returns the uncached model. If None the error is raised.
+
+    Returns:
+        The loaded artifact.
+    """
+    if os.path.exists(path):
+        try:
+            start_time = time.time()
+            artifact = load(path)
+            logger.info(f"Loaded cached model {path} in {time.time() - start_time:.3f}s")
+            return artifact
+        except Exception as e:
+            logger.warning(f"Cached model {path} could not be loaded, rebuilding it: {str(e)}")
+
+    start_time = time.time()
+    try:
+        build(path)
+    except Exception as e:
+        if fallback is None:
+            raise
+        logger.warning(f"Cached model {path} could not be built, using the uncached model: {str(e)}")
+        return fallback()
+    logger.info(f"Built cached model {path} in {time.time() - start_time:.3f}s")
+    return load(path)
+
+
+def warm_up(function, logger, name="model"):
+    """
+    Runs a first inference on a dummy input so that the first real image does not pay the lazy initializations.
+
+    Args:
+        function (callable): The dummy inference, without arguments.
+        logger: The logger object for logging messages.
+        name (str): The name of the model in the logs.
+    """
+    start_time = time.time()
+    try:
+        function()
+        logger.info(f"Warmed up {name} in {time.time() - start_time:.3f}s")
+    except Exception as e:
+        logger.warning(f"Warm-up of {name} failed: {str(e)}")
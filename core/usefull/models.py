@@ -0,0 +1,32 @@
+# the weight files of each model, watched by the hot reload
+MODEL_WEIGHTS = {
+    "yolo": ["model/yolo.pt"],
+    "detr": ["model/detr/"],
+    "unet": ["model/Unet.pt"],
+}
+
+
+def create_model(settings, logger):
+    """
+    Loads the model selected in config.ini with the [MODEL] options.
+
+    Args:
+        settings (Settings): The configuration.
+        logger: The logger object for logging messages.
+
+    Returns:
+        The model, with predict and predict_batch methods.
+    """
+    # ready-to-run artifacts cached by weights hash and library versions
+    model_cache_dir = settings.model.cache_dir if settings.model.cache else None
+    model_imgsz = (settings.default.image_height, settings.default.image_width)
+
+    # the models are imported on demand, each one pulls its own heavy dependencies
+    if settings.default.model == "yolo":
+        from core.yolo.yolo import yolo_model
+        return yolo_model(logger, cache_dir=model_cache_dir, imgsz=model_imgsz, warmup=settings.model.warmup)
+    if settings.default.model == "detr":
+        from core.detr.detr import Detr
+        return Detr(logger, cache_dir=model_cache_dir, imgsz=model_imgsz, warmup=settings.model.warmup, quantize=settings.model.quantize)
+    from core.Unet.unet import Unet
+    return Unet(logger, cache_dir=model_cache_dir, imgsz=model_imgsz, warmup=settings.model.warmup, quantize=settings.model.quantize)
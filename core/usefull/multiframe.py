@@ -0,0 +1,50 @@
+import time
+
+from core.convertion.convert import Dicom_frames_to_arrays, boxes_to_image
+
+
+def predict_frames(path, model, logger, width=1024, height=512, uint=8, memory_budget=None, conf=0.5, batch_size=8, on_frame=None):
+    """
+    Runs the model on the frames of a multi-frame DICOM file, by batches of frames.
+
+    The frames are converted lazily, at most `batch_size` converted frames are held in memory.
+
+    Args:
+        path (str): The path to the DICOM file.
+        model: The model, with a predict_batch method.
+        logger: The logger object for logging messages.
+        width (int): The width of the images given to the model.
+        height (int): The height of the images given to the model.
+        uint (int): The number of bits to use for pixel intensity.
+        memory_budget (int, optional): The memory budget of the conversion of a frame in bytes.
+        conf (float): Minimum confidence for a bounding box to be considered.
+        batch_size (int): The number of frames given to the model at once.
+        on_frame (callable, optional): Called with (frame_number, image, bboxes) for each frame.
+
+    Returns:
+        tuple: The (frame_number, bboxes, list_rectangle) of each frame, list_rectangle being in image
+            coordinates, and the timings: number of frames, conversion and prediction time in seconds.
+    """
+    results = []
+    stats = {"frames": 0, "convert_s": 0.0, "predict_s": 0.0}
+    batch = []
+
+    def run_batch():
+        start_time = time.perf_counter()
+        batch_boxes = model.predict_batch([image for _, image, _, _ in batch], conf=conf, logger=logger)
+        stats["predict_s"] += time.perf_counter() - start_time
+        for (frame_number, image, original_width, original_height), bboxes in zip(batch, batch_boxes):
+            results.append((frame_number, bboxes, boxes_to_image(bboxes, original_width, original_height, width=width, height=height)))
+            if on_frame is not None:
+                on_frame(frame_number, image, bboxes)
+        batch.clear()
+
+    for frame_number, image, original_width, original_height, convert_time in Dicom_frames_to_arrays(path, logger, width=width, height=height, uint=uint, memory_budget=memory_budget):
+        stats["frames"] += 1
+        stats["convert_s"] += convert_time
+        batch.append((frame_number, image, original_width, original_height))
+        if len(batch) == batch_size:
+            run_batch()
+    if batch:
+        run_batch()
+    return results, stats
@@ -0,0 +1,82 @@
+import contextlib
+
+import torch
+
+
+QUANTIZE_MODES = (None, "int8", "bf16")
+
+
+def check_quantize_mode(quantize):
+    """
+    Validates the quantize option of a model, "none" or an empty string meaning float32.
+
+    Returns:
+        str: None, "int8" or "bf16".
+    """
+    if quantize in ("", "none", "None", "float32"):
+        quantize = None
+    if quantize not in QUANTIZE_MODES:
+        raise ValueError(f"Invalid quantize mode {quantize}, expected none, int8 or bf16")
+    return quantize
+
+
+def bf16_supported():
+    """
+    Returns True if the CPU runs bfloat16 convolutions natively (AVX512-BF16 / AMX through oneDNN).
+    """
+    try:
+        return torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except Exception:
+        return False
+
+
+def bf16_autocast(enabled=True):
+    """
+    Context running the convolutions and matmuls in bfloat16 on the CPU, no-op if not enabled.
+
+    The weight cache is disabled so the context can also be used while tracing.
+    """
+    if not enabled:
+        return contextlib.nullcontext()
+    return torch.autocast("cpu", dtype=torch.bfloat16, cache_enabled=False)
+
+
+def quantize_dynamic_int8(model):
+    """
+    Quantizes the linear layers (attention projections and feed-forward) to int8 with dynamic activation scales.
+
+    Args:
+        model (torch.nn.Module): The float32 model, in eval mode.
+
+    Returns:
+        torch.nn.Module: The quantized model.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def prepare_static_int8(model, example_input):
+    """
+    Inserts the observers of a static int8 quantization (convolutions included) with torch.fx.
+
+    The returned model must be run on calibration images then given to `convert_static_int8`.
+
+    Args:
+        model (torch.nn.Module): The float32 model, in eval mode.
+        example_input (torch.Tensor): An input of the size used at inference.
+
+    Returns:
+        torch.nn.Module: The model with observers.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx
+
+    return prepare_fx(model, get_default_qconfig_mapping("x86"), (example_input,))
+
+
+def convert_static_int8(prepared_model):
+    """
+    Converts a calibrated model returned by `prepare_static_int8` to int8.
+    """
+    from torch.ao.quantization.quantize_fx import convert_fx
+
+    return convert_fx(prepared_model)
@@ -0,0 +1,177 @@
+import os
+import threading
+import time
+
+from core.usefull.logs import set_log_context
+from core.usefull.models import MODEL_WEIGHTS, create_model
+from core.usefull.settings import Settings
+
+
+class ModelHolder:
+    """
+    The current settings and model, replaced together by the hot reload.
+
+    A batch takes a snapshot before it starts and keeps it until it is done, so the
+    in-flight work finishes on the model it started with while the next batch gets the new one.
+    """
+
+    def __init__(self, settings, model):
+        self.lock = threading.Lock()
+        self.settings = settings
+        self.model = model
+
+    def snapshot(self):
+        """
+        Returns:
+            tuple: The current settings and model.
+        """
+        with self.lock:
+            return self.settings, self.model
+
+    def swap(self, settings, model=None):
+        """
+        Replaces the settings, and the model if given.
+
+        Returns:
+            float: The time the swap held the lock, in seconds.
+        """
+        start_time = time.perf_counter()
+        with self.lock:
+            self.settings = settings
+            if model is not None:
+                self.model = model
+        return time.perf_counter() - start_time
+
+
+def _file_signature(paths):
+    signature = {}
+    for path in paths:
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        for file in files:
+            try:
+                stat = os.stat(file)
+                signature[file] = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                signature[file] = None
+    return signature
+
+
+class HotReloader:
+    """
+    Watches config.ini and the model weights, and swaps in the new settings and model.
+
+    A change is applied once the files are stable over two checks (no copy in progress).
+    The new config is validated first, an invalid one is logged and ignored. When the model
+    settings or the weights changed, the new model is loaded and warmed up in this thread,
+    the pipeline keeps running on the old model meanwhile.
+    """
+
+    def __init__(self, holder, logger, config_path="config.ini", interval=2.0, on_swap=None):
+        """
+        Initializes the reloader.
+
+        Args:
+            holder (ModelHolder): The settings and model in use.
+            logger: The logger object for logging messages.
+            config_path (str): The configuration file.
+            interval (float): The time between two checks, in seconds.
+            on_swap (callable, optional): Called with the new settings after each swap.
+        """
+        self.holder = holder
+        self.logger = logger
+        self.config_path = config_path
+        self.interval = interval
+        self.on_swap = on_swap
+        self.swaps = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._signature = self._current_signature()
+        self._pending = None
+
+    def _watched(self, settings):
+        return [self.config_path] + MODEL_WEIGHTS[settings.default.model]
+
+    def _current_signature(self):
+        settings, _ = self.holder.snapshot()
+        return _file_signature(self._watched(settings))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="hot-reload", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        set_log_context(stage="reload")
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def check(self):
+        """
+        Applies the changes of the watched files, if they are stable since the previous check.
+
+        Returns:
+            bool: True if new settings were swapped in.
+        """
+        signature = self._current_signature()
+        if signature == self._signature:
+            self._pending = None
+            return False
+        if signature != self._pending:
+            # changed since the previous check, wait for the copy to finish
+            self._pending = signature
+            return False
+        self._pending = None
+        weights_changed = {path: value for path, value in signature.items() if path != self.config_path} != \
+            {path: value for path, value in self._signature.items() if path != self.config_path}
+        self._signature = signature
+        return self.reload(weights_changed)
+
+    def reload(self, weights_changed=False):
+        """
+        Reads the configuration and swaps it in, with a new model if needed.
+
+        Args:
+            weights_changed (bool): If True, the model is reloaded even if its settings did not change.
+
+        Returns:
+            bool: True if new settings were swapped in.
+        """
+        old_settings, _ = self.holder.snapshot()
+        try:
+            settings = Settings.from_file(self.config_path)
+        except ValueError as e:
+            self.logger.error(f"Invalid {self.config_path}, keeping the current configuration: {str(e)}")
+            return False
+
+        changed = settings.changed_sections(old_settings)
+        model = None
+        if weights_changed or settings.model_key() != old_settings.model_key():
+            start_time = time.perf_counter()
+            try:
+                model = create_model(settings, self.logger)
+            except Exception as e:
+                self.logger.error(f"Failed to load the new {settings.default.model} model, keeping the current one: {str(e)}")
+                return False
+            load_time = time.perf_counter() - start_time
+        elif not changed:
+            return False
+
+        swap_time = self.holder.swap(settings, model)
+        self.swaps += 1
+        # the watched weights depend on the model
+        self._signature = self._current_signature()
+        if model is not None:
+            self.logger.info(f"Swapped in the {settings.default.model} model, loaded and warmed up in {load_time:.3f}s, swapped in {swap_time * 1000:.3f} ms")
+        else:
+            self.logger.info(f"Reloaded {self.config_path} (sections {', '.join(changed)}), swapped in {swap_time * 1000:.3f} ms")
+        if self.on_swap is not None:
+            self.on_swap(settings)
+        return True
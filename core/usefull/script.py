@@ -11,6 +11,9 @@ def clear_tmp_files(logger):
 
     """
     for file in os.listdir("tmp"):
+        # the directories (e.g. of another process) are not temporary files
+        if not os.path.isfile("tmp/"+file):
+            continue
         try:
             os.remove("tmp/"+file)
             logger.info("Temporary file {} cleared".format(file))
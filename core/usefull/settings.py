@@ -0,0 +1,225 @@
+import configparser
+import types
+
+from pydicom.datadict import tag_for_keyword
+from pydicom.uid import RE_VALID_UID
+
+from core.dicom.triage import TriageRules
+
+
+def _positive(value):
+    if value <= 0:
+        raise ValueError("must be positive")
+    return value
+
+
+def _non_negative(value):
+    if value < 0:
+        raise ValueError("must be positive or zero")
+    return value
+
+
+def _ratio(value):
+    if not 0 <= value <= 1:
+        raise ValueError("must be between 0 and 1")
+    return value
+
+
+def _log_level(value):
+    if value.upper() not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        raise ValueError("expected one of DEBUG, INFO, WARNING, ERROR, CRITICAL")
+    return value.upper()
+
+
+def _keywords(values):
+    unknown = [value for value in values if tag_for_keyword(value) is None]
+    if unknown:
+        raise ValueError(f"unknown DICOM keyword {', '.join(unknown)}")
+    return values
+
+
+def _uids(values):
+    invalid = [value for value in values if len(value) > 64 or not RE_VALID_UID.match(value)]
+    if invalid:
+        raise ValueError(f"invalid UID {', '.join(invalid)}")
+    return values
+
+
+# section -> key -> (type, validation, default): the type is int, float, bool, str, list (comma separated) or a tuple of the accepted values,
+# default: used when the whole section is missing (older config.ini), None for the sections every config.ini has.
+# A key missing from a section that is present is an error
+SCHEMA = {
+    "DEFAULT": {
+        "model": (("yolo", "detr", "unet"), None, None),
+        "image_width": (int, _positive, None),
+        "image_height": (int, _positive, None),
+        "uint": (("8", "16"), None, None),
+        "min_confidence": (float, _ratio, None),
+        "debug_mode": (bool, None, None),
+        "pacs_ip": (str, None, None),
+        "pacs_port": (int, _positive, None),
+        "aetitle": (str, None, None),
+        "pacs_aetitle": (str, None, None),
+    },
+    "LOG": {
+        "directory": (str, None, "log"),
+        "level": (str, _log_level, "INFO"),
+        "max_bytes": (int, _non_negative, "10485760"),
+        "backup_count": (int, _non_negative, "10"),
+        "rotate_seconds": (int, _non_negative, "86400"),
+    },
+    "OUTBOX": {
+        "directory": (str, None, "output"),
+        "batch_size": (int, _positive, "10"),
+        "min_backoff": (float, _positive, "1"),
+        "max_backoff": (float, _positive, "300"),
+        "drain_timeout": (float, _non_negative, "30"),
+    },
+    "MODEL": {
+        "cache": (bool, None, "False"),
+        "cache_dir": (str, None, "model/cache"),
+        "warmup": (bool, None, "True"),
+        "quantize": (("none", "int8", "bf16"), None, "none"),
+        "batch_size": (int, _positive, "8"),
+    },
+    "CONVERSION": {
+        "memory_budget": (int, _non_negative, "64"),
+    },
+    "DEDUP": {
+        "enabled": (bool, None, "True"),
+        "force": (bool, None, "False"),
+        "cache_file": (str, None, "state/annotated.json"),
+        "cache_ttl": (float, _non_negative, "86400"),
+        "chunk_size": (int, _positive, "50"),
+        "timeout": (float, _positive, "30"),
+    },
+    "GSPS": {
+        "mode": (("layered", "split"), None, "layered"),
+        "aggregate": (bool, None, "False"),
+        "aggregate_window": (float, _non_negative, "10"),
+        "aggregate_by": (("study", "series"), None, "study"),
+    },
+    "DEBUG": {
+        "directory": (str, None, "output/debug"),
+        "queue_size": (int, _positive, "8"),
+    },
+    "SERVICE": {
+        "host": (str, None, "127.0.0.1"),
+        "port": (int, _positive, "8080"),
+        "max_batch_size": (int, _positive, "8"),
+        "max_wait_ms": (float, _non_negative, "20"),
+        "max_concurrent": (int, _positive, "16"),
+        "max_upload_mb": (int, _positive, "200"),
+        "request_timeout": (float, _positive, "60"),
+        "slo_ms": (float, _positive, "1000"),
+        "metrics_window": (int, _positive, "1000"),
+        "push": (bool, None, "True"),
+        "allowed_directories": (list, None, ""),
+    },
+    "RELOAD": {
+        "enabled": (bool, None, "True"),
+        "interval": (float, _positive, "2"),
+    },
+    "TRIAGE": {
+        "sop_classes": (list, _uids, ""),
+        "modalities": (list, None, ""),
+        "excluded_modalities": (list, None, ""),
+        "min_rows": (int, _non_negative, "0"),
+        "min_cols": (int, _non_negative, "0"),
+        "required_tags": (list, _keywords, ""),
+        "action": (("skip", "quarantine"), None, "skip"),
+        "quarantine_directory": (str, None, "quarantine"),
+    },
+}
+
+# the settings the loaded model depends on, a change needs a new model
+MODEL_SETTINGS = (
+    ("DEFAULT", "model"), ("DEFAULT", "image_width"), ("DEFAULT", "image_height"),
+    ("MODEL", "cache"), ("MODEL", "cache_dir"), ("MODEL", "warmup"), ("MODEL", "quantize"),
+)
+
+
+def _parse(section_name, section, key, value_type, validate, default):
+    if section is not None and key in section:
+        raw = section[key]
+    elif section is None and default is not None:
+        raw = default
+    else:
+        raise ValueError(f"[{section_name}] {key} is missing")
+    try:
+        if value_type is bool:
+            if raw.strip().lower() not in configparser.ConfigParser.BOOLEAN_STATES:
+                raise ValueError("expected True or False")
+            value = configparser.ConfigParser.BOOLEAN_STATES[raw.strip().lower()]
+        elif value_type in (int, float):
+            value = value_type(raw)
+        elif value_type is list:
+            value = [item.strip() for item in raw.split(",") if item.strip()]
+        else:
+            value = raw.strip()
+            if isinstance(value_type, tuple) and value not in value_type:
+                raise ValueError(f"expected one of {', '.join(value_type)}")
+        if validate is not None:
+            value = validate(value)
+        return value
+    except ValueError as e:
+        raise ValueError(f"[{section_name}] {key} = {raw}: {str(e)}") from None
+
+
+class Settings:
+    """
+    Typed and validated content of config.ini.
+
+    Each section is an attribute with its lowercase name, e.g. `settings.default.debug_mode`
+    is a bool and `settings.service.port` an int. The validated [TRIAGE] section is a TriageRules and the
+    parsed ConfigParser is kept in `config` for the code reading a section itself (logs).
+    """
+
+    def __init__(self, config):
+        """
+        Parses and validates the configuration.
+
+        Args:
+            config (configparser.ConfigParser): The parsed config.ini.
+
+        Raises:
+            ValueError: If a required value is missing or a value is invalid, with its section and key.
+        """
+        self.config = config
+        for section_name, keys in SCHEMA.items():
+            # a missing section takes its defaults
+            section = config[section_name] if section_name == "DEFAULT" or config.has_section(section_name) else None
+            values = {key: _parse(section_name, section, key, value_type, validate, default) for key, (value_type, validate, default) in keys.items()}
+            setattr(self, section_name.lower(), types.SimpleNamespace(**values))
+        self.default.uint = int(self.default.uint)
+        self.model.quantize = None if self.model.quantize == "none" else self.model.quantize
+        if self.outbox.min_backoff > self.outbox.max_backoff:
+            raise ValueError("[OUTBOX] min_backoff is larger than max_backoff")
+        self.triage = TriageRules(**vars(self.triage))
+
+    @classmethod
+    def from_file(cls, path="config.ini"):
+        """
+        Reads and validates a configuration file.
+
+        Returns:
+            Settings: The settings.
+        """
+        config = configparser.ConfigParser()
+        if not config.read(path):
+            raise ValueError(f"Cannot read {path}")
+        return cls(config)
+
+    def model_key(self):
+        """
+        Returns:
+            tuple: The values of the settings the loaded model depends on.
+        """
+        return tuple(getattr(getattr(self, section.lower()), key) for section, key in MODEL_SETTINGS)
+
+    def changed_sections(self, other):
+        """
+        Returns:
+            list: The names of the sections whose values differ from the other settings.
+        """
+        return [section for section in SCHEMA if vars(getattr(self, section.lower())) != vars(getattr(other, section.lower()))]
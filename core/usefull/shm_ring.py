@@ -0,0 +1,129 @@
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class FrameRing:
+    """
+    Ring of fixed-size frame slots in shared memory, to pass the preprocessed images from decode
+    worker processes to the inference process without pickling them.
+
+    A producer acquires a free slot, writes the image into `slot(index)` and publishes the index;
+    the consumer gets the index, reads the slot (or wraps it with `tensor(index)`) and releases it
+    once the model is done with it. Only the slot indexes and small metadata go through the queues.
+    When all the slots are in use, `acquire` blocks: the ring depth is the backpressure.
+
+    The ring can be given to a multiprocessing.Process, the child attaches to the same memory.
+    """
+
+    def __init__(self, slots, shape, dtype=np.uint8, name=None, context=None):
+        """
+        Creates the ring.
+
+        Args:
+            slots (int): The number of slots.
+            shape (tuple): The shape of a frame, e.g. (height, width).
+            dtype: The dtype of a frame.
+            name (str, optional): The name of the shared memory block. Defaults to a random name.
+            context (multiprocessing.context.BaseContext, optional): The multiprocessing context of the queues.
+        """
+        context = context or multiprocessing.get_context()
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        slot_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=slots * slot_bytes)
+        self.owner = True
+        self.free = context.Queue()
+        self.ready = context.Queue()
+        for index in range(slots):
+            self.free.put(index)
+        self._map()
+
+    def _map(self):
+        self.array = np.ndarray((self.slots, *self.shape), dtype=self.dtype, buffer=self.shm.buf)
+
+    def __getstate__(self):
+        return {"name": self.shm.name, "slots": self.slots, "shape": self.shape, "dtype": self.dtype.str, "free": self.free, "ready": self.ready}
+
+    def __setstate__(self, state):
+        self.slots = state["slots"]
+        self.shape = tuple(state["shape"])
+        self.dtype = np.dtype(state["dtype"])
+        self.shm = shared_memory.SharedMemory(name=state["name"])
+        self.owner = False
+        self.free = state["free"]
+        self.ready = state["ready"]
+        self._map()
+
+    def acquire(self, timeout=None):
+        """
+        Takes a free slot, waiting for one to be released if they are all in use.
+
+        Returns:
+            int: The slot index, None if no slot was released within the timeout.
+        """
+        try:
+            return self.free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def slot(self, index):
+        """
+        Returns the numpy view of a slot, written in place by the producer.
+        """
+        return self.array[index]
+
+    def publish(self, index, metadata=None):
+        """
+        Hands a written slot over to the consumer with its metadata (file name, frame number, size...).
+        """
+        self.ready.put((index, metadata))
+
+    def get(self, timeout=None):
+        """
+        Takes the next published slot.
+
+        Returns:
+            tuple: The slot index and its metadata, (None, None) on timeout.
+        """
+        try:
+            return self.ready.get(timeout=timeout)
+        except queue.Empty:
+            return None, None
+
+    def tensor(self, index):
+        """
+        Wraps a slot in a torch tensor sharing its memory, without copy.
+
+        The tensor must not be used after the slot is released.
+        """
+        import torch
+
+        return torch.from_numpy(self.array[index])
+
+    def release(self, index):
+        """
+        Gives a slot back to the producers once the consumer is done with it.
+        """
+        self.free.put(index)
+
+    def depth(self):
+        """
+        Number of slots in use (written, waiting or being processed), the backpressure metric.
+        """
+        return self.slots - self.free.qsize()
+
+    def metrics(self):
+        return {"slots": self.slots, "in_use": self.depth(), "ready": self.ready.qsize()}
+
+    def close(self):
+        """
+        Detaches from the shared memory, and frees it if this process created it.
+        """
+        del self.array
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -1,20 +1,53 @@
+import shutil
+
+import cv2
+import numpy as np
 from ultralytics import YOLO
 
+from core.convertion.convert import to_uint8
+from core.usefull.model_cache import cache_key, artifact_path, load_or_build, warm_up
+
 class yolo_model:
     """
     Class representing a YOLO model for object detection.
     """
 
-    def __init__(self, logger):
+    def __init__(self, logger, cache_dir=None, imgsz=(512, 1024), warmup=True):
         """
         Initializes the YOLO model.
 
         Args:
             logger: The logger object for logging messages.
+            cache_dir (str, optional): If set, the model is exported once to TorchScript (conv-bn fused)
+                in this directory and the export is loaded on the next starts.
+            imgsz (tuple): The (height, width) of the images given to the model.
+            warmup (bool): If True, a dummy inference is run once the model is loaded.
         """
-        self.model = YOLO('model/yolo.pt')
+        self.imgsz = list(imgsz)
+        self.exported = cache_dir is not None
+        if cache_dir is None:
+            self.model = YOLO('model/yolo.pt')
+        else:
+            key = cache_key(cache_dir, ['model/yolo.pt'], ['torch', 'ultralytics'], extra=('torchscript', self.imgsz))
+            self.model = load_or_build(
+                artifact_path(cache_dir, 'yolo', key, '.torchscript'),
+                self._export,
+                lambda path: YOLO(path, task='detect'),
+                logger,
+                fallback=lambda: YOLO('model/yolo.pt'),
+            )
         logger.info("YOLO model loaded")
-        
+        if warmup:
+            warm_up(lambda: self.model.predict(np.zeros((*self.imgsz, 3), np.uint8), imgsz=self.imgsz, verbose=False), logger, "YOLO")
+
+    def _export(self, path):
+        # the export fuses the conv-bn layers and is written next to the weights
+        exported = YOLO('model/yolo.pt').export(format='torchscript', imgsz=self.imgsz)
+        shutil.move(exported, path)
+
+    def _boxes(self, result):
+        return [{"conf":float(result.boxes.conf[i].tolist()),"x":float(result.boxes.xyxy[i][0].tolist()),"y":float(result.boxes.xyxy[i][1].tolist()),"w":float(result.boxes.xywh[i][2].tolist()),"h":float(result.boxes.xywh[i][3].tolist())} for i in range(len(result.boxes))]
+
     def predict(self, path, imgsz=1024, conf=0.5, logger=None):
         """
         Performs object detection on an image.
@@ -26,15 +59,38 @@ class yolo_model:
             A list of dictionaries representing the predicted bounding boxes.
         """
         try:
+            # the TorchScript export only accepts the size it was traced with
+            imgsz = self.imgsz if self.exported else imgsz
             results = self.model.predict(path, imgsz=imgsz, conf=conf, save_conf=True, verbose=False,save_txt=False)
-            
-            boxes = []
-            for i in range(len(results[0].boxes)):
-                boxes.append({"conf":float(results[0].boxes.conf[i].tolist()),"x":float(results[0].boxes.xyxy[i][0].tolist()),"y":float(results[0].boxes.xyxy[i][1].tolist()),"w":float(results[0].boxes.xywh[i][2].tolist()),"h":float(results[0].boxes.xywh[i][3].tolist())})
+
+            boxes = self._boxes(results[0])
             logger.info(f"Predicted {len(boxes)} bounding boxes for {path}")
             for box in boxes:
-                logger.info(f"Bounding box: conf={box['conf']}, x={box['x']}, y={box['y']}, w={box['w']}, h={box['h']}")
+                logger.debug(f"Bounding box: conf={box['conf']}, x={box['x']}, y={box['y']}, w={box['w']}, h={box['h']}")
             return boxes
         except Exception as e:
             logger.error(f"An error occurred while predicting bounding boxes for {path}: {str(e)}")
             return []
+
+    def predict_batch(self, images, conf=0.5, logger=None):
+        """
+        Performs object detection on several in-memory images in one forward pass.
+
+        The TorchScript export is traced for a single image, with it the images are given one at a time.
+
+        Args:
+            images (list): The grayscale images returned by Dicom_to_array, all of the same size.
+            conf (float): Minimum confidence for a bounding box to be considered.
+
+        Returns:
+            list: The list of bounding boxes of each image.
+        """
+        # same input as the PNG read back by predict: 8-bit BGR
+        images = [cv2.cvtColor(to_uint8(image), cv2.COLOR_GRAY2BGR) for image in images]
+        if self.exported:
+            results = [self.model.predict(image, imgsz=self.imgsz, conf=conf, verbose=False)[0] for image in images]
+        else:
+            results = self.model.predict(images, imgsz=self.imgsz, conf=conf, verbose=False)
+        boxes = [self._boxes(result) for result in results]
+        logger.info(f"Predicted {sum(len(image_boxes) for image_boxes in boxes)} bounding boxes for a batch of {len(images)} images")
+        return boxes
@@ -1,87 +1,219 @@
-import logging
 import configparser
 import os
 
-from core.yolo.yolo import yolo_model
-from core.detr.detr import Detr
-from core.Unet.unet import Unet
+import cv2
 
-from core.usefull.script import clear_tmp_files, check_directory, show_results_popup
-from core.convertion.convert import Dicom_to_png
-from core.dicom.bbox_to_gsps import create_gsps
-from core.dicom.push_dicom import send_dicom_to_pacs
+from core.usefull.script import clear_tmp_files, check_directory
+from core.usefull.debug import DebugWriter
+from core.usefull.multiframe import predict_frames
+from core.convertion.convert import Dicom_to_array, boxes_to_image
+from core.dicom.bbox_to_gsps import create_gsps, create_multiframe_gsps
+from core.dicom.outbox import GspsOutbox
+from core.dicom.aggregate import StudyAggregator
+from core.dicom.triage import TriageCounters, triage_dicom, reject_file
+from core.dicom.query import AnnotationIndex, find_annotated
+from core.usefull.models import create_model
+from core.usefull.reload import ModelHolder, HotReloader
+from core.usefull.settings import Settings
+from core.usefull.logs import setup_logging, set_log_context, clear_log_context
 
 
-logging.basicConfig(filename='log/logfile_'+ str(len(os.listdir("log"))+1) + '.log', level=logging.INFO, format='%(asctime)s %(message)s')
-logger = logging.getLogger(__name__)
-
 if __name__ == '__main__':
     
-    check_directory("input",logger,create=False)
-    check_directory("tmp",logger)
-    
     #read config file
     config = configparser.ConfigParser()
     config.read('config.ini')
     
-    # add console handler if debug mode is enabled
-    if config["DEFAULT"]["debug_mode"] == "True":
+    # typed and validated configuration
+    try:
+        settings = Settings(config)
+    except ValueError as e:
+        # the error is written to the log file and shown in the terminal
+        logger, log_listener = setup_logging(config, console=True)
+        logger.error(f"Invalid config.ini: {str(e)}")
+        exit()
+    
+    # non-blocking JSON logger, the console handler is added if debug mode is enabled
+    logger, log_listener = setup_logging(config, console=settings.default.debug_mode)
+    if settings.default.debug_mode:
         logger.info("Debug mode enabled")
-        console = logging.StreamHandler()
-        console.setLevel(logging.INFO)
-        logger.addHandler(console)
-        
     
-    if config["DEFAULT"]["model"] == "yolo":
-        model = yolo_model(logger)
-    elif config["DEFAULT"]["model"] == "detr":
-        model = Detr(logger)
-    elif config["DEFAULT"]["model"] == "unet":
-        model = Unet(logger)
-    else:
-        logger.error("Invalid model specified in config.ini")
-        exit()
+    check_directory("input",logger,create=False)
+    check_directory("tmp",logger)
+    
+    set_log_context(stage="load")
+    model_holder = ModelHolder(settings, create_model(settings, logger))
+    clear_log_context()
+    
+    # GSPS are written to the outbox and sent to the PACS in the background
+    outbox = GspsOutbox(
+        settings.outbox.directory,
+        settings.default.pacs_ip,
+        settings.default.pacs_port,
+        settings.default.aetitle,
+        settings.default.pacs_aetitle,
+        logger,
+        batch_size=settings.outbox.batch_size,
+        min_backoff=settings.outbox.min_backoff,
+        max_backoff=settings.outbox.max_backoff,
+    )
+    outbox.start()
+    
+    # config.ini and the weights are watched, a new model is swapped in between two files
+    reloader = None
+    if settings.reload.enabled:
+        reloader = HotReloader(model_holder, logger, interval=settings.reload.interval,
+                               on_swap=lambda new_settings: outbox.set_pacs(new_settings.default.pacs_ip, new_settings.default.pacs_port, new_settings.default.aetitle, new_settings.default.pacs_aetitle))
+        reloader.start()
+    
+    # debug overlays written in the background, dropped if the writer falls behind
+    debug_writer = None
+    if settings.default.debug_mode:
+        debug_writer = DebugWriter(settings.debug.directory, logger, queue_size=settings.debug.queue_size)
+        debug_writer.start()
     
+    # header-only triage, the ineligible inputs are rejected before their pixels are decoded
+    triage_rules = settings.triage
+    triage_counters = TriageCounters()
+    
+    accepted_files = []
     for file in os.listdir("input"):
+        set_log_context(file=file, stage="triage")
+        dicom_header, reason = triage_dicom("input/"+file, triage_rules)
+        if reason is not None:
+            triage_counters[reason] += 1
+            reject_file("input/"+file, reason, triage_rules, logger)
+        else:
+            accepted_files.append((file, dicom_header))
+        clear_log_context()
+    
+    # images we already annotated, found with one C-FIND per batch of studies and cached locally
+    annotation_index = None
+    if settings.dedup.enabled:
+        set_log_context(stage="dedup")
+        annotation_index = AnnotationIndex(settings.dedup.cache_file, ttl=settings.dedup.cache_ttl)
+        if not settings.dedup.force:
+            stale_studies = annotation_index.stale([dicom_header.StudyInstanceUID for _, dicom_header in accepted_files])
+            if stale_studies:
+                annotated = find_annotated(stale_studies, settings.default.pacs_ip, settings.default.pacs_port, settings.default.aetitle, settings.default.pacs_aetitle, logger, chunk_size=settings.dedup.chunk_size, timeout=settings.dedup.timeout)
+                # if the PACS cannot be queried, the files are processed
+                if annotated is not None:
+                    annotation_index.update(stale_studies, annotated, logger)
+            for file, dicom_header in accepted_files:
+                if annotation_index.is_annotated(dicom_header):
+                    triage_counters["already_annotated"] += 1
+                    os.remove("input/"+file)
+                    logger.info(f"File {file} already has a GSPS on the PACS, skipped")
+            accepted_files = [(file, dicom_header) for file, dicom_header in accepted_files if not annotation_index.is_annotated(dicom_header)]
+        clear_log_context()
+    
+    def queue_gsps(gsps_dataset, gsps_filename):
+        # the images are recorded as annotated only once their GSPS is safely in the outbox
+        outbox.put(gsps_dataset, gsps_filename)
+        if annotation_index is not None:
+            annotation_index.add_gsps(gsps_dataset)
+    
+    # study-level aggregation, one GSPS for all the images of a study processed within the window
+    # the open groups are journaled next to the outbox, a crash does not lose them
+    aggregators = []
+    if settings.gsps.aggregate:
+        window, group_by = settings.gsps.aggregate_window, settings.gsps.aggregate_by
+        journal = os.path.join(settings.outbox.directory, "groups")
+        if settings.gsps.mode == "split":
+            aggregators.append(StudyAggregator(queue_gsps, logger, window, group_by, show_confidence=True, separate_layers=False, suffix="_study_confidence", journal=os.path.join(journal, "confidence")))
+            aggregators.append(StudyAggregator(queue_gsps, logger, window, group_by, show_confidence=False, separate_layers=False, suffix="_study_no_confidence", journal=os.path.join(journal, "no_confidence")))
+        else:
+            aggregators.append(StudyAggregator(queue_gsps, logger, window, group_by, separate_layers=True, journal=os.path.join(journal, "layered")))
+    
+    for file, dicom_header in accepted_files:
+        set_log_context(file=file, stage="move")
+        triage_counters["accepted"] += 1
+        # the file is processed with the settings and model current when it starts, even if a new model is swapped in meanwhile
+        settings, model = model_holder.snapshot()
+        
         try:
+            for aggregator in aggregators:
+                aggregator.flush_expired()
+            
             os.rename("input/"+file,"tmp/"+file)
             logger.info(f"File {file} moved to temporary directory")
             
-            image_width, image_height = Dicom_to_png("tmp/"+file, logger, width=int(config["DEFAULT"]["image_width"]), height=int(config["DEFAULT"]["image_height"]), uint=int(config["DEFAULT"]["uint"]))
-            logger.info(f"Converted DICOM file {file} to PNG")
+            number_of_frames = int(dicom_header.get("NumberOfFrames", 1))
+            if number_of_frames > 1:
+                # multi-frame image, the frames are converted lazily and given to the model by batches
+                set_log_context(stage="predict")
+                on_frame = None
+                if debug_writer is not None:
+                    on_frame = lambda frame_number, image, bboxes: debug_writer.submit(image, bboxes, file.replace(".dcm", f"_frame{frame_number}.dcm"))
+                frame_results, frame_stats = predict_frames("tmp/"+file, model, logger, width=settings.default.image_width, height=settings.default.image_height, uint=settings.default.uint, memory_budget=settings.conversion.memory_budget*1024*1024, conf=settings.default.min_confidence, batch_size=settings.model.batch_size, on_frame=on_frame)
+                list_frames = [(frame_number, list_rectangle, [box["conf"] for box in bboxes]) for frame_number, bboxes, list_rectangle in frame_results]
+                logger.info(f"Predicted {sum(len(frame[1]) for frame in list_frames)} bounding boxes on {frame_stats['frames']} frames of {file}, per frame: conversion {frame_stats['convert_s'] / frame_stats['frames'] * 1000:.1f} ms, prediction {frame_stats['predict_s'] / frame_stats['frames'] * 1000:.1f} ms")
+                make_gsps = lambda **options: create_multiframe_gsps("tmp/"+file, list_frames, logger, **options)
+            else:
+                set_log_context(stage="convert")
+                # the image is kept in memory for the debug overlay
+                image, image_width, image_height = Dicom_to_array("tmp/"+file, logger, width=settings.default.image_width, height=settings.default.image_height, uint=settings.default.uint, memory_budget=settings.conversion.memory_budget*1024*1024)
+                cv2.imwrite("tmp/tmp.png", image)
+                logger.info(f"Converted DICOM file {file} to PNG")
+                
+                set_log_context(stage="predict")
+                bboxes = model.predict("tmp/tmp.png",conf=settings.default.min_confidence,imgsz=settings.default.image_width,logger=logger)
+                logger.info(f"Predicted {len(bboxes)} bounding boxes for {file}")
+                
+                if len(bboxes) == 0:
+                    logger.info(f"No bounding boxes found for {file}")
+                
+                list_rectangle = boxes_to_image(bboxes, image_width, image_height, width=settings.default.image_width, height=settings.default.image_height)
+                list_frames = [(None, list_rectangle, [box["conf"] for box in bboxes])]
+                make_gsps = lambda **options: create_gsps("tmp/"+file, None, list_rectangle, [box["conf"] for box in bboxes], logger, **options)
+                
+                if debug_writer is not None:
+                    debug_writer.submit(image, bboxes, file)
             
-            bboxes = model.predict("tmp/tmp.png",conf=float(config["DEFAULT"]["min_confidence"]),imgsz=int(config["DEFAULT"]["image_width"]),logger=logger)
-            logger.info(f"Predicted {len(bboxes)} bounding boxes for {file}")
-            
-            if len(bboxes) == 0:
-                logger.info(f"No bounding boxes found for {file}")
-            
-            list_rectangle =[]
-            for box in bboxes:
-                x,y,w,h = box["x"],box["y"],box["w"],box["h"]
-                ratio_width, ratio_height = 2048/ int(config["DEFAULT"]["image_width"])   , 1024/ int(config["DEFAULT"]["image_height"]) 
-                x,y,w,h = (x*ratio_width)+((image_width - 2048) / 2),(y*ratio_height)+((image_height - 1024)/2),w*ratio_width,h*ratio_height
-                list_rectangle.append([x,y,w,h])
-            
-            gsps_dataset_confidence = create_gsps("tmp/"+file,"output/"+file.replace(".dcm","_confidence.dcm"),list_rectangle,[box["conf"] for box in bboxes],logger)
-            logger.info(f"Created GSPS with confidence shown for {file}")
-            gsps_dataset_no_confidence = create_gsps("tmp/"+file,"output/"+file.replace(".dcm","_no_confidence.dcm"),list_rectangle,[box["conf"] for box in bboxes],logger,show_confidence=False)
-            logger.info(f"Created GSPS without confidence shown for {file}")
-
-            if config["DEFAULT"]["debug_mode"] == "True":
-                show_results_popup(bboxes)
-                logger.info(f"Displayed results for {file}")
+            set_log_context(stage="gsps")
+            if aggregators:
+                # the GSPS is emitted later with the other images of the study, only the header is kept
+                for aggregator in aggregators:
+                    for frame_number, list_rectangle, list_indic in list_frames:
+                        aggregator.add(dicom_header, list_rectangle, list_indic, file, frame_number=frame_number)
+                gsps_outputs = []
+            elif settings.gsps.mode == "split":
+                # compatibility mode, one GSPS with the confidence and one without
+                gsps_dataset_confidence = make_gsps()
+                logger.info(f"Created GSPS with confidence shown for {file}")
+                gsps_dataset_no_confidence = make_gsps(show_confidence=False)
+                logger.info(f"Created GSPS without confidence shown for {file}")
+                gsps_outputs = [(gsps_dataset_confidence, file.replace(".dcm","_confidence.dcm")), (gsps_dataset_no_confidence, file.replace(".dcm","_no_confidence.dcm"))]
+            else:
+                gsps_dataset = make_gsps(separate_layers=True)
+                logger.info(f"Created GSPS with the confidence on a separate layer for {file}")
+                gsps_outputs = [(gsps_dataset, file.replace(".dcm","_gsps.dcm"))]
 
-            status = send_dicom_to_pacs(gsps_dataset_confidence,config["DEFAULT"]["pacs_ip"],int(config["DEFAULT"]["pacs_port"]),config["DEFAULT"]["aetitle"],config["DEFAULT"]["pacs_aetitle"],logger)
-            logger.info(f"Done sending GSPS with confidence shown for {file}") if status else None
-
-            status = send_dicom_to_pacs(gsps_dataset_no_confidence,config["DEFAULT"]["pacs_ip"],int(config["DEFAULT"]["pacs_port"]),config["DEFAULT"]["aetitle"],config["DEFAULT"]["pacs_aetitle"],logger)
-            logger.info(f"Done sending GSPS without confidence shown for {file}") if status else None
+            set_log_context(stage="send")
+            for gsps_dataset, gsps_filename in gsps_outputs:
+                queue_gsps(gsps_dataset, gsps_filename)
+            logger.info(f"Queued {len(gsps_outputs)} GSPS for {file} in the outbox")
 
+            set_log_context(stage="cleanup")
             clear_tmp_files(logger)
             
         except Exception as e:
             clear_tmp_files(logger)
             logger.warning("Failed to process file {}: {}".format(file, str(e)))
+        clear_log_context()
     
+    for aggregator in aggregators:
+        try:
+            aggregator.flush_all()
+        except Exception as e:
+            # the groups not emitted stay in the journal for the next run
+            logger.warning(f"Failed to emit the open study GSPS: {str(e)}")
+    if annotation_index is not None:
+        annotation_index.save()
+    logger.info(f"Triage: {triage_counters.summary()}")
+    if debug_writer is not None:
+        debug_writer.stop()
+    if reloader is not None:
+        reloader.stop()
+    outbox.stop(timeout=settings.outbox.drain_timeout)
     logger.info("Processing completed")
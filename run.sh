@@ -7,7 +7,8 @@ do
         echo "Creating input folder"
         mkdir input
     fi
-    if [ "$(ls -A ./input)" ]; then
+    # also run when GSPS are still waiting in the outbox to be sent to the PACS
+    if [ "$(ls -A ./input)" ] || ls ./output/*.dcm >/dev/null 2>&1; then
         if [ ! -d "./log" ]; then
             mkdir log
         fi
@@ -0,0 +1,45 @@
+import logging
+import socket
+
+import numpy as np
+import pydicom
+import pytest
+
+from core.benchmark.micro import make_dicom
+
+
+@pytest.fixture
+def logger():
+    return logging.getLogger("tests")
+
+
+@pytest.fixture
+def dicom_file(tmp_path):
+    """
+    Writes a synthetic panoramic DICOM with the given pixels, (rows, cols) or (frames, rows, cols).
+    """
+    def write(pixels, name="image.dcm", slope=None, intercept=None):
+        bits = 8 if pixels.dtype == np.uint8 else 16
+        frames = pixels.shape[0] if pixels.ndim == 3 else 1
+        path = make_dicom(str(tmp_path / name), pixels.shape[-2], pixels.shape[-1], bits, frames=frames)
+        dataset = pydicom.dcmread(path)
+        dataset.PixelData = pixels.tobytes()
+        if slope is not None:
+            dataset.RescaleSlope = slope
+        if intercept is not None:
+            dataset.RescaleIntercept = intercept
+        dataset.save_as(path)
+        return path
+    return write
+
+
+@pytest.fixture
+def free_port():
+    """
+    Returns a function giving a localhost port nothing listens on.
+    """
+    def port():
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+    return port
@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pydicom
+
+from core.dicom.aggregate import StudyAggregator
+
+
+def _headers(dicom_file, count):
+    pixels = np.zeros((16, 32), np.uint8)
+    headers = [pydicom.dcmread(dicom_file(pixels, name=f"image{index}.dcm"), stop_before_pixels=True) for index in range(count)]
+    for header in headers[1:]:
+        header.StudyInstanceUID = headers[0].StudyInstanceUID
+    return headers
+
+
+def test_journal_restored_after_restart(dicom_file, logger, tmp_path):
+    headers = _headers(dicom_file, 2)
+    journal = str(tmp_path / "groups")
+    emitted = []
+    aggregator = StudyAggregator(lambda gsps, filename: emitted.append((gsps, filename)), logger, window=3600, journal=journal)
+    aggregator.add(headers[0], [[1.5, 2, 30, 40]], [np.float32(0.8)], "image0.dcm")
+    aggregator.add(headers[1], [[5, 6, 7, 8]], [0.6], "image1.dcm")
+    assert emitted == [] and len(os.listdir(journal)) == 1
+
+    # the process is killed before the window is over: a new aggregator emits the group
+    restarted = StudyAggregator(lambda gsps, filename: emitted.append((gsps, filename)), logger, window=3600, journal=journal)
+    restarted.flush_all()
+
+    gsps, filename = emitted[0]
+    assert filename == "image0_study.dcm"
+    referenced = {image.ReferencedSOPInstanceUID for series in gsps.ReferencedSeriesSequence for image in series.ReferencedImageSequence}
+    assert referenced == {header.SOPInstanceUID for header in headers}
+    assert os.listdir(journal) == []
+
+
+def test_failed_group_set_aside(dicom_file, logger, tmp_path):
+    headers = _headers(dicom_file, 1)
+    del headers[0].PatientAge
+    journal = str(tmp_path / "groups")
+    emitted = []
+    aggregator = StudyAggregator(lambda gsps, filename: emitted.append(filename), logger, window=3600, journal=journal)
+    aggregator.add(headers[0], [[1, 2, 3, 4]], [0.5], "image0.dcm")
+    aggregator.flush_all()
+
+    assert emitted == []
+    assert [name.endswith(".json.bad") for name in os.listdir(journal)] == [True]
+    # not retried by the next run
+    assert StudyAggregator(lambda gsps, filename: emitted.append(filename), logger, journal=journal).groups == {}
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from core.convertion.convert import Dicom_to_array, Dicom_frames_to_arrays
+
+
+def test_8bit_single_frame(dicom_file, logger):
+    pixels = np.random.default_rng(0).integers(0, 256, (1030, 2060)).astype(np.uint8)
+    image, original_width, original_height = Dicom_to_array(dicom_file(pixels), logger, uint=8, memory_budget=1024 * 1024)
+
+    assert image is not None
+    assert image.shape == (512, 1024) and image.dtype == np.uint8
+    assert (original_width, original_height) == (2060, 1030)
+
+
+def test_8bit_multi_frame(dicom_file, logger):
+    pixels = np.random.default_rng(0).integers(0, 256, (3, 1030, 2060)).astype(np.uint8)
+    frames = list(Dicom_frames_to_arrays(dicom_file(pixels, name="frames.dcm"), logger, uint=8))
+
+    assert [frame_number for frame_number, *_ in frames] == [1, 2, 3]
+    for index, (_, image, original_width, original_height, _) in enumerate(frames):
+        single, _, _ = Dicom_to_array(dicom_file(pixels[index], name=f"frame{index}.dcm"), logger, uint=8, memory_budget=64 * 1024 * 1024)
+        assert image.dtype == np.uint8
+        assert (original_width, original_height) == (2060, 1030)
+        np.testing.assert_array_equal(image, single)
+
+
+@pytest.mark.parametrize("shape, bits, slope, intercept", [
+    ((1030, 2060), 8, None, None),
+    ((1040, 2100), 16, 2, -1000),
+    ((1025, 2049), 16, None, 500),
+])
+def test_banded_matches_full_image(dicom_file, logger, shape, bits, slope, intercept):
+    high = 256 if bits == 8 else 4096
+    pixels = np.random.default_rng(1).integers(0, high, shape).astype(np.uint8 if bits == 8 else np.uint16)
+    path = dicom_file(pixels, slope=slope, intercept=intercept)
+
+    # the pixel loop of Dicom_to_Image, resize_image then bilinear_resize_vectorized
+    reference, width, height = Dicom_to_array(path, logger, uint=bits)
+    assert reference is not None
+    for memory_budget in (100 * 1024, 1024 * 1024, 64 * 1024 * 1024):
+        banded, banded_width, banded_height = Dicom_to_array(path, logger, uint=bits, memory_budget=memory_budget)
+        assert (banded_width, banded_height) == (width, height)
+        np.testing.assert_array_equal(banded, reference)
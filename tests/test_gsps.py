@@ -0,0 +1,40 @@
+import io
+
+import numpy as np
+import pydicom
+
+from core.dicom.bbox_to_gsps import ANALYSIS_LAYER, CONFIDENCE_LAYER, create_gsps, create_multiframe_gsps
+
+
+def _write_read(gsps_dataset):
+    buffer = io.BytesIO()
+    pydicom.dcmwrite(buffer, gsps_dataset, write_like_original=False)
+    buffer.seek(0)
+    return pydicom.dcmread(buffer)
+
+
+def test_layered_gsps(dicom_file, logger):
+    path = dicom_file(np.zeros((16, 32), np.uint8))
+    gsps = _write_read(create_gsps(path, None, [[1, 2, 10, 5], [20, 3, 4, 4]], [0.9, 0.6], logger, separate_layers=True))
+
+    assert [layer.GraphicLayer for layer in gsps.GraphicLayerSequence] == [ANALYSIS_LAYER, CONFIDENCE_LAYER]
+    boxes = [annotation for annotation in gsps.GraphicAnnotationSequence if annotation.GraphicLayer == ANALYSIS_LAYER]
+    texts = [annotation for annotation in gsps.GraphicAnnotationSequence if annotation.GraphicLayer == CONFIDENCE_LAYER]
+    assert sum(len(annotation.GraphicObjectSequence) for annotation in boxes) == 2
+    assert all("TextObjectSequence" not in annotation for annotation in boxes)
+    assert sum(len(annotation.TextObjectSequence) for annotation in texts) == 2
+
+    without_confidence = create_gsps(path, None, [[1, 2, 10, 5]], [0.9], logger, show_confidence=False, separate_layers=True)
+    assert [layer.GraphicLayer for layer in without_confidence.GraphicLayerSequence] == [ANALYSIS_LAYER]
+
+
+def test_multiframe_gsps_references_frames(dicom_file, logger):
+    path = dicom_file(np.zeros((3, 16, 32), np.uint8))
+    header = pydicom.dcmread(path, stop_before_pixels=True)
+    gsps = _write_read(create_multiframe_gsps(path, [(1, [[1, 2, 3, 4]], [0.9]), (2, [], []), (3, [[5, 6, 7, 8]], [0.7])], logger, separate_layers=True))
+
+    frames = sorted({int(annotation.ReferencedImageSequence[0].ReferencedFrameNumber) for annotation in gsps.GraphicAnnotationSequence})
+    assert frames == [1, 3]
+    # the instance is referenced once, not once per frame
+    referenced = [image.ReferencedSOPInstanceUID for series in gsps.ReferencedSeriesSequence for image in series.ReferencedImageSequence]
+    assert referenced == [header.SOPInstanceUID]
@@ -0,0 +1,24 @@
+import configparser
+import json
+
+from core.usefull.logs import set_log_context, setup_logging, stop_logging
+
+
+def test_one_file_per_process(tmp_path):
+    config = configparser.ConfigParser()
+    config["LOG"] = {"directory": str(tmp_path), "level": "INFO"}
+    main_logger, main_listener = setup_logging(config, name="main")
+    service_logger, service_listener = setup_logging(config, name="service")
+
+    set_log_context(file="image.dcm", stage="predict")
+    main_logger.info("from main")
+    service_logger.info("from service")
+    main_logger.debug("not written")
+    stop_logging(main_listener)
+    stop_logging(service_listener)
+
+    main_records = [json.loads(line) for line in (tmp_path / "main.log").read_text().splitlines()]
+    service_records = [json.loads(line) for line in (tmp_path / "service.log").read_text().splitlines()]
+    assert [record["message"] for record in main_records] == ["from main"]
+    assert [record["message"] for record in service_records] == ["from service"]
+    assert (main_records[0]["file"], main_records[0]["stage"]) == ("image.dcm", "predict")
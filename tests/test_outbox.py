@@ -0,0 +1,50 @@
+import os
+import time
+
+import numpy as np
+import pydicom
+
+from core.benchmark.micro import start_loopback_scp
+from core.dicom.outbox import GspsOutbox
+
+
+def _wait(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def test_pending_while_pacs_down_then_sent(dicom_file, logger, tmp_path, free_port):
+    port = free_port()
+    outbox = GspsOutbox(str(tmp_path / "outbox"), "127.0.0.1", port, "TEST", "MICRO", logger, min_backoff=0.1, max_backoff=0.4, poll_interval=0.05)
+    dataset = pydicom.dcmread(dicom_file(np.zeros((16, 32), np.uint8)))
+    outbox.put(dataset, "image.dcm")
+    outbox.start()
+    try:
+        # the PACS is down: the file stays in the outbox and the retry delay grows up to max_backoff
+        assert _wait(lambda: outbox.failed_attempts >= 3)
+        assert outbox.backoff == 0.4
+        assert len(outbox.pending()) == 1
+
+        server = start_loopback_scp(port)
+        try:
+            assert _wait(lambda: outbox.sent == 1)
+            assert outbox.pending() == []
+            assert _wait(lambda: outbox.backoff == 0.0)
+        finally:
+            server.shutdown()
+    finally:
+        outbox.stop(timeout=1)
+
+
+def test_stop_keeps_pending_files(dicom_file, logger, tmp_path, free_port):
+    directory = str(tmp_path / "outbox")
+    outbox = GspsOutbox(directory, "127.0.0.1", free_port(), "TEST", "MICRO", logger, min_backoff=0.1, poll_interval=0.05)
+    outbox.put(pydicom.dcmread(dicom_file(np.zeros((16, 32), np.uint8))), "image.dcm")
+    open(os.path.join(directory, ".partial.dcm.part"), "w").close()
+    outbox.start()
+    outbox.stop(timeout=0.3)
+
+    # the interrupted write is removed, the GSPS waits for the next run
+    assert sorted(os.listdir(directory)) == ["image.dcm"]
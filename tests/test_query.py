@@ -0,0 +1,99 @@
+import socket
+import time
+
+import pytest
+from pydicom.dataset import Dataset
+from pynetdicom import AE, evt
+from pynetdicom.sop_class import StudyRootQueryRetrieveInformationModelFind
+
+from core.dicom.query import AnnotationIndex, find_annotated
+
+STUDY = "1.2.3.1"
+ANNOTATED = "1.2.3.1.1.1"
+NOT_ANNOTATED = "1.2.3.1.1.2"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def pacs():
+    """
+    Query/Retrieve SCP on localhost standing in for the PACS, with one of our GSPS in STUDY.
+    """
+    def on_find(event):
+        if STUDY not in event.identifier.StudyInstanceUID:
+            return
+        gsps = Dataset()
+        gsps.StudyInstanceUID = STUDY
+        gsps.SOPInstanceUID = "1.2.3.1.2.1"
+        image = Dataset()
+        image.ReferencedSOPInstanceUID = ANNOTATED
+        series = Dataset()
+        series.ReferencedImageSequence = [image]
+        gsps.ReferencedSeriesSequence = [series]
+        yield 0xFF00, gsps
+
+    ae = AE(ae_title="PACS")
+    ae.add_supported_context(StudyRootQueryRetrieveInformationModelFind)
+    port = _free_port()
+    server = ae.start_server(("127.0.0.1", port), block=False, evt_handlers=[(evt.EVT_C_FIND, on_find)])
+    yield port
+    server.shutdown()
+
+
+def _header(sop_instance_uid, study_instance_uid=STUDY):
+    header = Dataset()
+    header.StudyInstanceUID = study_instance_uid
+    header.SOPInstanceUID = sop_instance_uid
+    return header
+
+
+def test_find_annotated_references(pacs, logger, tmp_path):
+    results = find_annotated([STUDY, "1.2.3.2"], "127.0.0.1", pacs, "TEST", "PACS", logger, timeout=5)
+
+    assert results == {STUDY: {"instances": {ANNOTATED}, "unreferenced": 0}}
+    index = AnnotationIndex(str(tmp_path / "annotated.json"))
+    index.update([STUDY, "1.2.3.2"], results)
+    assert index.is_annotated(_header(ANNOTATED))
+    assert not index.is_annotated(_header(NOT_ANNOTATED))
+    assert not index.is_annotated(_header("1.2.3.2.1.1", "1.2.3.2"))
+
+
+def test_find_annotated_unreachable(logger):
+    start_time = time.perf_counter()
+    assert find_annotated([STUDY], "127.0.0.1", _free_port(), "TEST", "PACS", logger, timeout=2) is None
+    assert time.perf_counter() - start_time < 10
+
+
+def test_find_annotated_silent_pacs(logger):
+    # accepts the connection but never answers the association request
+    with socket.socket() as listener:
+        listener.bind(("127.0.0.1", 0))
+        listener.listen()
+        start_time = time.perf_counter()
+        assert find_annotated([STUDY], "127.0.0.1", listener.getsockname()[1], "TEST", "PACS", logger, timeout=1) is None
+        assert time.perf_counter() - start_time < 5
+
+
+def test_index_stale_and_ttl(tmp_path):
+    path = str(tmp_path / "annotated.json")
+    index = AnnotationIndex(path, ttl=60)
+    index.update([STUDY], {STUDY: {"instances": {ANNOTATED}, "unreferenced": 1}})
+    index.add("1.2.3.2", ["1.2.3.2.1.1"])
+    index.save()
+
+    assert set(index.stale([STUDY, "1.2.3.2", "1.2.3.3"])) == {"1.2.3.2", "1.2.3.3"}
+    # the GSPS returned without references do not skip the other images
+    assert not index.is_annotated(_header(NOT_ANNOTATED))
+    assert AnnotationIndex(path, ttl=60).is_annotated(_header("1.2.3.2.1.1", "1.2.3.2"))
+
+    # answers older than the TTL are queried again and dropped when the file is loaded
+    index.studies[STUDY]["checked"] -= 120
+    index.studies["1.2.3.2"]["added"] -= 120
+    index.save()
+    assert index.stale([STUDY]) == [STUDY]
+    assert AnnotationIndex(path, ttl=60).studies == {}
@@ -0,0 +1,196 @@
+import configparser
+import os
+import re
+import shutil
+
+import pytest
+
+import core.usefull.reload as reload
+from core.usefull.reload import HotReloader, ModelHolder
+from core.usefull.settings import Settings
+
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.ini")
+
+
+def _config():
+    config = configparser.ConfigParser()
+    config.read(CONFIG)
+    return config
+
+
+def test_baseline_config():
+    settings = Settings(_config())
+    assert settings.default.uint in (8, 16)
+    assert isinstance(settings.default.debug_mode, bool)
+    assert isinstance(settings.outbox.batch_size, int)
+    assert settings.model.quantize in (None, "int8", "bf16")
+
+
+def test_missing_sections_take_their_defaults():
+    config = _config()
+    for section in ("SERVICE", "RELOAD", "GSPS"):
+        config.remove_section(section)
+    settings = Settings(config)
+    assert settings.service.port == 8080
+    assert settings.service.allowed_directories == []
+    assert settings.reload.enabled is True
+    assert settings.gsps.mode == "layered"
+
+
+@pytest.mark.parametrize("section, key, value, message", [
+    ("DEFAULT", "debug_mode", "maybe", "[DEFAULT] debug_mode = maybe: expected True or False"),
+    ("DEFAULT", "model", "resnet", "[DEFAULT] model = resnet: expected one of yolo, detr, unet"),
+    ("DEFAULT", "min_confidence", "1.5", "[DEFAULT] min_confidence = 1.5: must be between 0 and 1"),
+    ("OUTBOX", "batch_size", "0", "[OUTBOX] batch_size = 0: must be positive"),
+    ("SERVICE", "port", "http", "[SERVICE] port = http"),
+    ("GSPS", "mode", "merged", "[GSPS] mode = merged"),
+    ("LOG", "level", "VERBOSE", "[LOG] level = VERBOSE: expected one of DEBUG, INFO, WARNING, ERROR, CRITICAL"),
+])
+def test_invalid_values(section, key, value, message):
+    config = _config()
+    config[section][key] = value
+    with pytest.raises(ValueError, match=re.escape(message)):
+        Settings(config)
+
+
+def test_missing_key():
+    config = _config()
+    config.remove_option("RELOAD", "interval")
+    with pytest.raises(ValueError, match=re.escape("[RELOAD] interval is missing")):
+        Settings(config)
+
+
+def test_backoff_order():
+    config = _config()
+    config["OUTBOX"]["min_backoff"] = "600"
+    with pytest.raises(ValueError, match="min_backoff"):
+        Settings(config)
+
+
+def test_changed_sections_and_model_key():
+    config = _config()
+    settings = Settings(config)
+    assert settings.changed_sections(Settings(_config())) == []
+
+    config["GSPS"]["aggregate_window"] = "42"
+    config["TRIAGE"]["min_rows"] = "10"
+    other = Settings(config)
+    assert other.changed_sections(settings) == ["GSPS", "TRIAGE"]
+    assert other.model_key() == settings.model_key()
+
+    config["MODEL"]["warmup"] = str(not settings.model.warmup)
+    assert Settings(config).model_key() != settings.model_key()
+
+
+class FakeModel:
+    def __init__(self, settings):
+        self.settings = settings
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """
+    A copy of config.ini and fake weights in a temporary working directory, create_model replaced by FakeModel.
+    """
+    shutil.copy(CONFIG, tmp_path / "config.ini")
+    settings = Settings.from_file(str(tmp_path / "config.ini"))
+    for path in reload.MODEL_WEIGHTS[settings.default.model]:
+        target = tmp_path / path
+        if path.endswith("/"):
+            target.mkdir(parents=True)
+            target = target / "weights.bin"
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(b"weights")
+    monkeypatch.chdir(tmp_path)
+    loaded = []
+    monkeypatch.setattr(reload, "create_model", lambda settings, logger: loaded.append(settings) or FakeModel(settings))
+    return tmp_path, settings, loaded
+
+
+def _edit(path, section, key, value):
+    config = configparser.ConfigParser()
+    config.read(path)
+    config[section][key] = value
+    with open(path, "w") as f:
+        config.write(f)
+
+
+def test_reload_swaps_settings_and_keeps_the_model(workspace, logger):
+    tmp_path, settings, loaded = workspace
+    model = FakeModel(settings)
+    holder = ModelHolder(settings, model)
+    swapped = []
+    reloader = HotReloader(holder, logger, config_path="config.ini", on_swap=swapped.append)
+    in_flight = holder.snapshot()
+
+    assert not reloader.check()
+    _edit("config.ini", "GSPS", "aggregate_window", "42")
+    # applied once the file is unchanged over two checks
+    assert not reloader.check()
+    assert reloader.check()
+
+    new_settings, new_model = holder.snapshot()
+    assert new_settings.gsps.aggregate_window == 42
+    assert new_model is model
+    assert loaded == []
+    assert swapped == [new_settings]
+    # a batch started before the swap keeps its snapshot
+    assert in_flight == (settings, model)
+
+
+def test_reload_new_model_on_model_settings(workspace, logger):
+    tmp_path, settings, loaded = workspace
+    holder = ModelHolder(settings, FakeModel(settings))
+    reloader = HotReloader(holder, logger, config_path="config.ini")
+
+    _edit("config.ini", "MODEL", "warmup", str(not settings.model.warmup))
+    reloader.check()
+    assert reloader.check()
+    new_settings, new_model = holder.snapshot()
+    assert loaded == [new_settings]
+    assert new_model.settings is new_settings
+    assert reloader.swaps == 1
+
+
+def test_reload_new_model_on_weights(workspace, logger):
+    tmp_path, settings, loaded = workspace
+    holder = ModelHolder(settings, FakeModel(settings))
+    reloader = HotReloader(holder, logger, config_path="config.ini")
+
+    weights = reload.MODEL_WEIGHTS[settings.default.model][0]
+    target = tmp_path / weights / "weights.bin" if weights.endswith("/") else tmp_path / weights
+    target.write_bytes(b"new weights")
+    reloader.check()
+    assert reloader.check()
+    assert len(loaded) == 1
+    assert holder.snapshot()[0].changed_sections(settings) == []
+
+
+def test_invalid_reload_keeps_the_current_settings(workspace, logger):
+    tmp_path, settings, loaded = workspace
+    model = FakeModel(settings)
+    holder = ModelHolder(settings, model)
+    reloader = HotReloader(holder, logger, config_path="config.ini")
+
+    _edit("config.ini", "OUTBOX", "batch_size", "none")
+    reloader.check()
+    assert not reloader.check()
+    assert holder.snapshot() == (settings, model)
+    assert loaded == []
+
+
+def test_failed_model_load_keeps_the_current_model(workspace, logger, monkeypatch):
+    tmp_path, settings, loaded = workspace
+    model = FakeModel(settings)
+    holder = ModelHolder(settings, model)
+    reloader = HotReloader(holder, logger, config_path="config.ini")
+
+    def fail(settings, logger):
+        raise RuntimeError("corrupted weights")
+    monkeypatch.setattr(reload, "create_model", fail)
+    _edit("config.ini", "MODEL", "warmup", str(not settings.model.warmup))
+    reloader.check()
+    assert not reloader.check()
+    assert holder.snapshot() == (settings, model)
@@ -0,0 +1,103 @@
+import configparser
+import re
+
+import pydicom
+import pytest
+
+from core.benchmark.micro import make_dicom
+from core.dicom.triage import TriageRules, reject_file, triage_dicom
+from core.usefull.settings import Settings
+
+
+def _write(tmp_path, name="image.dcm", rows=64, cols=128, **changes):
+    path = make_dicom(str(tmp_path / name), rows, cols, 8)
+    dataset = pydicom.dcmread(path)
+    for keyword, value in changes.items():
+        if value is None:
+            delattr(dataset, keyword)
+        else:
+            setattr(dataset, keyword, value)
+    dataset.save_as(path)
+    return path
+
+
+def test_accepted(tmp_path):
+    header, reason = triage_dicom(_write(tmp_path), TriageRules(required_tags=["Modality"]))
+    assert reason is None
+    assert header.Rows == 64
+
+
+@pytest.mark.parametrize("rules, changes, expected", [
+    (TriageRules(sop_classes=["1.2.840.10008.5.1.4.1.1.1"]), {}, "sop_class"),
+    (TriageRules(excluded_modalities=["PX"]), {}, "modality"),
+    (TriageRules(modalities=["DX"]), {}, "modality"),
+    (TriageRules(), {"SOPInstanceUID": ""}, "missing_SOPInstanceUID"),
+    (TriageRules(required_tags=["BodyPartExamined"]), {}, "missing_BodyPartExamined"),
+    (TriageRules(), {"PatientAge": None}, "missing_PatientAge"),
+    (TriageRules(min_rows=65), {}, "size"),
+    (TriageRules(min_cols=129), {}, "size"),
+])
+def test_rejection_reasons(tmp_path, rules, changes, expected):
+    _, reason = triage_dicom(_write(tmp_path, **changes), rules)
+    assert reason == expected
+
+
+def test_unreadable(tmp_path):
+    path = tmp_path / "broken.dcm"
+    path.write_bytes(b"not a dicom file")
+    header, reason = triage_dicom(str(path), TriageRules())
+    assert header is None
+    assert reason == "unreadable"
+
+
+def test_quarantine_names_are_not_reused(tmp_path, logger):
+    rules = TriageRules(action="quarantine", quarantine_directory=str(tmp_path / "quarantine"))
+    for content in (b"first", b"second", b"third"):
+        path = tmp_path / "image.dcm"
+        path.write_bytes(content)
+        reject_file(str(path), "size", rules, logger)
+        assert not path.exists()
+
+    quarantine = tmp_path / "quarantine"
+    assert sorted(p.name for p in quarantine.iterdir()) == ["image.dcm", "image_1.dcm", "image_2.dcm"]
+    assert (quarantine / "image.dcm").read_bytes() == b"first"
+    assert (quarantine / "image_2.dcm").read_bytes() == b"third"
+
+
+def test_skip_deletes(tmp_path, logger):
+    path = tmp_path / "image.dcm"
+    path.write_bytes(b"content")
+    reject_file(str(path), "modality", TriageRules(action="skip", quarantine_directory=str(tmp_path / "quarantine")), logger)
+    assert not path.exists()
+    assert not (tmp_path / "quarantine").exists()
+
+
+def test_rules_from_settings():
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+    config["TRIAGE"]["modalities"] = "PX, DX"
+    rules = Settings(config).triage
+    assert rules.modalities == {"PX", "DX"}
+    assert rules.min_rows == 1024
+    assert rules.action == "quarantine"
+    assert rules.required_tags[:4] == ["SOPClassUID", "SOPInstanceUID", "StudyInstanceUID", "SeriesInstanceUID"]
+
+    # an older config.ini without the section accepts everything
+    config.remove_section("TRIAGE")
+    rules = Settings(config).triage
+    assert rules.excluded_modalities == set()
+    assert (rules.min_rows, rules.min_cols, rules.action) == (0, 0, "skip")
+
+
+@pytest.mark.parametrize("key, value, message", [
+    ("min_rows", "-1", "[TRIAGE] min_rows = -1"),
+    ("action", "delete", "[TRIAGE] action = delete"),
+    ("required_tags", "Rows, PatientNmae", "unknown DICOM keyword PatientNmae"),
+    ("sop_classes", "1.2.840.abc", "invalid UID 1.2.840.abc"),
+])
+def test_invalid_triage_values(key, value, message):
+    config = configparser.ConfigParser()
+    config.read("config.ini")
+    config["TRIAGE"][key] = value
+    with pytest.raises(ValueError, match=re.escape(message)):
+        Settings(config)